@@ -0,0 +1,120 @@
+"""
+Non-blocking logging and a sampled, PHI-redacted access log.
+
+`configure_logging` routes every log record through a `QueueHandler`, so request handlers
+only enqueue records; a `QueueListener` thread formats and writes them. The access log emits
+one compact line per request (method, route, status, duration, trace id). Lines are sampled,
+but errors and slow requests are always kept. Request bodies are only logged when explicitly
+enabled, as compact JSON with PHI fields such as `PatientName` redacted.
+
+Configuration (environment variables):
+    LOG_LEVEL                 root log level (default: INFO; DEBUG adds full predictions/recommendations)
+    ACCESS_LOG_SAMPLE_RATE    fraction of successful requests logged, 0.0-1.0 (default: 1.0)
+    ACCESS_LOG_SLOW_MS        requests slower than this are always logged (default: 5000)
+    ACCESS_LOG_BODIES         "1" to log redacted request bodies (default: off)
+    ACCESS_LOG_REDACT         comma-separated fields to redact (default: PatientName)
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Iterable, Optional
+
+REDACTED = "[redacted]"
+DEFAULT_REDACT_FIELDS = ("PatientName",)
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_ref_salt = os.urandom(8)
+
+
+def configure_logging(level: str = "INFO", fmt: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """Sends all records through a queue to a background writer thread; returns the started listener."""
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def patient_ref(name: Optional[str]) -> str:
+    """Short pseudonym for a patient name, stable for the life of the process, for log correlation."""
+    if not name:
+        return "patient:anonymous"
+    return "patient:" + hashlib.sha256(_ref_salt + name.encode("utf-8")).hexdigest()[:8]
+
+
+def redact(value, fields: Iterable[str] = DEFAULT_REDACT_FIELDS):
+    """Returns a copy of `value` with every dict key in `fields` replaced by "[redacted]"."""
+    fields = frozenset(fields)
+
+    def walk(item):
+        if isinstance(item, dict):
+            return {key: REDACTED if key in fields else walk(child) for key, child in item.items()}
+        if isinstance(item, list):
+            return [walk(child) for child in item]
+        return item
+
+    return walk(value)
+
+
+class AccessLog:
+    def __init__(self, logger: Optional[logging.Logger] = None, sample_rate: float = 1.0,
+                 slow_ms: float = 5000.0, log_bodies: bool = False,
+                 redact_fields: Iterable[str] = DEFAULT_REDACT_FIELDS, max_body_chars: int = 2048):
+        self.logger = logger or logging.getLogger("access")
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.log_bodies = log_bodies
+        self.redact_fields = frozenset(redact_fields)
+        self.max_body_chars = max_body_chars
+
+    @classmethod
+    def from_env(cls) -> "AccessLog":
+        fields = os.getenv("ACCESS_LOG_REDACT")
+        return cls(
+            sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", 1.0)),
+            slow_ms=float(os.getenv("ACCESS_LOG_SLOW_MS", 5000)),
+            log_bodies=os.getenv("ACCESS_LOG_BODIES", "0") == "1",
+            redact_fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else DEFAULT_REDACT_FIELDS,
+        )
+
+    def should_log(self, status: int, duration_ms: float) -> bool:
+        if status >= 400 or duration_ms >= self.slow_ms:
+            return True
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def format_body(self, body: bytes) -> str:
+        try:
+            text = json.dumps(redact(json.loads(body), self.redact_fields), separators=(",", ":"), default=str)
+        except ValueError:
+            text = f"<{len(body)} bytes, not JSON>"
+        if len(text) > self.max_body_chars:
+            text = text[:self.max_body_chars] + "...(truncated)"
+        return text
+
+    def format_line(self, method: str, path: str, status: int, duration_ms: float,
+                    trace_id: Optional[str] = None, body: Optional[bytes] = None) -> str:
+        line = f"{method} {path} {status} {duration_ms:.1f}ms"
+        if trace_id:
+            line += f" trace={trace_id}"
+        if body:
+            line += f" body={self.format_body(body)}"
+        return line
+
+    def record(self, method: str, path: str, status: int, duration_ms: float,
+               trace_id: Optional[str] = None, body: Optional[bytes] = None) -> None:
+        if self.should_log(status, duration_ms):
+            level = logging.WARNING if status >= 500 else logging.INFO
+            if self.logger.isEnabledFor(level):
+                self.logger.log(level, self.format_line(method, path, status, duration_ms, trace_id, body))
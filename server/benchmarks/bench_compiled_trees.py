@@ -0,0 +1,70 @@
+"""
+Microbenchmark of tree-model inference: the original sklearn/LightGBM `predict_proba` versus
+the compiled NumPy arrays from `compiled_trees.py`. Both outputs are compared before timing,
+so a mismatch fails loudly.
+
+Loads `lightgbm_model.pkl` and, when present, `tuned_rf_model.pkl`; no OpenAI key or FAISS
+index is needed. Run from the `server` directory:
+
+    python benchmarks/bench_compiled_trees.py --iterations 2000 --batch 1000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+from compiled_trees import compile_model, probe_rows, verify  # noqa: E402
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+ARTIFACTS = ["lightgbm_model.pkl", "tuned_rf_model.pkl"]
+
+
+def time_per_call(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def run(iterations: int, batch: int):
+    print(f"{'model':<20} {'path':<9} {'rows':>6} {'p50 us':>10} {'p95 us':>10}")
+    for path in ARTIFACTS:
+        if not os.path.exists(path):
+            print(f"{path}: not found, skipped")
+            continue
+        model = joblib.load(path)
+        start = time.perf_counter()
+        compiled = compile_model(model)
+        compile_ms = (time.perf_counter() - start) * 1e3
+        rows = probe_rows(compiled, n_rows=max(batch, 256))
+        verify(compiled, model, rows)
+
+        details = compiled.describe()
+        print(f"{path}: compiled in {compile_ms:.1f} ms, {details['trees']} trees, {details['nodes']} nodes, "
+              f"depth {details['max_depth']}, {details['bytes'] / 1024:.0f} KiB")
+        for n_rows, repeat in ((1, iterations), (batch, max(1, iterations // 100))):
+            X = rows[:n_rows]
+            for name, fn in (
+                ("original", lambda: model.predict_proba(X)),
+                ("compiled", lambda: compiled.predict_proba(X)),
+            ):
+                p50, p95 = time_per_call(fn, repeat)
+                print(f"{os.path.splitext(path)[0]:<20} {name:<9} {n_rows:>6} {p50:>10.1f} {p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.iterations, args.batch)
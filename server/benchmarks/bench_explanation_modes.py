@@ -0,0 +1,48 @@
+"""
+Latency comparison of `predict_diabetes_risk` across explanation modes.
+
+Run from the `server` directory (model, scaler and FAISS artifacts are loaded
+relative to the working directory):
+
+    python benchmarks/bench_explanation_modes.py --iterations 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import main  # noqa: E402
+
+SAMPLE_PATIENTS = [
+    # ≤4 provided features -> LightGBM
+    {"Glucose": 148.0, "BMI": 33.6, "Age": 50.0, "BloodPressure": 72.0, "Gender": np.nan, "Ethnicity": np.nan},
+    # all features -> Tuned Random Forest
+    {"Glucose": 89.0, "BMI": 28.1, "Age": 21.0, "BloodPressure": 66.0, "Gender": 0.0, "Ethnicity": 3.0},
+]
+
+
+def run(iterations: int):
+    print(f"{'mode':<8} {'model':<22} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for patient in SAMPLE_PATIENTS:
+        for mode in main.EXPLANATION_MODES:
+            main.predict_diabetes_risk(dict(patient), explanation=mode)  # warm-up
+            samples = []
+            model_used = ""
+            for _ in range(iterations):
+                start = time.perf_counter()
+                result = main.predict_diabetes_risk(dict(patient), explanation=mode)
+                samples.append((time.perf_counter() - start) * 1000)
+                model_used = result["modelUsed"]
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            print(f"{mode:<8} {model_used:<22} {statistics.median(samples):>9.2f} {p95:>9.2f} {statistics.mean(samples):>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=30)
+    run(parser.parse_args().iterations)
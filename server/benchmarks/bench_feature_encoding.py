@@ -0,0 +1,93 @@
+"""
+Microbenchmark of single-row feature preparation: the previous pandas path versus
+`FeatureEncoder`. Both outputs are compared before timing, so a mismatch fails loudly.
+
+Loads `scaler.pkl` and, when present, the trained feature order from `tuned_rf_model.pkl`
+(the same order `main.py` uses); no OpenAI key or FAISS index is needed. Run from the `server` directory:
+
+    python benchmarks/bench_feature_encoding.py --iterations 20000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from features import FeatureEncoder  # noqa: E402
+
+ALL_FEATURES = ['Glucose', 'BMI', 'Age', 'Ethnicity', 'BloodPressure', 'Gender']
+NUMERICAL_FEATURES = ['Glucose', 'BMI', 'Age', 'BloodPressure']
+DEFAULT_MODES = {'Ethnicity': 3, 'Gender': 1}
+
+SAMPLE_PATIENTS = [
+    {"Glucose": 148.0, "BMI": 33.6, "Age": 50.0, "BloodPressure": 72.0, "Gender": 1.0, "Ethnicity": 2.0},
+    {"Glucose": 89.0, "BMI": 28.1, "Age": 21.0, "BloodPressure": np.nan, "Gender": 0.0, "Ethnicity": 3.0},
+]
+
+
+def pandas_path(patient, feature_order, scaler, apply_scaling):
+    """The pre-encoder preparation from `predict_diabetes_risk`."""
+    patient_df = pd.DataFrame([patient])
+    if "Glucose_BMI_Ratio" in feature_order:
+        patient_df["Glucose_BMI_Ratio"] = patient_df["Glucose"] / (patient_df["BMI"] + 1e-6)
+    patient_df = patient_df.reindex(columns=feature_order, fill_value=0.0)
+    provided = patient_df.notna().sum(axis=1).iloc[0]
+    scaled = [feat for feat in feature_order if feat in NUMERICAL_FEATURES]
+    if apply_scaling:
+        patient_df[scaled] = scaler.transform(patient_df[scaled])
+    patient_df["Gender"] = patient_df["Gender"].astype(int)
+    patient_df["Ethnicity"] = patient_df["Ethnicity"].astype(int)
+    patient_df = patient_df.reindex(columns=feature_order, fill_value=0.0)
+    return patient_df, provided
+
+
+def encoder_path(patient, encoder, apply_scaling):
+    row, provided = encoder.encode(patient)
+    if apply_scaling:
+        encoder.scale(row)
+    return row, provided
+
+
+def time_per_call(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def run(iterations: int):
+    scaler = joblib.load("scaler.pkl")
+    feature_order = ALL_FEATURES
+    if os.path.exists("tuned_rf_model.pkl"):
+        feature_order = list(getattr(joblib.load("tuned_rf_model.pkl"), "feature_names_in_", ALL_FEATURES))
+    encoder = FeatureEncoder(feature_order, NUMERICAL_FEATURES, DEFAULT_MODES, scaler)
+
+    print(f"{'path':<8} {'scaled':<7} {'p50 us':>9} {'p95 us':>9}")
+    for apply_scaling in (False, True):
+        for patient in SAMPLE_PATIENTS:
+            expected, expected_provided = pandas_path(patient, feature_order, scaler, apply_scaling)
+            row, provided = encoder_path(patient, encoder, apply_scaling)
+            np.testing.assert_allclose(row, expected.to_numpy(dtype=np.float64), rtol=0, atol=1e-12)
+            assert provided == expected_provided, (provided, expected_provided)
+
+        patient = SAMPLE_PATIENTS[0]
+        for name, fn in (
+            ("pandas", lambda: pandas_path(patient, feature_order, scaler, apply_scaling)),
+            ("encoder", lambda: encoder_path(patient, encoder, apply_scaling)),
+        ):
+            p50, p95 = time_per_call(fn, iterations)
+            print(f"{name:<8} {str(apply_scaling):<7} {p50:>9.1f} {p95:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=5000)
+    run(parser.parse_args().iterations)
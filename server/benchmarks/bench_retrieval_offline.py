@@ -0,0 +1,54 @@
+"""
+Offline benchmark of the FAISS guideline retrieval path.
+
+Uses the deterministic local embedding stub, so no network or OpenAI key is needed.
+It reports cold (embedding + search) and warm (cached embedding + search) latency for
+each category index. Run from the `server` directory:
+
+    python benchmarks/bench_retrieval_offline.py --iterations 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.vectorstores import FAISS  # noqa: E402
+from embedding_cache import CachedEmbeddings, DeterministicEmbeddings  # noqa: E402
+
+CATEGORIES = ["Endocrinology", "Dietitian", "Exercise"]
+QUERIES = [f"diabetes treatment guidelines {status}" for status in ("diabetes", "no diabetes")]
+
+
+def run(iterations: int):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        inner = DeterministicEmbeddings()
+        embeddings = CachedEmbeddings(inner, cache_dir=cache_dir, model_name=inner.model)
+        print(f"{'category':<14} {'cold ms':>9} {'warm p50 ms':>12} {'warm p95 ms':>12}")
+        for category in CATEGORIES:
+            store = FAISS.load_local(f"faiss_{category.lower()}", embeddings, allow_dangerous_deserialization=True)
+
+            start = time.perf_counter()
+            for query in QUERIES:
+                store.similarity_search(f"{category} {query}", k=3)
+            cold = (time.perf_counter() - start) * 1000 / len(QUERIES)
+
+            samples = []
+            for i in range(iterations):
+                query = f"{category} {QUERIES[i % len(QUERIES)]}"
+                start = time.perf_counter()
+                store.similarity_search(query, k=3)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            print(f"{category:<14} {cold:>9.3f} {statistics.median(samples):>12.3f} {p95:>12.3f}")
+        print(f"embedding cache: {embeddings.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100)
+    run(parser.parse_args().iterations)
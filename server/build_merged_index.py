@@ -0,0 +1,26 @@
+# build_merged_index.py
+# Merges the per-category FAISS indexes into one index with a "category" tag on each
+# document, so guideline retrieval needs one embedding and one k-NN search per query.
+# Only stored vectors are copied, so no embedding calls (or OpenAI key) are needed.
+import os
+
+from langchain.vectorstores import FAISS
+
+from embedding_cache import DeterministicEmbeddings
+from retrieval import merge_category_stores
+
+CATEGORIES = ["Endocrinology", "Dietitian", "Exercise"]
+OUTPUT_PATH = "faiss_guidelines"
+
+embeddings = DeterministicEmbeddings()
+
+stores = {}
+for category in CATEGORIES:
+    index_path = f"faiss_{category.lower()}"
+    stores[category] = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    print(f"Loaded {stores[category].index.ntotal} vector(s) for {category} from {index_path}")
+
+merged = merge_category_stores(stores)
+merged.save_local(OUTPUT_PATH)
+
+print(f"Merged index with {merged.index.ntotal} vector(s) saved to {os.path.abspath(OUTPUT_PATH)}")
@@ -0,0 +1,445 @@
+"""
+Tree ensembles compiled to packed NumPy arrays for low-overhead inference.
+
+sklearn's `RandomForestClassifier.predict_proba` and LightGBM's predictor spend far more time
+in input validation, joblib dispatch and per-call setup than in the trees themselves when
+they score one row. `compile_model` flattens every tree of either model into one set of node
+arrays (feature, threshold, left/right child, missing-value handling, leaf value) and
+`CompiledForest` walks all trees for a batch of rows at once, one depth level per step.
+
+Probabilities match the original models bit for bit:
+  * sklearn trees compare the input cast to float32 against float64 thresholds, route NaN
+    with `missing_go_to_left`, and each tree's leaf class counts are normalised like
+    `DecisionTreeClassifier.predict_proba` before the forest averages them in tree order
+  * LightGBM inputs within kZeroThreshold of zero become zero, and nodes follow
+    `missing_type` (None/Zero/NaN) and `default_left` like the C++ `NumericalDecision`; raw scores are summed in tree order and passed through the
+    objective's sigmoid. Categorical splits and linear trees are not supported.
+`verify` checks this against the original model; `main.py` falls back to the original
+model for any entry whose compiled form does not match.
+
+Export step (run from the `server` directory; writes `<artifact>.npz` next to each pickle,
+which `main.py` loads instead of recompiling while the pickle is unchanged):
+
+    python compiled_trees.py lightgbm_model.pkl tuned_rf_model.pkl
+
+Configuration (environment variables):
+    COMPILED_TREES   "0" to serve the original sklearn/LightGBM models (default: 1)
+"""
+import argparse
+import json
+import logging
+import math
+import os
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Node missing-value handling, as LightGBM's MissingType; sklearn nodes are all MISSING_NAN
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+# LightGBM's kZeroThreshold (a float32 1e-35): its predictor reads smaller inputs as exactly zero
+ZERO_THRESHOLD = float(np.float32(1e-35))
+
+FORMAT_VERSION = 1
+
+
+class CompiledForest:
+    """
+    All trees of one model as flat node arrays. Leaves point to themselves, so rows that
+    reach a leaf early simply stay there while deeper trees finish.
+
+    `kind` is "mean" (sklearn forests: average of per-tree class probabilities) or
+    "sigmoid" (LightGBM binary: sigmoid of the summed raw scores).
+    """
+
+    def __init__(self, kind: str, roots, feature, threshold, left, right, missing_type, default_left,
+                 value, classes, n_features: int, feature_names: Optional[Sequence[str]] = None,
+                 max_depth: Optional[int] = None,
+                 input_dtype: str = "float64", sigmoid: float = 1.0, average_output: bool = False,
+                 allow_nan: bool = True, version: Optional[str] = None):
+        if kind not in ("mean", "sigmoid"):
+            raise ValueError(f"Unknown compiled model kind '{kind}'")
+        self.kind = kind
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.missing_type = np.ascontiguousarray(missing_type, dtype=np.uint8)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.n_features = int(n_features)
+        self.input_dtype = np.dtype(input_dtype)
+        self.sigmoid = float(sigmoid)
+        self.average_output = bool(average_output)
+        self.allow_nan = bool(allow_nan)
+        self.version = version
+
+        is_leaf = self.left == np.arange(len(self.left))
+        self._is_leaf = is_leaf
+        self.max_depth = int(max_depth) if max_depth is not None else self._depth()
+
+        # Traversal tables: children of node i at 2i (left) and 2i + 1 (right), and the
+        # direction NaN or zero inputs take at each node, which never depends on the row
+        self._feature = self.feature.astype(np.intp)
+        self._children = np.stack((self.left, self.right), axis=1).ravel().astype(np.intp)
+        zero_default = self.missing_type == MISSING_ZERO
+        compare_zero_right = ~(0.0 <= self.threshold)
+        default_right = ~self.default_left
+        # LightGBM reads NaN as zero unless the node routes NaN itself
+        self._nan_right = np.where((self.missing_type == MISSING_NAN) | zero_default, default_right, compare_zero_right)
+        self._zero_right = np.where(zero_default, default_right, compare_zero_right)
+        self._zero_missing = bool(zero_default[~is_leaf].any())
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in (
+            "roots", "feature", "threshold", "left", "right", "missing_type", "default_left", "value"))
+
+    def _depth(self) -> int:
+        depth, frontier = 0, self.roots
+        while True:
+            frontier = frontier[~self._is_leaf[frontier]]
+            if not len(frontier):
+                return depth
+            frontier = np.concatenate((self.left[frontier], self.right[frontier]))
+            depth += 1
+
+    def _input(self, X) -> np.ndarray:
+        # Columns are positional, in training order, as everywhere else in the server
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[-1]} features, but the model expects {self.n_features}")
+        if self.input_dtype != np.float64:
+            # sklearn trees see float32 inputs; comparing the widened value keeps its split decisions
+            with np.errstate(over="ignore"):
+                X = X.astype(self.input_dtype).astype(np.float64)
+            if np.isinf(X).any():
+                raise ValueError(f"Input X contains infinity or a value too large for dtype('{self.input_dtype}').")
+        if self.kind == "sigmoid":
+            X = np.where(np.abs(X) <= ZERO_THRESHOLD, 0.0, X)
+        return np.ascontiguousarray(X)
+
+    def apply(self, X) -> np.ndarray:
+        """Leaf node index reached in every tree, shape (n_trees, n_rows)."""
+        X = self._input(X)
+        n_rows = X.shape[0]
+        has_nan = bool(np.isnan(X).any())
+        if has_nan and not self.allow_nan:
+            raise ValueError("Input X contains NaN.")
+
+        flat = X.ravel()
+        offsets = np.arange(n_rows, dtype=np.intp) * X.shape[1]
+        node = np.repeat(self.roots.astype(np.intp)[:, None], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            x = flat[offsets + self._feature[node]]
+            go_right = x > self.threshold[node]
+            if has_nan:
+                go_right = np.where(np.isnan(x), self._nan_right[node], go_right)
+            if self._zero_missing:
+                go_right = np.where(x == 0.0, self._zero_right[node], go_right)
+            node = self._children[2 * node + go_right]
+        return node
+
+    def raw_score(self, X) -> np.ndarray:
+        """Summed leaf values, shape (n_rows, n_outputs); summed over trees in tree order."""
+        # Reducing over the leading axis adds tree by tree, the order both libraries use
+        return np.add.reduce(self.value[self.apply(X)], axis=0)
+
+    def predict_proba(self, X) -> np.ndarray:
+        raw = self.raw_score(X)
+        if self.kind == "mean":
+            return raw / self.n_trees
+        score = raw[:, 0]
+        if self.average_output:
+            score = score / self.n_trees
+        # libm's exp, like LightGBM: NumPy's vectorised exp can differ in the last bit
+        exp = np.fromiter(map(math.exp, -self.sigmoid * score), dtype=np.float64, count=len(score))
+        positive = 1.0 / (1.0 + exp)
+        return np.column_stack((1.0 - positive, positive))
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def describe(self) -> dict:
+        return {
+            "kind": self.kind,
+            "trees": self.n_trees,
+            "nodes": self.n_nodes,
+            "max_depth": self.max_depth,
+            "bytes": self.nbytes,
+        }
+
+    def save(self, path: str) -> None:
+        meta = {
+            "format": FORMAT_VERSION,
+            "kind": self.kind,
+            "n_features": self.n_features,
+            "feature_names": self.feature_names,
+            "max_depth": self.max_depth,
+            "input_dtype": self.input_dtype.name,
+            "sigmoid": self.sigmoid,
+            "average_output": self.average_output,
+            "allow_nan": self.allow_nan,
+            "version": self.version,
+        }
+        with open(path, "wb") as handle:
+            np.savez(
+                handle, meta=np.array(json.dumps(meta)), classes=self.classes_, roots=self.roots,
+                feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                missing_type=self.missing_type, default_left=self.default_left, value=self.value,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported compiled model format {meta.get('format')} in {path}")
+            arrays = {name: data[name] for name in (
+                "roots", "feature", "threshold", "left", "right", "missing_type", "default_left", "value")}
+            classes = data["classes"]
+        return cls(
+            meta["kind"], classes=classes, n_features=meta["n_features"], feature_names=meta["feature_names"],
+            max_depth=meta["max_depth"],
+            input_dtype=meta["input_dtype"], sigmoid=meta["sigmoid"], average_output=meta["average_output"],
+            allow_nan=meta["allow_nan"], version=meta["version"], **arrays,
+        )
+
+
+def final_estimator(model):
+    """
+    The tree ensemble inside `model`. Pipelines are only unwrapped when every earlier step is
+    a sampler (skipped at prediction time, like imblearn's SMOTE), so predictions are unchanged.
+    """
+    steps = getattr(model, "steps", None)
+    if steps is None:
+        return model
+    for name, step in steps[:-1]:
+        if step not in (None, "passthrough") and not hasattr(step, "fit_resample"):
+            raise ValueError(f"Pipeline step '{name}' transforms the input; only the final estimator can be compiled")
+    return steps[-1][1]
+
+
+def _pack(trees: List[dict], n_outputs: int) -> dict:
+    """Concatenates per-tree node arrays, shifting child indices; leaves point to themselves."""
+    offsets = np.cumsum([0] + [len(tree["feature"]) for tree in trees])
+    packed = {name: np.concatenate([tree[name] for tree in trees]) for name in (
+        "feature", "threshold", "missing_type", "default_left")}
+    packed["value"] = np.concatenate([tree["value"].reshape(-1, n_outputs) for tree in trees])
+    for side in ("left", "right"):
+        children = []
+        for offset, tree in zip(offsets, trees):
+            child = np.asarray(tree[side], dtype=np.int64)
+            own = np.arange(len(child))
+            children.append(np.where(child < 0, own, child) + offset)
+        packed[side] = np.concatenate(children)
+    packed["roots"] = offsets[:-1]
+    return packed
+
+
+def compile_sklearn_forest(model, version: Optional[str] = None) -> CompiledForest:
+    forest = final_estimator(model)
+    if type(forest).__name__ not in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        raise ValueError(f"Cannot compile {type(forest).__name__}; expected a random forest classifier")
+    if getattr(forest, "n_outputs_", 1) != 1:
+        raise ValueError("Multi-output forests are not supported")
+
+    n_classes = len(forest.classes_)
+    trees, allow_nan = [], True
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        # `DecisionTreeClassifier.predict_proba`: leaf class weights divided by their sum
+        proba = np.array(tree.value[:, 0, :n_classes], dtype=np.float64)
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        proba /= normalizer
+        # Trees from sklearn < 1.3 have no missing-value routing and reject NaN inputs
+        missing_left = getattr(tree, "missing_go_to_left", None)
+        if missing_left is None:
+            allow_nan = False
+            missing_left = np.zeros(tree.node_count, dtype=bool)
+        trees.append({
+            "feature": np.where(is_leaf, 0, tree.feature),
+            "threshold": np.where(is_leaf, 0.0, tree.threshold),
+            "left": tree.children_left,
+            "right": tree.children_right,
+            "missing_type": np.full(tree.node_count, MISSING_NAN, dtype=np.uint8),
+            "default_left": np.asarray(missing_left, dtype=bool),
+            "value": proba,
+        })
+
+    feature_names = getattr(model, "feature_names_in_", getattr(forest, "feature_names_in_", None))
+    return CompiledForest(
+        "mean", classes=forest.classes_, n_features=forest.n_features_in_, input_dtype="float32",
+        allow_nan=allow_nan, version=version,
+        feature_names=list(feature_names) if feature_names is not None else None,
+        max_depth=max(estimator.tree_.max_depth for estimator in forest.estimators_),
+        **_pack(trees, n_classes),
+    )
+
+
+def _lightgbm_tree(structure: dict) -> dict:
+    """Node arrays of one `dump_model()` tree, in depth-first order from its root."""
+    nodes = {name: [] for name in ("feature", "threshold", "left", "right", "missing_type", "default_left", "value")}
+    missing_types = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+    def add(node: dict) -> int:
+        index = len(nodes["feature"])
+        for values in nodes.values():
+            values.append(None)
+        if "split_index" not in node:
+            if "leaf_coeff" in node:
+                raise ValueError("Linear trees are not supported")
+            nodes["feature"][index], nodes["threshold"][index] = 0, 0.0
+            nodes["left"][index] = nodes["right"][index] = -1
+            nodes["missing_type"][index], nodes["default_left"][index] = MISSING_NAN, False
+            nodes["value"][index] = node["leaf_value"]
+            return index
+        if node["decision_type"] != "<=":
+            raise ValueError(f"Categorical split ('{node['decision_type']}') is not supported")
+        nodes["feature"][index] = node["split_feature"]
+        # The dump writes infinite thresholds (e.g. for splits that isolate NaN) as +-1e300
+        threshold = node["threshold"]
+        nodes["threshold"][index] = math.copysign(math.inf, threshold) if abs(threshold) >= 1e300 else threshold
+        nodes["missing_type"][index] = missing_types[node["missing_type"]]
+        nodes["default_left"][index] = bool(node["default_left"])
+        nodes["value"][index] = 0.0
+        nodes["left"][index] = add(node["left_child"])
+        nodes["right"][index] = add(node["right_child"])
+        return index
+
+    add(structure)
+    return {
+        "feature": np.asarray(nodes["feature"], dtype=np.int32),
+        "threshold": np.asarray(nodes["threshold"], dtype=np.float64),
+        "left": np.asarray(nodes["left"], dtype=np.int64),
+        "right": np.asarray(nodes["right"], dtype=np.int64),
+        "missing_type": np.asarray(nodes["missing_type"], dtype=np.uint8),
+        "default_left": np.asarray(nodes["default_left"], dtype=bool),
+        "value": np.asarray(nodes["value"], dtype=np.float64),
+    }
+
+
+def compile_lightgbm(model, version: Optional[str] = None) -> CompiledForest:
+    booster = getattr(model, "booster_", model)
+    # `dump_model()` defaults to the best iteration, like `predict`
+    dump = booster.dump_model()
+    objective = dump.get("objective", "").split()
+    if not objective or objective[0] != "binary" or dump.get("num_tree_per_iteration", 1) != 1:
+        raise ValueError(f"Cannot compile LightGBM objective '{dump.get('objective')}'; expected binary")
+    sigmoid = next((float(part.split(":", 1)[1]) for part in objective[1:] if part.startswith("sigmoid:")), 1.0)
+
+    trees = [_lightgbm_tree(info["tree_structure"]) for info in dump["tree_info"]]
+    if not trees:
+        raise ValueError("LightGBM model has no trees")
+    return CompiledForest(
+        "sigmoid", classes=getattr(model, "classes_", np.array([0, 1])), n_features=dump["max_feature_idx"] + 1,
+        feature_names=dump.get("feature_names"), sigmoid=sigmoid, average_output=bool(dump.get("average_output")), version=version,
+        **_pack(trees, 1),
+    )
+
+
+def compile_model(model, version: Optional[str] = None) -> CompiledForest:
+    """Compiles a random forest (optionally in a sampler pipeline) or a LightGBM binary classifier."""
+    if hasattr(model, "booster_") or type(model).__name__ == "Booster":
+        return compile_lightgbm(model, version)
+    return compile_sklearn_forest(model, version)
+
+
+def probe_rows(compiled: CompiledForest, n_rows: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Inputs that exercise the split boundaries: every value is one of the model's thresholds
+    for that feature, the next float either side, zero or NaN (when the model accepts NaN).
+    """
+    rng = np.random.default_rng(seed)
+    internal = ~compiled._is_leaf
+    rows = np.zeros((n_rows, compiled.n_features))
+    for column in range(compiled.n_features):
+        thresholds = compiled.threshold[internal & (compiled.feature == column)]
+        thresholds = thresholds[np.isfinite(thresholds)]
+        if not len(thresholds):
+            continue
+        values = rng.choice(thresholds, n_rows).astype(compiled.input_dtype)
+        step = rng.integers(-1, 2, n_rows)
+        values = np.nextafter(values, np.where(step < 0, -np.inf, np.where(step > 0, np.inf, values)).astype(values.dtype))
+        values = values.astype(np.float64)
+        special = rng.random(n_rows)
+        values = np.where(special < 0.05, 0.0, values)
+        if compiled.allow_nan:
+            values = np.where(special > 0.95, np.nan, values)
+        rows[:, column] = values
+    return rows
+
+
+def verify(compiled: CompiledForest, model, X: Optional[np.ndarray] = None) -> None:
+    """Raises ValueError unless `compiled` reproduces `model.predict_proba` exactly on `X` (default: probe rows)."""
+    X = probe_rows(compiled) if X is None else np.asarray(X, dtype=np.float64)
+    if compiled.feature_names is not None:
+        import pandas as pd
+        X = pd.DataFrame(X, columns=compiled.feature_names)
+    expected = np.asarray(model.predict_proba(X), dtype=np.float64)
+    actual = compiled.predict_proba(X)
+    if expected.shape != actual.shape or not np.array_equal(expected, actual):
+        difference = np.abs(expected - actual).max() if expected.shape == actual.shape else "shape mismatch"
+        raise ValueError(f"Compiled model does not match the original predictions (max difference {difference})")
+
+
+def exported_path(source: str) -> str:
+    return os.path.splitext(source)[0] + ".npz"
+
+
+def load_or_compile(model, source: Optional[str] = None, version: Optional[str] = None) -> CompiledForest:
+    """
+    The exported `.npz` next to `source` when it was compiled from this version of the
+    artifact, otherwise a fresh compile. Either way the result is verified against `model`.
+    """
+    compiled = None
+    if source and version and os.path.exists(exported_path(source)):
+        try:
+            compiled = CompiledForest.load(exported_path(source))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable compiled model {exported_path(source)}: {str(e)}")
+        if compiled is not None and compiled.version != version:
+            logger.info(f"Compiled model {exported_path(source)} is stale; recompiling")
+            compiled = None
+    if compiled is None:
+        compiled = compile_model(model, version)
+    verify(compiled, model)
+    return compiled
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import joblib
+
+    from model_registry import artifact_version
+
+    parser = argparse.ArgumentParser(description="Export tree models to packed NumPy arrays (<artifact>.npz).")
+    parser.add_argument("artifacts", nargs="+", help="joblib model files, e.g. lightgbm_model.pkl")
+    args = parser.parse_args(argv)
+    for source in args.artifacts:
+        model = joblib.load(source)
+        compiled = compile_model(model, version=artifact_version(source))
+        verify(compiled, model)
+        compiled.save(exported_path(source))
+        details = compiled.describe()
+        print(f"{source} -> {exported_path(source)}: {details['trees']} trees, {details['nodes']} nodes, "
+              f"depth {details['max_depth']}, {details['bytes'] / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
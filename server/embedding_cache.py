@@ -0,0 +1,305 @@
+"""
+Persistent cache for query/document embeddings.
+
+`CachedEmbeddings` wraps the embeddings object handed to `FAISS.load_local`. Vectors are
+stored in a memory-mapped float32 file keyed by sha256(model name + text), with an
+in-memory LRU in front and a fixed number of on-disk slots. Identical texts are therefore
+embedded once, across requests and restarts.
+
+Eviction on disk is FIFO: slots are reused in the order they were written, whether or not
+they were read since. Several workers can share one cache directory: writes happen under an
+exclusive `flock` on `lock`, lookups under a shared one, each worker re-reads `index.json`
+when another worker has changed it, and every slot stores its key's hash (`keys.sha256`) so
+a slot reused by another worker is never returned for the old key.
+
+`DeterministicEmbeddings` is a local stand-in for OpenAI used in offline mode
+(`EMBEDDINGS_OFFLINE=1`), so the retrieval path can run and be benchmarked without network.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Not POSIX: only one process may use a cache directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+OPENAI_EMBEDDING_DIM = 1536
+KEY_BYTES = 32
+
+
+class DeterministicEmbeddings(Embeddings):
+    """Offline embedding stub: a unit vector seeded from the text hash (same text -> same vector)."""
+
+    def __init__(self, dim: int = OPENAI_EMBEDDING_DIM):
+        self.dim = dim
+        self.model = f"offline-stub-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper backed by an LRU front and a memory-mapped on-disk store."""
+
+    INDEX_FILE = "index.json"
+    VECTORS_FILE = "vectors.f32"
+    KEYS_FILE = "keys.sha256"
+    LOCK_FILE = "lock"
+
+    def __init__(self, inner: Embeddings, cache_dir: str, model_name: Optional[str] = None,
+                 max_entries: int = 10000, memory_entries: int = 1024):
+        self.inner = inner
+        self.model_name = model_name or getattr(inner, "model", type(inner).__name__)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._slots: Dict[str, int] = {}
+        self._slot_owners: Dict[int, str] = {}
+        self._next_slot = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._store_id = None
+        self._index_id = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_fd = os.open(self._path(self.LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        with self._lock, self._file_lock(shared=True):
+            self._refresh_index()
+        if self._slots:
+            logger.info(f"Loaded embedding cache with {len(self._slots)} vector(s) from {self.cache_dir}")
+
+    # --- persistence -------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """Cross-process lock on the cache directory; callers hold `self._lock` first."""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_id(path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _layout_id(self, *paths: str):
+        """(inode, size) per file; unlike the mtime, these only change when a file is replaced."""
+        return tuple(file_id and (file_id[0], file_id[2]) for file_id in map(self._file_id, paths))
+
+    def _refresh_index(self) -> None:
+        """Re-reads the index if another worker (or a previous run) has written it since."""
+        index_path = self._path(self.INDEX_FILE)
+        index_id = self._file_id(index_path)
+        if index_id is None or index_id == self._index_id:
+            return
+        self._index_id = index_id
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("max_entries") != self.max_entries:
+                logger.warning("Embedding cache size changed; starting with an empty cache.")
+                return
+            self._open_store(index["dim"])
+            self._slots = index["slots"]
+            self._slot_owners = {slot: key for key, slot in self._slots.items()}
+            self._next_slot = index["next_slot"]
+        except Exception as e:
+            logger.error(f"Failed to load embedding cache index, ignoring it: {str(e)}")
+
+    def _save_index(self) -> None:
+        index_path = self._path(self.INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self._dim,
+                "max_entries": self.max_entries,
+                "next_slot": self._next_slot,
+                "slots": self._slots,
+            }, f)
+        os.replace(tmp_path, index_path)
+        self._index_id = self._file_id(index_path)
+
+    def _open_store(self, dim: int, create: bool = False) -> None:
+        """
+        Maps the vector and key files (opened "r+", so data other workers index is kept).
+        With `create`, files that are missing or sized for another layout are replaced by
+        empty ones; otherwise that raises.
+        """
+        vectors_path, keys_path = self._path(self.VECTORS_FILE), self._path(self.KEYS_FILE)
+        store_id = self._layout_id(vectors_path, keys_path)
+        if self._vectors is not None and dim == self._dim and store_id == self._store_id:
+            return
+
+        sizes = tuple(file_id[1] if file_id else None for file_id in store_id)
+        if sizes != (self.max_entries * dim * 4, self.max_entries * KEY_BYTES):
+            if not create:
+                raise ValueError(f"{self.VECTORS_FILE}/{self.KEYS_FILE} do not match the index")
+            # Replaced, never truncated in place: other workers may still map the old files
+            for path, dtype, width in ((vectors_path, np.float32, dim), (keys_path, np.uint8, KEY_BYTES)):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                np.memmap(tmp_path, dtype=dtype, mode="w+", shape=(self.max_entries, width)).flush()
+                os.replace(tmp_path, path)
+            self._slots, self._slot_owners, self._next_slot = {}, {}, 0
+            store_id = self._layout_id(vectors_path, keys_path)
+
+        self._dim = dim
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(self.max_entries, dim))
+        self._keys = np.memmap(keys_path, dtype=np.uint8, mode="r+", shape=(self.max_entries, KEY_BYTES))
+        self._store_id = store_id
+
+    # --- cache -------------------------------------------------------------
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            return vector
+        slot = self._slots.get(key)
+        if slot is None or self._vectors is None:
+            return None
+        if self._keys[slot].tobytes() != bytes.fromhex(key):
+            # Slot rewritten without the index being saved (e.g. a worker died mid-write)
+            self._slots.pop(key, None)
+            return None
+        vector = self._vectors[slot].tolist()
+        self._remember(key, vector)
+        return vector
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _store(self, key: str, vector: List[float]) -> None:
+        if self._vectors is None:
+            self._open_store(len(vector), create=True)
+        if len(vector) != self._dim:
+            logger.warning(f"Embedding dimension {len(vector)} does not match cache ({self._dim}); not persisted.")
+            self._remember(key, vector)
+            return
+        if key in self._slots:
+            # Another worker stored it while this one was embedding
+            self._remember(key, vector)
+            return
+
+        slot = self._next_slot
+        # Reusing a slot evicts whichever key pointed at it
+        old_key = self._slot_owners.get(slot)
+        if old_key is not None and self._slots.get(old_key) == slot:
+            self._slots.pop(old_key)
+        self._vectors[slot] = np.asarray(vector, dtype=np.float32)
+        self._keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+        self._slots[key] = slot
+        self._slot_owners[slot] = key
+        self._next_slot = (slot + 1) % self.max_entries
+        self._remember(key, vector)
+
+    def _embed_with_cache(self, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: List[int] = []
+
+        with self._lock, self._file_lock(shared=True):
+            self._refresh_index()
+            for i, key in enumerate(keys):
+                results[i] = self._lookup(key)
+                if results[i] is None:
+                    missing.append(i)
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            vectors = embed_fn([texts[i] for i in missing])
+            with self._lock, self._file_lock():
+                # Allocate slots after the ones other workers wrote meanwhile
+                self._refresh_index()
+                for i, vector in zip(missing, vectors):
+                    results[i] = list(vector)
+                    self._store(keys[i], results[i])
+                if self._vectors is not None:
+                    self._vectors.flush()
+                    self._keys.flush()
+                self._save_index()
+
+        return results
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_with_cache(list(texts), self.inner.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_with_cache([text], lambda batch: [self.inner.embed_query(batch[0])])[0]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._slots),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def build_embeddings(model_name: str = "text-embedding-ada-002") -> CachedEmbeddings:
+    """
+    Builds the embeddings object used by the FAISS indexes from environment settings:
+    EMBEDDINGS_OFFLINE, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_MEMORY_ENTRIES.
+    """
+    if os.getenv("EMBEDDINGS_OFFLINE", "").lower() in ("1", "true", "yes"):
+        logger.warning("EMBEDDINGS_OFFLINE is set; using deterministic local embeddings.")
+        inner: Embeddings = DeterministicEmbeddings()
+        cache_model_name = inner.model
+    else:
+        from langchain.embeddings import OpenAIEmbeddings
+        inner = OpenAIEmbeddings(model=model_name)
+        cache_model_name = model_name
+
+    return CachedEmbeddings(
+        inner,
+        cache_dir=os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.getcwd(), ".embedding_cache")),
+        model_name=cache_model_name,
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10000)),
+        memory_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", 1024)),
+    )
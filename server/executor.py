@@ -0,0 +1,127 @@
+"""
+Worker pool for CPU-bound inference and SHAP work.
+
+The FastAPI handlers are `async def`, so running sklearn / LightGBM / SHAP / matplotlib
+directly in them blocks the event loop (and every open `/chat` request with it).
+`InferenceExecutor` runs those calls in a thread or process pool instead, with a bounded
+number of pending jobs so callers can be rejected (HTTP 503) when the pool is saturated.
+
+Configuration (environment variables):
+    INFERENCE_EXECUTOR     "thread" (default) or "process"
+    INFERENCE_WORKERS      number of workers (default: CPU count, max 4)
+    INFERENCE_MAX_PENDING  jobs allowed in flight + queued before rejecting (default: 4 x workers)
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the inference pool already has `max_pending` jobs in flight."""
+
+
+def _load_models_in_worker():
+    """Process-pool initializer: loads the models once per worker (FAISS and LLM clients are never loaded)."""
+    import main
+
+    main.startup.ensure("models")
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Runs `fn` in the worker and returns its result with wall-clock start/end times."""
+    started_at = time.time()
+    result = fn(*args, **kwargs)
+    return result, started_at, time.time()
+
+
+class InferenceExecutor:
+    def __init__(self, kind: str = "thread", max_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, metrics=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind '{kind}'. Use 'thread' or 'process'.")
+
+        self.kind = kind
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 4
+        self._metrics = metrics
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        if kind == "process":
+            self._pool: Executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_load_models_in_worker
+            )
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="inference"
+            )
+        logger.info(
+            f"Inference executor ready: {kind} pool, {self.max_workers} worker(s), "
+            f"max {self.max_pending} pending job(s)"
+        )
+
+    @classmethod
+    def from_env(cls, metrics=None) -> "InferenceExecutor":
+        workers = os.getenv("INFERENCE_WORKERS")
+        max_pending = os.getenv("INFERENCE_MAX_PENDING")
+        return cls(
+            kind=os.getenv("INFERENCE_EXECUTOR", "thread").lower(),
+            max_workers=int(workers) if workers else None,
+            max_pending=int(max_pending) if max_pending else None,
+            metrics=metrics,
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, stage: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Runs `fn(*args, **kwargs)` in the pool and awaits the result.
+        Records `<stage>_queue_wait` and `<stage>_run` timings.
+        Raises `ExecutorSaturatedError` instead of queueing beyond `max_pending`; a job counts
+        as pending until it finishes in the pool, even if the caller is cancelled first.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                if self._metrics is not None:
+                    self._metrics.record(f"{stage}_rejected", 0.0)
+                raise ExecutorSaturatedError(
+                    f"Inference pool saturated ({self._pending} pending job(s)); retry shortly."
+                )
+            self._pending += 1
+
+        submitted_at = time.time()
+        call = functools.partial(_timed_call, fn, args, kwargs)
+        if self.kind == "thread":
+            # Carry the caller's context (e.g. the current trace span) into the worker thread
+            call = functools.partial(contextvars.copy_context().run, call)
+        try:
+            future = self._pool.submit(call)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the job itself finishes, not until the caller stops waiting:
+        # a cancelled request (client disconnect, timeout) leaves its job running in the pool
+        future.add_done_callback(self._release)
+        result, started_at, finished_at = await asyncio.wrap_future(future)
+
+        if self._metrics is not None:
+            self._metrics.record(f"{stage}_queue_wait", max(0.0, started_at - submitted_at))
+            self._metrics.record(f"{stage}_run", finished_at - started_at)
+        return result
+
+    def _release(self, future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
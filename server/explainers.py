@@ -0,0 +1,95 @@
+"""
+Registry of prebuilt SHAP TreeExplainers, keyed by model.
+
+Building a `shap.TreeExplainer` (and unwrapping the imblearn `Pipeline`) is expensive
+for large ensembles, so explainers are built once when a model is registered and
+reused for every request. shap and imblearn are imported on first use, not at import.
+`class1_shap_values` normalizes the explainer output to class-1 (diabetes) values for
+any number of rows, for single predictions and cohort batches alike.
+"""
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:  # pragma: no cover
+    import shap
+
+logger = logging.getLogger(__name__)
+
+
+def unwrap_model(model):
+    """Returns the classifier inside an imblearn `Pipeline`, or the model itself."""
+    from imblearn.pipeline import Pipeline
+
+    if isinstance(model, Pipeline):
+        return model.named_steps['clf']
+    return model
+
+
+def class1_shap_values(explainer, X) -> Tuple[np.ndarray, float]:
+    """
+    SHAP values (rows x features) and base value for class 1 (diabetes). Binary tree models
+    come back as a list with one array per class (older shap with sklearn), a
+    (rows, features, classes) array (newer shap) or a single array (LightGBM log-odds).
+    """
+    values = explainer.shap_values(X)
+    base_value = explainer.expected_value
+    if isinstance(values, list) and len(values) == 2:
+        values, base_value = values[1], base_value[1]
+    values = np.asarray(values)
+    if values.ndim > 2:
+        values = values[:, :, 1]
+    base_values = np.ravel(base_value)
+    return values, float(base_values[1] if len(base_values) > 1 else base_values[0])
+
+
+class ExplainerRegistry:
+    """Thread-safe map of model key -> (model, TreeExplainer)."""
+
+    def __init__(self, metrics=None):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Any, "shap.TreeExplainer"]] = {}
+        self._metrics = metrics
+
+    def register(self, key: str, model) -> "shap.TreeExplainer":
+        """Builds (or rebuilds) the explainer for `model` and stores it under `key`."""
+        import shap
+
+        start = time.perf_counter()
+        explainer = shap.TreeExplainer(unwrap_model(model))
+        elapsed = time.perf_counter() - start
+        if self._metrics is not None:
+            self._metrics.record("shap_explainer_build", elapsed)
+        logger.info(f"Built SHAP explainer for '{key}' in {elapsed * 1000:.1f} ms")
+
+        with self._lock:
+            self._entries[key] = (model, explainer)
+        return explainer
+
+    def get(self, model) -> "shap.TreeExplainer":
+        """
+        Returns the cached explainer for `model` (matched by identity).
+        Models that were never registered are built once and cached under an ad-hoc key.
+        """
+        with self._lock:
+            for registered_model, explainer in self._entries.values():
+                if registered_model is model:
+                    return explainer
+        logger.warning("No prebuilt SHAP explainer for model; building one now.")
+        return self.register(f"adhoc:{id(model)}", model)
+
+    def get_by_key(self, key: str) -> Optional["shap.TreeExplainer"]:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
@@ -0,0 +1,132 @@
+"""
+Precompiled single-row feature encoder for `predict_diabetes_risk`.
+
+The pandas path (DataFrame -> derived ratio -> reindex -> astype -> scaler.transform on a
+slice -> reindex) costs far more than the model itself for a 6-feature row. The encoder
+resolves column positions, the scaler's `mean_`/`scale_` and the categorical defaults once,
+then writes each patient straight into a per-thread NumPy buffer.
+
+The output matches the pandas path value for value:
+  * features absent from the patient dict are 0.0 (like `reindex(fill_value=0.0)`)
+  * `Glucose_BMI_Ratio` is derived from the raw values when the model was trained with it
+  * missing categoricals are filled from `default_modes`, then truncated like `astype(int)`
+  * missing numericals stay NaN, which LightGBM handles natively
+  * scaling is applied in place, only to the numerical features
+"""
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+RATIO_FEATURE = "Glucose_BMI_Ratio"
+
+
+class FeatureEncoder:
+    def __init__(self, feature_order: Iterable[str], numerical_features: Iterable[str],
+                 categorical_defaults: Dict[str, float], scaler=None):
+        self.feature_order: List[str] = list(feature_order)
+        self.n_features = len(self.feature_order)
+        positions = {feature: position for position, feature in enumerate(self.feature_order)}
+
+        self._inputs: List[Tuple[int, str]] = [
+            (position, feature) for position, feature in enumerate(self.feature_order) if feature != RATIO_FEATURE
+        ]
+        self._ratio_position: Optional[int] = positions.get(RATIO_FEATURE)
+        self._categorical: List[Tuple[int, float]] = [
+            (positions[feature], float(default))
+            for feature, default in categorical_defaults.items() if feature in positions
+        ]
+        self.categorical_features = [self.feature_order[position] for position, _ in self._categorical]
+
+        numerical = set(numerical_features)
+        scaled = [feature for feature in self.feature_order if feature in numerical]
+        self._scaled_positions = np.array([positions[feature] for feature in scaled], dtype=np.intp)
+        self._mean = np.zeros(len(scaled))
+        self._scale = np.ones(len(scaled))
+        if scaler is not None:
+            # The scaler was fitted on the numerical features in training order
+            scaler_order = list(getattr(scaler, "feature_names_in_", scaled))
+            lookup = [scaler_order.index(feature) for feature in scaled]
+            if getattr(scaler, "with_mean", True) and getattr(scaler, "mean_", None) is not None:
+                self._mean = np.asarray(scaler.mean_, dtype=np.float64)[lookup]
+            if getattr(scaler, "with_std", True) and getattr(scaler, "scale_", None) is not None:
+                self._scale = np.asarray(scaler.scale_, dtype=np.float64)[lookup]
+
+        self._local = threading.local()
+
+    def _buffer(self) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty((1, self.n_features), dtype=np.float64)
+        return buffer
+
+    def encode(self, patient: dict, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int]:
+        """
+        Writes `patient` into a (1, n_features) row and returns it with the number of
+        non-missing values (the count `predict_diabetes_risk` routes on). Without `out`,
+        the row is this thread's reusable buffer: copy it to keep it past the next call.
+        """
+        row = self._buffer() if out is None else out
+        values = row[0]
+        provided = 0
+        for position, feature in self._inputs:
+            value = patient.get(feature, 0.0)
+            value = math.nan if value is None else float(value)
+            values[position] = value
+            if value == value:
+                provided += 1
+
+        if self._ratio_position is not None:
+            ratio = float(patient["Glucose"]) / (float(patient["BMI"]) + 1e-6)
+            values[self._ratio_position] = ratio
+            if ratio == ratio:
+                provided += 1
+
+        for position, default in self._categorical:
+            value = values[position]
+            values[position] = float(int(default if value != value else value))
+
+        return row, provided
+
+    def encode_matrix(self, columns: Sequence[str], matrix) -> np.ndarray:
+        """
+        `encode` for many patients at once: `matrix` has one row per patient with a value per
+        name in `columns` (None/NaN for blanks). Returns a new (n_patients, n_features) array;
+        features absent from `columns` are 0.0, like keys absent from the patient dict.
+        """
+        lookup = {feature: position for position, feature in enumerate(columns)}
+        unknown = [feature for feature in columns if feature not in self.feature_order or feature == RATIO_FEATURE]
+        if unknown:
+            raise ValueError(f"Unknown feature column(s) {unknown}")
+        if len(lookup) != len(columns):
+            raise ValueError("Feature columns must be unique")
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.ndim != 2 or matrix.shape[1] != len(columns):
+            raise ValueError(f"Expected one row of {len(columns)} value(s) per patient, got shape {matrix.shape}")
+
+        def column(feature: str) -> np.ndarray:
+            position = lookup.get(feature)
+            return matrix[:, position] if position is not None else np.zeros(len(matrix))
+
+        rows = np.empty((len(matrix), self.n_features), dtype=np.float64)
+        for position, feature in self._inputs:
+            rows[:, position] = column(feature)
+        if self._ratio_position is not None:
+            rows[:, self._ratio_position] = column("Glucose") / (column("BMI") + 1e-6)
+        for position, default in self._categorical:
+            values = rows[:, position]
+            rows[:, position] = np.trunc(np.where(np.isnan(values), default, values))
+        return rows
+
+    def scale(self, row: np.ndarray) -> np.ndarray:
+        """Standardizes the numerical columns of `row` in place and returns it."""
+        columns = self._scaled_positions
+        row[:, columns] = (row[:, columns] - self._mean) / self._scale
+        return row
+
+    def to_frame(self, row: np.ndarray) -> pd.DataFrame:
+        """DataFrame view of an encoded row (categoricals as int), for SHAP and plotting."""
+        frame = pd.DataFrame(row.copy(), columns=self.feature_order)
+        return frame.astype({feature: int for feature in self.categorical_features})
@@ -0,0 +1,85 @@
+"""
+Shared LLM clients and chains.
+
+Every `ChatOpenAI` built here shares one pooled `httpx` client (sync and async), so
+requests reuse keep-alive connections instead of paying a TLS handshake each time.
+Clients and chains are built once by name at startup and reused across requests.
+
+Configuration (environment variables):
+    LLM_MAX_CONNECTIONS    max open connections to the OpenAI API (default: 20)
+    LLM_MAX_KEEPALIVE      idle keep-alive connections kept in the pool (default: 10)
+    LLM_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default: 60)
+    LLM_TIMEOUT            request timeout in seconds (default: 120)
+"""
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+from langchain.chains import LLMChain
+from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClientRegistry:
+    def __init__(self, api_key: Optional[str] = None, max_connections: int = 20,
+                 max_keepalive_connections: int = 10, keepalive_expiry: float = 60.0,
+                 timeout: float = 120.0):
+        self.api_key = api_key
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self._lock = threading.Lock()
+        self._clients: Dict[str, ChatOpenAI] = {}
+        self._chains: Dict[str, LLMChain] = {}
+        logger.info(
+            f"LLM HTTP pool: {max_connections} connection(s), {max_keepalive_connections} keep-alive, "
+            f"{keepalive_expiry:.0f}s expiry"
+        )
+
+    @classmethod
+    def from_env(cls, api_key: Optional[str] = None) -> "LLMClientRegistry":
+        return cls(
+            api_key=api_key,
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 20)),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", 10)),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60)),
+            timeout=float(os.getenv("LLM_TIMEOUT", 120)),
+        )
+
+    def client(self, name: str, **kwargs) -> ChatOpenAI:
+        """Returns the client registered as `name`, building it with `kwargs` on first use."""
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = ChatOpenAI(
+                    openai_api_key=self.api_key,
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client,
+                    **kwargs,
+                )
+                self._clients[name] = client
+            return client
+
+    def chain(self, name: str, llm: ChatOpenAI, prompt) -> LLMChain:
+        """Returns the chain registered as `name`, building it on first use."""
+        with self._lock:
+            chain = self._chains.get(name)
+            if chain is None:
+                chain = LLMChain(llm=llm, prompt=prompt)
+                self._chains[name] = chain
+            return chain
+
+    def stats(self) -> Dict[str, list]:
+        with self._lock:
+            return {"clients": list(self._clients), "chains": list(self._chains)}
+
+    async def aclose(self) -> None:
+        self.http_client.close()
+        await self.http_async_client.aclose()
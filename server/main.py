@@ -1,7 +1,7 @@
-import requests
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import pandas as pd
 import numpy as np
 import joblib
@@ -10,22 +10,31 @@ import json
 import os
 import io
 import base64
+import hashlib
+import time
 from dotenv import load_dotenv
-from langchain.chains import LLMChain
-from langchain_community.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
 import uvicorn
-from typing import Union, List, Dict
-from sklearn.impute import SimpleImputer
-import shap
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from imblearn.pipeline import Pipeline
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
+from typing import Union, List, Dict, Literal, Optional, Tuple
 import asyncio
-from mcp import MCPRequest, MCPResponse, handle_mcp_action, current_model_override
+from concurrent.futures import ThreadPoolExecutor
+from mcp import MCPRequest, MCPResponse, handle_mcp_action
+from metrics import latency_metrics, token_metrics, span_histograms
+from explainers import ExplainerRegistry, class1_shap_values
+from executor import InferenceExecutor, ExecutorSaturatedError
+from shap_render import ShapPlotRenderer, build_waterfall
+from shap_batch import BatchExplainer, columnar_result
+from retrieval import GuidelineRetrievalCache, MergedGuidelineIndex, gather_guideline_evidence
+from sessions import SessionLocks, build_session_store
+from prompt_budget import HistoryCompactor, count_tokens
+from recommendation_cache import RecommendationCache
+from pipeline import PipelineScheduler
+from pubmed import PubMedClient
+from features import FeatureEncoder
+from compiled_trees import load_or_compile
+from model_registry import ModelEntry, ModelRegistry, ModelReloader, artifact_version
+from tracing import Tracer
+from access_log import AccessLog, configure_logging, patient_ref
+from startup import ComponentUnavailable, StartupOrchestrator
 
 # Load environment variables
 load_dotenv()
@@ -35,13 +44,21 @@ load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Configure logging: records are written by a background thread (see access_log.py)
+log_listener = configure_logging(os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
+access_log = AccessLog.from_env()
 
 # Initialize FastAPI app
 app = FastAPI()
 
+# Spans feed the Prometheus histograms on /metrics and `latency_metrics` (see tracing.py)
+tracer = Tracer.from_env(histograms=span_histograms, metrics=latency_metrics)
+
+# Models, FAISS indexes and LLM clients load in parallel in the background (see startup.py);
+# with STARTUP_SERVE_EARLY=1, /predict is served as soon as the models are loaded
+startup = StartupOrchestrator.from_env(early_components=("models",), metrics=latency_metrics)
+
 # Enable CORS if needed (e.g., for a React frontend)
 app.add_middleware(
     CORSMiddleware,
@@ -60,6 +77,16 @@ class PatientData(BaseModel):
     Age: Union[float, str] = 0.0
     Gender: Union[float, str] = 0.0
     Ethnicity: Union[float, str] = 0.0
+    # Optional model key (see model_registry.py); None uses the default model or feature-count routing
+    model: Optional[str] = None
+
+
+def patient_features(patient: PatientData) -> dict:
+    """Numeric feature dict for `predict_diabetes_risk`; blank values (and PatientName) become NaN."""
+    return {
+        k: float(v) if k != "PatientName" and str(v).strip() else np.nan
+        for k, v in patient.model_dump(exclude={"model"}).items()
+    }
 
 
 # Define feature sets
@@ -83,23 +110,98 @@ default_modes = {
 
 # Load FAISS Indexes with Enhanced Debugging
 faiss_base_path = os.getcwd()  # Ensure FAISS index path is set correctly
-openai_embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
+# Query embeddings are memoized on disk (see embedding_cache.py); EMBEDDINGS_OFFLINE=1 uses a local stub.
+# Built by the "faiss" startup task, together with the indexes.
+openai_embeddings = None
 
 vectorstores = {}
 
 faiss_categories = ["Endocrinology", "Dietitian", "Exercise"]
 
-for category in faiss_categories:
+# `get_guideline_evidence` only ever builds these queries, so their results are cached
+guideline_k = 3
+guideline_queries = [f"diabetes treatment guidelines {status}" for status in ("diabetes", "no diabetes")]
+guideline_cache = GuidelineRetrievalCache()
+
+no_guidelines_text = "No specific guidelines found, but consider best practices in the field."
+# Used when a category's retrieval fails or times out; recommendations built on it are not cached
+guideline_error_text = "Error retrieving guidelines. Please consult a healthcare provider."
+
+# Per-category retrieval timeouts in seconds, e.g. GUIDELINE_TIMEOUT_DIETITIAN=2.5
+guideline_timeouts = {
+    category: float(os.getenv(f"GUIDELINE_TIMEOUT_{category.upper()}", os.getenv("GUIDELINE_TIMEOUT", 5)))
+    for category in faiss_categories
+}
+
+
+# Merged multi-category index built by `build_merged_index.py`; used instead of the
+# per-category indexes when present (set USE_MERGED_FAISS=0 to disable)
+merged_index_path = os.path.join(faiss_base_path, "faiss_guidelines")
+use_merged_index = os.getenv("USE_MERGED_FAISS", "1") != "0" and os.path.isdir(merged_index_path)
+
+
+def load_merged_vectorstore():
+    """
+    Loads the merged guideline index and exposes one view per category in `vectorstores`.
+    Returns True when the index was loaded.
+    """
+    from langchain.vectorstores import FAISS
+
+    try:
+        logger.info(f"Loading merged FAISS index from {merged_index_path} ...")
+        store = FAISS.load_local(merged_index_path, openai_embeddings, allow_dangerous_deserialization=True)
+        merged = MergedGuidelineIndex(store, openai_embeddings, faiss_categories)
+        for category in faiss_categories:
+            vectorstores[category] = merged.view(category)
+        logger.info(f" Successfully loaded merged FAISS index ({store.index.ntotal} vectors).")
+        return True
+    except Exception as e:
+        logger.error(f" Failed to load merged FAISS index: {str(e)}")
+        return False
+    finally:
+        guideline_cache.invalidate()
+
+
+def load_vectorstore(category):
+    """
+    Loads (or reloads) the FAISS index for `category` and drops its cached retrieval results.
+    With the merged index, the whole index is reloaded. Returns True when the index was loaded.
+    """
+    if use_merged_index:
+        return load_merged_vectorstore()
+
+    from langchain.vectorstores import FAISS
+
     index_path = os.path.join(faiss_base_path, f"faiss_{category.lower()}")
-    
+
     try:
         logger.info(f"Loading FAISS index for {category} from {index_path} ...")
         vectorstores[category] = FAISS.load_local(index_path, openai_embeddings, allow_dangerous_deserialization=True)
         logger.info(f" Successfully loaded FAISS index for {category}.")
+        return True
     except FileNotFoundError:
         logger.error(f" FAISS index not found for {category} at {index_path}. Ensure the index is correctly saved.")
     except Exception as e:
         logger.error(f" Failed to load FAISS index for {category}: {str(e)}")
+    finally:
+        guideline_cache.invalidate(category)
+    return False
+
+
+def init_guideline_indexes():
+    """Startup task: query embeddings, the FAISS indexes and the warmed retrieval cache."""
+    global openai_embeddings
+    from embedding_cache import build_embeddings
+
+    openai_embeddings = build_embeddings(model_name="text-embedding-ada-002")
+    if use_merged_index:
+        load_merged_vectorstore()
+    else:
+        for category in faiss_categories:
+            load_vectorstore(category)
+
+    guideline_cache.warm(vectorstores, guideline_queries, guideline_k)
+    return {"categories": sorted(vectorstores)}
 
 def convert_categorical_values(patient_data):
     """
@@ -139,7 +241,7 @@ def get_guideline_evidence(patient_data, risk_result, category):
     """
     if category not in vectorstores:
         logger.warning(f"⚠FAISS index for {category} is missing. Skipping retrieval.")
-        return "No specific guidelines found, but consider best practices in the field."
+        return no_guidelines_text
 
     diabetes_status = "diabetes" if risk_result["predictedRisk"] == "Diabetes" else "no diabetes"
     query = f"diabetes treatment guidelines {diabetes_status}"
@@ -147,44 +249,64 @@ def get_guideline_evidence(patient_data, risk_result, category):
     logger.info(f"Retrieving FAISS guidelines for {category} using query: '{query}'")
 
     try:
-        retriever = vectorstores[category].as_retriever(search_type="similarity", search_kwargs={"k": 3})
-        retrieved_docs = retriever.invoke(query)
+        with tracer.span(f"retrieval_{category.lower()}", category=category):
+            retrieved_docs = guideline_cache.get(category, query, guideline_k, vectorstores[category])
         
         if not retrieved_docs:
             logger.warning(f" No FAISS guidelines found for {category} using query: '{query}'")
-            return "No specific guidelines found, but consider best practices in the field."
+            return no_guidelines_text
 
         logger.info(f"Retrieved {len(retrieved_docs)} guideline(s) for {category}.")
         return "\n".join([doc.page_content for doc in retrieved_docs])
 
     except Exception as e:
         logger.error(f" FAISS retrieval error for {category}: {str(e)}")
-        return "Error retrieving guidelines. Please consult a healthcare provider."
-        
+        return guideline_error_text
+
+
+async def get_all_guideline_evidence(patient_data, risk_result, deadline=None):
+    """
+    Retrieves guidelines for every FAISS category concurrently.
+    Each category has its own timeout (clipped to the pipeline deadline, if given) and
+    falls back to `guideline_error_text`.
+    """
+    timeouts = guideline_timeouts
+    if deadline is not None:
+        timeouts = {category: deadline.clip(timeout) for category, timeout in guideline_timeouts.items()}
+    with tracer.span("guideline_retrieval"):
+        return await gather_guideline_evidence(
+            lambda category: get_guideline_evidence(patient_data, risk_result, category),
+            faiss_categories,
+            timeouts,
+            guideline_error_text,
+        )
+
 
 # Define Chat Request Model
+# With `session_id` (returned by `/recommendations`), only `user_input` is needed;
+# the patient context and history are read from the server-side session store.
 class ChatRequest(BaseModel):
-    history: List[Dict[str, str]]
+    history: List[Dict[str, str]] = []
     user_input: str
-    patient_data: Dict[str, Union[str, float]] 
-    recommendations: Dict[str, str]
-    predicted_risk: str
-    risk_probability: str
-
-# Load the LightGBM and Random Forest models
-try:
-    lgbm_model = joblib.load("lightgbm_model.pkl")
-    tuned_rf_model = joblib.load("tuned_rf_model.pkl")
-except Exception as e:
-    logger.error("Error loading models: %s", str(e))
-    raise Exception("Error loading LightGBM or Random Forest models.") from e
+    patient_data: Dict[str, Union[str, float]] = {}
+    recommendations: Dict[str, str] = {}
+    predicted_risk: str = ""
+    risk_probability: str = ""
+    session_id: Optional[str] = None
 
+# Server-side chat sessions (see sessions.py); turns on one session run one at a time
+chat_sessions = build_session_store()
+chat_session_locks = SessionLocks()
 
-llm = ChatOpenAI(temperature=0.4, openai_api_key=openai_api_key) 
+# LLM clients, prompts and chains are built by the "llm" startup task (see `init_llm_clients`);
+# prompts are declared here as PromptTemplate arguments so langchain is only imported there
+llm_registry = llm = expert_llm = None
+chat_prompt = chat_chain = meta_agent_prompt = meta_agent_chain = history_summary_chain = None
+expert_chains = {}
 
 
 # Chat Agent Prompt with Risk & Probability
-chat_prompt = PromptTemplate(
+chat_prompt_spec = dict(
     input_variables=['history', 'user_input', 'patient_data', 'recommendations', 'predicted_risk', 'risk_probability'],
     template=(
         "You are a medical AI assistant helping a patient manage their health.\n\n"
@@ -200,107 +322,280 @@ chat_prompt = PromptTemplate(
         "Provide an informative response considering the patient's data, medical risk, and expert recommendations."
     )
 )
-chat_chain = LLMChain(llm=llm, prompt=chat_prompt)
 
-import joblib
-
-# Load the scaler used during training
+# Model artifacts; loaded by the "models" startup task (see `init_models`)
+lgbm_model_path = "lightgbm_model.pkl"
+tuned_rf_model_path = "tuned_rf_model.pkl"
 scaler_path = "scaler.pkl"
-if os.path.exists(scaler_path):
-    scaler = joblib.load(scaler_path)
+lgbm_model = tuned_rf_model = scaler = None
+
+# Single-row feature encoder, compiled once from the trained feature order (unscaled; each
+# model entry scales with its own encoder). Its rows are plain arrays in training order.
+trained_feature_order = list(all_features)
+feature_encoder = None
+
+# Every servable model with its scaler, encoder and SHAP explainer (see model_registry.py)
+explainer_registry = ExplainerRegistry(metrics=latency_metrics)
+model_registry = ModelRegistry(state_path=os.getenv("MODEL_STATE_PATH") or None)
+model_reloader = None
+
+# Serve probabilities from the trees compiled to NumPy arrays (see compiled_trees.py)
+compiled_trees_enabled = os.getenv("COMPILED_TREES", "1") == "1"
+
+
+def build_model_entry(key: str, display_name: str, model, model_scaler=None, source: Optional[str] = None,
+                      scaler_source: Optional[str] = None, version: Optional[str] = None,
+                      require_explainer: bool = False) -> ModelEntry:
+    """
+    Builds the explainer, encoder and compiled trees for `model`. At startup a failed explainer
+    build only disables prebuilt SHAP; reloads pass `require_explainer` so a broken artifact is
+    rejected. A model that cannot be compiled exactly is served as is.
+    """
+    try:
+        explainer = explainer_registry.register(key, model)
+    except Exception as e:
+        if require_explainer:
+            raise
+        logger.error(f"Failed to prebuild SHAP explainer for {key}: {str(e)}")
+        explainer = None
+    encoder = FeatureEncoder(trained_feature_order, numerical_features, default_modes, model_scaler)
+    version = version or (artifact_version(source) if source else "1")
+    predictor = None
+    if compiled_trees_enabled:
+        try:
+            predictor = load_or_compile(model, source, version)
+        except Exception as e:
+            logger.warning(f"Serving {key} with the original model; tree compilation failed: {str(e)}")
+    return ModelEntry(key, display_name, model, model_scaler, encoder, explainer, version, source, scaler_source,
+                      predictor=predictor)
+
+
+# Hot reload only reads artifacts from this directory (joblib files can run code on load)
+model_artifact_dir = os.path.realpath(os.getenv("MODEL_ARTIFACT_DIR", "."))
+
+# Dry-run input used to warm a reloaded model before it takes traffic
+WARMUP_PATIENT = {"Glucose": 120.0, "BMI": 28.0, "Age": 45.0, "BloodPressure": 75.0, "Gender": 1.0, "Ethnicity": 3.0}
+
+
+def artifact_path(path: str) -> str:
+    resolved = os.path.realpath(os.path.join(model_artifact_dir, path))
+    if os.path.commonpath([resolved, model_artifact_dir]) != model_artifact_dir:
+        raise ValueError(f"Model artifacts must be inside {model_artifact_dir}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"Model artifact not found: {path}")
+    return resolved
+
+
+def load_model_entry(key: str, spec: dict) -> ModelEntry:
+    """
+    Loads the artifact described by `spec` (`path`, optional `scaler_path`, `version`, `name`).
+    Without `scaler_path` the current entry's scaler is kept, so a retrained LightGBM stays scaled.
+    Only registered keys can be reloaded.
+    """
+    current = model_registry.get(key)
+    path = artifact_path(spec["path"])
+    model = joblib.load(path)
+    if spec.get("scaler_path"):
+        model_scaler, scaler_source = joblib.load(artifact_path(spec["scaler_path"])), spec["scaler_path"]
+    else:
+        model_scaler = current.scaler
+        scaler_source = current.scaler_source
+    return build_model_entry(
+        key, spec.get("name") or current.display_name, model, model_scaler,
+        source=path, scaler_source=scaler_source, version=spec.get("version"),
+        require_explainer=True,
+    )
+
+
+def predictor_input(entry: ModelEntry, rows: np.ndarray):
+    """
+    Encoded rows in the form `entry.predictor` expects: compiled trees take the array; a model
+    fitted on a DataFrame gets a named frame, so sklearn's feature-name check has nothing to
+    warn about.
+    """
+    if entry.predictor is not entry.model or getattr(entry.model, "feature_names_in_", None) is None:
+        return rows
+    return entry.encoder.to_frame(rows)
+
+
+def warm_model_entry(entry: ModelEntry) -> None:
+    """Dry-run prediction and SHAP explanation; raises if the entry cannot serve requests."""
+    row, _ = entry.encoder.encode(WARMUP_PATIENT, out=np.empty((1, entry.encoder.n_features)))
+    if entry.scaler is not None:
+        entry.encoder.scale(row)
+    probabilities = entry.predictor.predict_proba(predictor_input(entry, row))
+    if probabilities.shape != (1, 2) or not np.isfinite(probabilities).all():
+        raise ValueError(f"Dry-run prediction returned {probabilities!r}; expected one row of two probabilities")
+    entry.explainer.shap_values(entry.encoder.to_frame(row))
+
+
+def init_models():
+    """
+    Startup task: loads both models and the scaler in parallel, then registers them with their
+    explainers. Raises (failing startup) if an artifact is missing, as before.
+    """
+    global lgbm_model, tuned_rf_model, scaler, trained_feature_order, feature_encoder, model_reloader
+    if not os.path.exists(scaler_path):
+        logger.error("Scaler file not found. Ensure 'scaler.pkl' is available.")
+        raise FileNotFoundError("Scaler file not found!")
+
+    try:
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="model-load") as loader:
+            lgbm_future, rf_future, scaler_future = (
+                loader.submit(joblib.load, path) for path in (lgbm_model_path, tuned_rf_model_path, scaler_path)
+            )
+            lgbm_model, tuned_rf_model, scaler = lgbm_future.result(), rf_future.result(), scaler_future.result()
+    except Exception as e:
+        logger.error("Error loading models: %s", str(e))
+        raise Exception("Error loading LightGBM or Random Forest models.") from e
     logger.info("Loaded saved StandardScaler for inference.")
-else:
-    logger.error("Scaler file not found. Ensure 'scaler.pkl' is available.")
-    raise FileNotFoundError("Scaler file not found!")
-def predict_diabetes_risk(patient_data: dict, compute_shap: bool = True):
+
+    trained_feature_order = list(getattr(tuned_rf_model, "feature_names_in_", all_features))
+    feature_encoder = FeatureEncoder(trained_feature_order, numerical_features, default_modes)
+
+    # LightGBM was trained on scaled data, the Random Forest on raw values
+    model_registry.register(build_model_entry(
+        "lightgbm", "LightGBM", lgbm_model, scaler, source=lgbm_model_path, scaler_source=scaler_path
+    ))
+    model_registry.register(build_model_entry(
+        "random_forest", "Tuned Random Forest", tuned_rf_model, source=tuned_rf_model_path
+    ))
+    model_reloader = ModelReloader(model_registry, load_model_entry, warm_model_entry, metrics=latency_metrics)
+    return {"models": model_registry.keys()}
+
+
+def route_model_key(num_provided_features: int) -> str:
+    """Feature-count routing for requests without a model: LightGBM handles sparse inputs."""
+    return "lightgbm" if num_provided_features <= 4 else "random_forest"
+
+
+def requested_model_key(requested: Optional[str]) -> Optional[str]:
+    """
+    Resolves a request's model in the serving process, so inference workers see the same
+    default; None means "route by feature count". Raises HTTPException(400) for unknown keys.
+    """
     try:
-        # Convert patient data to DataFrame
-        patient_df = pd.DataFrame([patient_data])
+        entry = model_registry.resolve(requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return entry.key if entry else None
+
+# Worker pool for CPU-bound inference/SHAP so the event loop stays responsive
+inference_executor = InferenceExecutor.from_env(metrics=latency_metrics)
+# Pool workers keep their own registry; only the shared state file tells them about reloads,
+# rollbacks and default switches, so process mode refuses to start without one
+if inference_executor.kind == "process" and not model_registry.state_path:
+    raise RuntimeError("INFERENCE_EXECUTOR=process requires MODEL_STATE_PATH (see README: Model Selection)")
+
+# Cohort SHAP batches are chunked over the same pool, a few chunks at a time (see shap_batch.py)
+shap_batch_explainer = BatchExplainer.from_env(concurrency=inference_executor.max_workers, metrics=latency_metrics)
+
+# Opt-in PNG rendering runs on one dedicated matplotlib thread with a size-bounded image cache
+shap_plot_renderer = ShapPlotRenderer(
+    lambda *args: compute_shap_plot(*args),
+    max_cache_bytes=int(os.getenv("SHAP_PLOT_CACHE_BYTES", 8 * 1024 * 1024)),
+    metrics=latency_metrics,
+)
 
-        # **Retrieve Trained Feature Order**
-        trained_feature_order = getattr(tuned_rf_model, "feature_names_in_", all_features)
-        logger.info(f"Expected feature order from trained model: {trained_feature_order}")
 
-        # **Ensure 'Glucose_BMI_Ratio' Exists If Trained With It**
-        if "Glucose_BMI_Ratio" in trained_feature_order:
-            patient_df["Glucose_BMI_Ratio"] = patient_df["Glucose"] / (patient_df["BMI"] + 1e-6)
-        else:
-            patient_df = patient_df.drop(columns=["Glucose_BMI_Ratio"], errors="ignore")
+def saturated_http_error(e: ExecutorSaturatedError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
-        # **Ensure All Expected Features Exist & Maintain Order**
-        patient_df = patient_df.reindex(columns=trained_feature_order, fill_value=0.0)
 
-        # **Select Model Based on Provided Features or MCP override**
-        num_provided_features = patient_df.notna().sum(axis=1).iloc[0]
+async def require_components(*names: str) -> None:
+    """Waits for startup components; 503 while serving early and one is still loading."""
+    try:
+        for name in names:
+            await startup.require(name)
+    except ComponentUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    inference_executor.shutdown(wait=False)
+    shap_plot_renderer.shutdown()
+    if llm_registry is not None:
+        await llm_registry.aclose()
+    await pubmed_client.aclose()
+    if model_reloader is not None:
+        model_reloader.shutdown()
+    startup.shutdown()
+    tracer.shutdown()
+    log_listener.stop()
+
+# Explanation levels for `predict_diabetes_risk`:
+#   none      -> risk label and probability only, no SHAP work at all
+#   values    -> SHAP values and base value
+#   waterfall -> SHAP values plus structured waterfall data for client-side charts
+#   plot      -> waterfall data plus a server-rendered PNG (opt-in)
+EXPLANATION_MODES = ("none", "values", "waterfall", "plot")
+ExplanationMode = Literal["none", "values", "waterfall", "plot"]
+
+
+def predict_diabetes_risk(patient_data: dict, explanation: str = "plot", model: Optional[str] = None):
+    if explanation not in EXPLANATION_MODES:
+        raise ValueError(f"Unknown explanation mode '{explanation}'. Use one of {EXPLANATION_MODES}.")
+    # Process-pool workers never run the app's startup, so they load the models on first use
+    startup.ensure("models")
+
+    try:
+        # **Encode Straight Into A NumPy Row In Training Feature Order** (see features.py)
+        with tracer.span("feature_prep"):
+            features, num_provided_features = feature_encoder.encode(patient_data)
+
+        # **Select Model: Requested Key, Then Registry Default, Then Provided Feature Count**
         logger.info(f"User-provided features count: {num_provided_features}")
 
-        if current_model_override == "lightgbm":
-            selected_model = lgbm_model
-            model_used = "LightGBM"
-            apply_scaling = True
-            logger.info("Using LightGBM (MCP override)")
-        elif current_model_override == "random_forest":
-            selected_model = tuned_rf_model
-            model_used = "Tuned Random Forest"
-            apply_scaling = False
-            logger.info("Using Tuned Random Forest (MCP override)")
+        # The entry is resolved once, so a concurrent default switch cannot change it mid-request
+        entry = model_registry.resolve(model)
+        if entry is not None:
+            logger.info(f"Using {entry.display_name} (requested or default model)")
         else:
-            if num_provided_features <= 4:
-                selected_model = lgbm_model
-                model_used = "LightGBM"
-                apply_scaling = True  # LightGBM was trained on scaled data
-                logger.info("Using LightGBM (≤4 Provided Features)")
-            else:
-                selected_model = tuned_rf_model
-                model_used = "Tuned Random Forest"
-                apply_scaling = False  # RF was trained on raw (unscaled) data
-                logger.info("Using Tuned Random Forest (≥5 Provided Features)")
+            entry = model_registry.get(route_model_key(num_provided_features))
+            logger.info(f"Using {entry.display_name} ({num_provided_features} provided features)")
+        selected_model = entry.model
+        model_used = entry.display_name
 
         # **Apply Scaling Only to Numerical Features When Needed**
-        numerical_features_for_scaling = [
-            feat for feat in trained_feature_order if feat in numerical_features
-        ]
-
-        if apply_scaling:
-            patient_df[numerical_features_for_scaling] = scaler.transform(patient_df[numerical_features_for_scaling])
+        if entry.scaler is not None:
+            entry.encoder.scale(features)
             logger.info("Applied scaling to numerical features")
         else:
             logger.info("Skipping feature scaling for Random Forest.")
 
-        # **Ensure Categorical Features Remain Integers**
-        patient_df["Gender"] = patient_df["Gender"].astype(int)
-        patient_df["Ethnicity"] = patient_df["Ethnicity"].astype(int)
-
-        # **Ensure Feature Order Matches Training**
-        patient_df = patient_df.reindex(columns=trained_feature_order, fill_value=0.0)
-        logger.info(f"Final input feature order for prediction: {patient_df.columns.tolist()}")
-
-        # **Make Prediction**
-        risk = selected_model.predict(patient_df)[0]
-        risk_probability = selected_model.predict_proba(patient_df)[:, 1][0] * 100
+        # **Make Prediction: One Pass, The Label Comes From The Probabilities**
+        with tracer.span("model_inference", model=model_used):
+            probabilities = entry.predictor.predict_proba(predictor_input(entry, features))[0]
+            risk = entry.predictor.classes_[probabilities.argmax()]
+            risk_probability = probabilities[1] * 100
 
         result = {
             "predictedRisk": "Diabetes" if risk == 1 else "No Diabetes",
             "riskProbability": f"{risk_probability:.2f}%",
-            "modelUsed": model_used
+            "modelUsed": model_used,
+            "modelKey": entry.key,
+            "modelVersion": entry.version
         }
 
-        # **Compute SHAP Values ONLY if requested**
-        shap_values, shap_base_value = compute_shap_values(selected_model, patient_df)
-        if compute_shap:
-            shap_plot_base64 = compute_shap_plot(list(shap_values.values()), shap_base_value, patient_df)
-
-            result.update({
-                "shapValues": shap_values,
-                "shapBaseValue": shap_base_value,
-                "shapPlot": shap_plot_base64
-            })
-        else:
-            result.update({
-                "shapValues": shap_values,
-                "shapBaseValue": shap_base_value,
-                "shapPlot": None
-            })
+        # **Compute SHAP Values / Plot ONLY if requested**
+        shap_values, shap_base_value, shap_waterfall, shap_plot_base64 = {}, None, None, None
+        if explanation != "none":
+            patient_df = feature_encoder.to_frame(features)
+            with tracer.span("shap_values", model=model_used):
+                shap_values, shap_base_value = compute_shap_values(selected_model, patient_df, entry.explainer)
+        if explanation in ("waterfall", "plot"):
+            shap_waterfall = build_waterfall(shap_values, shap_base_value, patient_df.iloc[0].to_dict())
+        if explanation == "plot":
+            with tracer.span("shap_plot"):
+                shap_plot_base64 = shap_plot_renderer.render(list(shap_values.values()), shap_base_value, patient_df)
+
+        result.update({
+            "shapValues": shap_values,
+            "shapBaseValue": shap_base_value,
+            "shapWaterfall": shap_waterfall,
+            "shapPlot": shap_plot_base64
+        })
 
         return result
 
@@ -312,76 +607,187 @@ def predict_diabetes_risk(patient_data: dict, compute_shap: bool = True):
             "modelUsed": "N/A",
             "shapValues": {},
             "shapBaseValue": None,
+            "shapWaterfall": None,
             "shapPlot": None,
             "error": str(e)
         }
 
 
+def predict_diabetes_risk_batch(patients: List[dict], models: Optional[List[Optional[str]]] = None) -> List[dict]:
+    """
+    Predicts diabetes risk for many patients in one pass.
+    `models` optionally names a model key per row (None entries use the default or routing).
+    Rows are grouped by the model they route to (same rules as `predict_diabetes_risk`),
+    each group runs a single `predict_proba`, and the label is taken from the probabilities.
+    Missing categorical values are filled from `default_modes` so they can be cast to int.
+    Results are returned in the same order as `patients`.
+    """
+    if not patients:
+        return []
+    startup.ensure("models")
+
+    patient_df = pd.DataFrame(patients).reset_index(drop=True)
+
+    if "Glucose_BMI_Ratio" in trained_feature_order:
+        patient_df["Glucose_BMI_Ratio"] = patient_df["Glucose"] / (patient_df["BMI"] + 1e-6)
+
+    patient_df = patient_df.reindex(columns=trained_feature_order, fill_value=0.0)
+
+    # **Route Every Row Exactly Like The Single-Patient Path**
+    default_key = model_registry.default
+    provided_counts = patient_df.notna().sum(axis=1).to_numpy()
+    model_groups: Dict[str, List[int]] = {}
+    for position, num_provided_features in enumerate(provided_counts):
+        requested = models[position] if models else None
+        key = requested or default_key or route_model_key(num_provided_features)
+        model_groups.setdefault(key, []).append(position)
+
+    numerical_features_for_scaling = [
+        feat for feat in trained_feature_order if feat in numerical_features
+    ]
+
+    results: List[dict] = [None] * len(patient_df)
+    for key, row_positions in model_groups.items():
+        model_used = key
+        try:
+            entry = model_registry.get(key)
+            model_used = entry.display_name
+            group_df = patient_df.iloc[row_positions].copy()
+
+            # **Scale Only Groups Whose Model Was Trained On Scaled Data**
+            if entry.scaler is not None:
+                group_df[numerical_features_for_scaling] = entry.scaler.transform(group_df[numerical_features_for_scaling])
+
+            for feature, default in default_modes.items():
+                if feature in group_df.columns:
+                    group_df[feature] = group_df[feature].fillna(default).astype(int)
+
+            # **One Model Pass Per Group: Labels Come From The Probabilities**
+            probabilities = entry.predictor.predict_proba(group_df)
+            labels = np.asarray(entry.predictor.classes_)[probabilities.argmax(axis=1)]
+            risk_probabilities = probabilities[:, 1] * 100
+
+            for position, label, risk_probability in zip(row_positions, labels, risk_probabilities):
+                results[position] = {
+                    "predictedRisk": "Diabetes" if label == 1 else "No Diabetes",
+                    "riskProbability": f"{risk_probability:.2f}%",
+                    "modelUsed": model_used,
+                    "modelKey": entry.key,
+                    "modelVersion": entry.version
+                }
+            logger.info(f"Batch prediction: {len(row_positions)} patient(s) scored with {model_used}")
+
+        except Exception as e:
+            logger.error(f"Batch prediction error for {model_used} group: {str(e)}")
+            for position in row_positions:
+                results[position] = {
+                    "predictedRisk": "Error",
+                    "riskProbability": "N/A",
+                    "modelUsed": "N/A",
+                    "error": str(e)
+                }
+
+    return results
+
+
 from fastapi.encoders import jsonable_encoder
 
 
 @app.post("/predict")
-async def predict(patient: PatientData):
+async def predict(patient: PatientData, explanation: ExplanationMode = "waterfall"):
+    await require_components("models")
+    model_key = requested_model_key(patient.model)
     try:
         # Exclude PatientName from numeric conversion
-        patient_data = {
-            k: float(v) if k != "PatientName" and str(v).strip() else np.nan 
-            for k, v in patient.model_dump().items()
-        }
+        patient_data = patient_features(patient)
 
-        logger.info(f"Received prediction request for patient: {patient.PatientName}")
+        logger.info(f"Received prediction request for {patient_ref(patient.PatientName)}")
 
-        result = predict_diabetes_risk(patient_data, compute_shap=True)
-        logger.info(f"Prediction result for {patient.PatientName}: {result}")
+        with tracer.span("predict_request", explanation=explanation), latency_metrics.timer(f"predict_explanation_{explanation}"):
+            result = await inference_executor.run(
+                "predict", predict_diabetes_risk, patient_data, explanation=explanation, model=model_key
+            )
+        logger.info(
+            f"Prediction for {patient_ref(patient.PatientName)}: {result['predictedRisk']} "
+            f"({result['riskProbability']}, {result['modelUsed']})"
+        )
+        logger.debug(f"Full prediction result: {result}")
 
         return result
 
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting prediction request for {patient_ref(patient.PatientName)}: {str(e)}")
+        raise saturated_http_error(e)
     except Exception as e:
-        logger.error(f"Error processing request for {patient.PatientName}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))  
-        
-def compute_shap_values(model, patient_df):
+        logger.error(f"Error processing request for {patient_ref(patient.PatientName)}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/predict/batch")
+async def predict_batch(patients: List[PatientData]):
+    await require_components("models")
+    model_keys = [requested_model_key(patient.model) for patient in patients]
     try:
-        # Extract model from pipeline if needed
-        if isinstance(model, Pipeline):
-            logger.info("Extracting classifier from pipeline for SHAP analysis...")
-            model = model.named_steps['clf']
-
-        # Initialize SHAP Explainer
-        explainer = shap.TreeExplainer(model)
-        shap_values = explainer.shap_values(patient_df)
-
-        #  Debugging Logs
-        logger.info(f"Raw SHAP values type: {type(shap_values)}")
-        logger.info(f"SHAP values shape (before processing): {np.array(shap_values).shape}")
-        logger.info(f"SHAP expected value type: {type(explainer.expected_value)}")
-
-        # Handle Multi-Class Output (Fix for Random Forest)
-        if isinstance(shap_values, list) and len(shap_values) == 2:  
-            logger.info("Detected binary classification model with two SHAP value outputs.")
-            shap_value_for_class_1 = shap_values[1]  # Extract SHAP values for Class 1 (Diabetes)
-            shap_base_value = explainer.expected_value[1]  # Extract base value for Class 1
-        else:
-            logger.info("Detected model returning a single SHAP value array.")
-            shap_value_for_class_1 = shap_values
-            shap_base_value = explainer.expected_value
+        patient_rows = [
+            {
+                k: float(v) if str(v).strip() else np.nan
+                for k, v in patient.model_dump(exclude={"PatientName", "model"}).items()
+            }
+            for patient in patients
+        ]
+
+        logger.info(f"Received batch prediction request for {len(patient_rows)} patient(s)")
+
+        results = await inference_executor.run("predict_batch", predict_diabetes_risk_batch, patient_rows, model_keys)
+
+        return [
+            {"PatientName": patient.PatientName, **result}
+            for patient, result in zip(patients, results)
+        ]
+
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting batch prediction request: {str(e)}")
+        raise saturated_http_error(e)
+    except Exception as e:
+        logger.error(f"Error processing batch prediction request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class ShapBatchRequest(BaseModel):
+    # Column names for `rows` (any of Glucose, BMI, Age, BloodPressure, Gender, Ethnicity); null = blank
+    features: List[str]
+    rows: List[List[Optional[float]]]
+    model: Optional[str] = None
+
+
+@app.post("/explain/batch")
+async def explain_batch(request: ShapBatchRequest, encoding: Literal["base64", "json"] = "base64"):
+    await require_components("models")
+    try:
+        logger.info(f"Received SHAP batch request for {len(request.rows)} patient(s)")
+        return await explain_shap_batch(request.features, request.rows, request.model, encoding)
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting SHAP batch request: {str(e)}")
+        raise saturated_http_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error processing SHAP batch request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        #  Handle Multi-Output SHAP (Fix for RF)
-        if isinstance(shap_value_for_class_1, np.ndarray) and len(shap_value_for_class_1.shape) > 2:
-            logger.info("Multi-output detected! Selecting second class (diabetes).")
-            shap_value_for_class_1 = shap_value_for_class_1[:, :, 1]  # Select **Class 1 contributions**
 
-        #  Extract Correct SHAP Base Value
-        if isinstance(shap_base_value, np.ndarray):  
-            logger.info(f"SHAP Base Value Array Detected: {shap_base_value}")
-            shap_base_value = float(shap_base_value[1])  # Use **second index for Class 1**
+def compute_shap_values(model, patient_df, explainer=None):
+    try:
+        # Reuse the explainer prebuilt with the model entry (pipelines are unwrapped there)
+        explainer = explainer or explainer_registry.get(model)
+        shap_value_for_class_1, shap_base_value = class1_shap_values(explainer, patient_df)
 
         # Convert SHAP values to dictionary mapping feature names
         shap_values_dict = {feature: float(value) for feature, value in zip(patient_df.columns, shap_value_for_class_1[0])}
 
         #  Debugging: Log final values
-        logger.info(f"Processed SHAP values mapping: {shap_values_dict}")
-        logger.info(f"Final SHAP Base Value: {shap_base_value}")
+        logger.debug(f"Processed SHAP values mapping: {shap_values_dict}")
+        logger.debug(f"Final SHAP Base Value: {shap_base_value}")
 
         return shap_values_dict, shap_base_value
     except Exception as e:
@@ -389,11 +795,66 @@ def compute_shap_values(model, patient_df):
         return {}, None  # Prevents pipeline failure        
 
 
+def shap_chunk(explainer, rows: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Inference-pool job: class-1 SHAP values (float32) for encoded rows."""
+    values, base_value = class1_shap_values(explainer, rows)
+    return values.astype(np.float32), base_value
+
+
+def explain_shap_chunk(key: str, spec: dict, rows: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Process-pool job: `shap_chunk` with this worker's entry for the version in `spec`."""
+    # Process-pool workers never run the app's startup, so they load the models on first use
+    startup.ensure("models")
+    # **Explain With The Version The Serving Process Resolved, Loaded Privately If Needed**
+    entry = model_reloader.ensure(key, spec)
+    return shap_chunk(entry.explainer, rows)
+
+
+async def explain_shap_batch(columns: List[str], rows, model: Optional[str] = None,
+                             encoding: str = "base64") -> dict:
+    """
+    Class-1 SHAP values for a matrix of patients (one row per patient, one value per name in
+    `columns`) as one feature x patient float32 array (see shap_batch.py). The whole batch
+    uses one model: `model`, else the default, else feature-count routing on `columns`.
+    Raises ValueError for bad input, ExecutorSaturatedError when the pool is full.
+    """
+    entry = model_registry.resolve(model)
+    if entry is None:
+        entry = model_registry.get(route_model_key(len(columns)))
+    if entry.explainer is None:
+        raise ValueError(f"No SHAP explainer is available for '{entry.key}'")
+
+    with tracer.span("feature_prep"):
+        matrix = entry.encoder.encode_matrix(columns, rows)
+        if entry.scaler is not None:
+            entry.encoder.scale(matrix)
+
+    async def run_chunk(chunk: np.ndarray):
+        if inference_executor.kind == "process":
+            return await inference_executor.run("shap_batch", explain_shap_chunk, entry.key, entry.spec(), chunk)
+        # Threads share the resolved entry, so a reload mid-batch does not affect it
+        return await inference_executor.run("shap_batch", shap_chunk, entry.explainer, chunk)
+
+    with tracer.span("shap_batch", model=entry.display_name):
+        values, base_value = await shap_batch_explainer.explain(matrix, run_chunk)
+    return {
+        "modelUsed": entry.display_name,
+        "modelKey": entry.key,
+        "modelVersion": entry.version,
+        **columnar_result(values, base_value, entry.encoder.feature_order, encoding),
+    }
+
+
 def compute_shap_plot(shap_values, shap_base_value, patient_df):
     """
     Generates a SHAP Waterfall plot and returns it as a base64 string.
     Ensures compatibility with LightGBM & Random Forest models.
     """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import shap
+
     try:
         # **Convert list of shap values to NumPy array**
         shap_values_array = np.array(shap_values).reshape(1, -1)
@@ -425,62 +886,106 @@ def compute_shap_plot(shap_values, shap_base_value, patient_df):
        
 
 
-# Middleware to log requests and prevent response stream errors
+# One compact, sampled access-log line per request; bodies only with ACCESS_LOG_BODIES=1 (redacted)
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
+    body = None
+    if access_log.log_bodies and request.method in ["POST", "PUT", "PATCH"]:
+        body = await request.body()
+
+    start = time.perf_counter()
+    status = 500
     try:
-        if request.method in ["POST", "PUT", "PATCH"]:
-            body = await request.body()
-            if body:
-                json_body = json.loads(body.decode("utf-8"))
-                logger.info(f"Incoming request to {request.url.path} with body: {json.dumps(json_body, indent=2)}")
-        else:
-            logger.info(f"Incoming {request.method} request to {request.url.path}")
-    except Exception as e:
-        logger.error(f"Error logging request: {str(e)}")
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        span = Tracer.current()
+        access_log.record(
+            request.method,
+            route.path if route is not None else request.url.path,
+            status,
+            (time.perf_counter() - start) * 1000,
+            span.trace_id if span else None,
+            body,
+        )
 
-    response = await call_next(request)
-    return response
 
+# Root span per request; named after the matched route so histogram labels stay bounded
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with tracer.span("http_request", kind="server", **{"http.method": request.method}) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
 
-# Initialize OpenAI model with API Key
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise Exception("Missing OpenAI API key. Set OPENAI_API_KEY in environment variables.")
 
-llm = ChatOpenAI(temperature=0.4, openai_api_key=openai_api_key)
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Span duration histograms in Prometheus text format."""
+    return PlainTextResponse(span_histograms.render(), media_type="text/plain; version=0.0.4")
 
 
-# Biomedical Evidence Fetching Function
-def get_biomedical_evidence(patient_data):
+
+# PubMed literature evidence for the expert prompts (see pubmed.py). Off unless PUBMED_EVIDENCE=1,
+# since the search terms are derived from patient data and sent to NCBI
+pubmed_client = PubMedClient.from_env()
+use_pubmed_evidence = os.getenv("PUBMED_EVIDENCE", "0") != "0"
+no_literature_text = "No recent literature retrieved."
+
+
+def build_pubmed_query(patient_data):
+    """
+    PubMed search terms for a patient. Glucose and BMI are reduced to clinical bands, so
+    the few possible queries repeat across patients (and hit the query cache) and exact
+    values are never sent.
+    """
     query_parts = ["diabetes treatment"]
-    if patient_data.get("Glucose"):
-        query_parts.append(f"glucose {patient_data['Glucose']}")
-    if patient_data.get("BMI"):
-        query_parts.append(f"BMI {patient_data['BMI']}")
-    
-    query = " ".join(query_parts)
-    logger.info(f" Searching PubMed for: {query}")
+    glucose, bmi = patient_data.get("Glucose"), patient_data.get("BMI")
+    if glucose and not pd.isna(glucose):
+        if glucose >= 126:
+            query_parts.append("hyperglycemia")
+        elif glucose >= 100:
+            query_parts.append("prediabetes")
+    if bmi and not pd.isna(bmi):
+        if bmi >= 30:
+            query_parts.append("obesity")
+        elif bmi >= 25:
+            query_parts.append("overweight")
+    return " ".join(query_parts)
 
-    pubmed_url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=pubmed&term={query}&retmax=5&retmode=json"
-    response = requests.get(pubmed_url).json()
-    pubmed_ids = response.get("esearchresult", {}).get("idlist", [])
 
-    evidence = []
-    for pmid in pubmed_ids:
-        detail_url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=pubmed&id={pmid}&retmode=json"
-        detail_response = requests.get(detail_url).json()
-        title = detail_response.get("result", {}).get(pmid, {}).get("title", "No title found")
-        evidence.append(title)
+# Biomedical Evidence Fetching Function
+async def get_biomedical_evidence(patient_data):
+    query = build_pubmed_query(patient_data)
+    # The terms are derived from patient data, so they are only logged at DEBUG
+    logger.info("Searching PubMed for literature evidence")
+    logger.debug(f"PubMed query: {query}")
 
-    logger.info(f"📄 Extracted Biomedical Evidence: {evidence}")
+    articles = await pubmed_client.search(query)
+    evidence = [article["title"] for article in articles]
+
+    logger.debug(f"📄 Extracted Biomedical Evidence: {evidence}")
     return evidence
 
 
+async def get_literature_evidence(patient_data, deadline):
+    """PubMed titles formatted for the expert prompts, run as the "pubmed" pipeline node."""
+    async def fetch():
+        titles = await get_biomedical_evidence(patient_data)
+        return "\n".join(f"- {title}" for title in titles) or no_literature_text
 
+    result = await pipeline_scheduler.run_node("pubmed", fetch, lambda: no_literature_text, deadline)
+    return result.value
 
-def create_dynamic_context(patient_data, risk_result, guideline_evidence):
-    return (
+
+def create_dynamic_context(patient_data, risk_result, guideline_evidence, literature_evidence=None):
+    context = (
         f"**Patient Details:**\n"
         f"- Age: {patient_data.get('Age', 'Unknown')}\n"
         f"- BMI: {patient_data.get('BMI', 'Unknown')}\n"
@@ -489,92 +994,170 @@ def create_dynamic_context(patient_data, risk_result, guideline_evidence):
         f"({risk_result.get('riskProbability', 'N/A')})\n\n"
         "**Relevant Clinical Guidelines (FAISS Retrieval):**\n" + guideline_evidence
     )
+    if literature_evidence:
+        context += "\n\n**Recent Literature (PubMed):**\n" + literature_evidence
+    return context
+
+# Expert prompts; their chains are built once by `init_llm_clients` and shared across requests
+expert_prompt_specs = {
+    "Endocrinologist": dict(
+        input_variables=['patient', 'context', 'risk_result'],
+        template=(
+            "As an endocrinologist, provide a diabetes treatment plan.\n"
+            "Patient Data: {patient}\n\n"
+            "Risk Result: {risk_result}\n\n"
+            "Based on the following clinical guidelines:\n{context}\n\n"
+            "Provide a structured treatment plan."
+            "Respond in markup format"
+        )
+    ),
+    "Dietitian": dict(
+        input_variables=['patient', 'context', 'risk_result'],
+        template=(
+            "As a dietitian, create a meal plan for the following patient:\n"
+            "Patient Data: {patient}\n\n"
+            "Risk Result: {risk_result}\n\n"
+            "Based on the following dietitian guidelines:\n{context}\n\n"
+            "Provide structured dietary recommendations."
+            "Respond in markup format"
+        )
+    ),
+    "Fitness Expert": dict(
+        input_variables=['patient', 'context', 'risk_result'],
+        template=(
+            "As a fitness expert, create a weekly exercise plan:\n"
+            "Patient Data: {patient}\n\n"
+            "Risk Result: {risk_result}\n\n"
+            "Based on the following exercise guidelines:\n{context}\n\n"
+            "Provide structured exercise recommendations."
+            "Respond in markup format"                
+        )
+    )
+}
 
-async def get_expert_recommendations(patient_data, risk_result):
-    guideline_evidence = {
-        "Endocrinology": get_guideline_evidence(patient_data, risk_result, "Endocrinology"),
-        "Dietitian": get_guideline_evidence(patient_data, risk_result, "Dietitian"),
-        "Exercise": get_guideline_evidence(patient_data, risk_result, "Exercise")
-    }
+expert_names = ["Endocrinologist", "Dietitian", "Fitness Expert"]
 
-    context = create_dynamic_context(patient_data, risk_result, "\n".join(guideline_evidence.values()))
-
-    expert_prompts = {
-        "Endocrinologist": PromptTemplate(
-            input_variables=['patient', 'context', 'risk_result'],
-            template=(
-                "As an endocrinologist, provide a diabetes treatment plan.\n"
-                "Patient Data: {patient}\n\n"
-                "Risk Result: {risk_result}\n\n"
-                "Based on the following clinical guidelines:\n{context}\n\n"
-                "Provide a structured treatment plan."
-                "Respond in markup format"
-            )
-        ),
-        "Dietitian": PromptTemplate(
-            input_variables=['patient', 'context', 'risk_result'],
-            template=(
-                "As a dietitian, create a meal plan for the following patient:\n"
-                "Patient Data: {patient}\n\n"
-                "Risk Result: {risk_result}\n\n"
-                "Based on the following dietitian guidelines:\n{context}\n\n"
-                "Provide structured dietary recommendations."
-                "Respond in markup format"
-            )
-        ),
-        "Fitness Expert": PromptTemplate(
-            input_variables=['patient', 'context', 'risk_result'],
-            template=(
-                "As a fitness expert, create a weekly exercise plan:\n"
-                "Patient Data: {patient}\n\n"
-                "Risk Result: {risk_result}\n\n"
-                "Based on the following exercise guidelines:\n{context}\n\n"
-                "Provide structured exercise recommendations."
-                "Respond in markup format"                
-            )
+# Guideline category shown in place of an expert's answer when that expert is unavailable
+expert_guideline_categories = {
+    "Endocrinologist": "Endocrinology",
+    "Dietitian": "Dietitian",
+    "Fitness Expert": "Exercise",
+}
+
+# Timeouts, circuit breakers and the global deadline for the recommendation DAG (see pipeline.py)
+pipeline_scheduler = PipelineScheduler.from_env(
+    expert_names, "meta_agent", metrics=latency_metrics, tracer=tracer,
+    extra_timeouts={"pubmed": float(os.getenv("PUBMED_TIMEOUT", 5))},
+)
+
+
+def degraded_expert_recommendation(expert, guideline_evidence):
+    """Answer used when an expert times out, fails or has an open circuit breaker."""
+    evidence = guideline_evidence.get(expert_guideline_categories[expert], no_guidelines_text)
+    return (
+        f"**The {expert} recommendation is temporarily unavailable.**\n\n"
+        f"Relevant clinical guidelines:\n{evidence}"
+    )
+
+
+async def iter_expert_recommendations(patient_data, risk_result, deadline=None):
+    """
+    Yields one `NodeResult` per expert in completion order, as soon as each specialist's
+    LLM call finishes or is replaced by its degraded answer. Pending calls are cancelled
+    if the consumer stops early. Answers built on failed guideline retrieval are marked
+    "partial", so they are served but not cached. Missing PubMed literature is only
+    supplementary and does not count.
+    """
+    deadline = deadline or pipeline_scheduler.deadline()
+    # Guidelines and PubMed literature are independent, so they are fetched concurrently
+    if use_pubmed_evidence:
+        guideline_evidence, literature_evidence = await asyncio.gather(
+            get_all_guideline_evidence(patient_data, risk_result, deadline),
+            get_literature_evidence(patient_data, deadline),
+        )
+    else:
+        guideline_evidence = await get_all_guideline_evidence(patient_data, risk_result, deadline)
+        literature_evidence = None
+    evidence_degraded = guideline_error_text in guideline_evidence.values()
+
+    context = create_dynamic_context(
+        patient_data, risk_result, "\n".join(guideline_evidence.values()), literature_evidence
+    )
+
+    def expert_call(expert_chain):
+        return lambda: expert_chain.arun(
+            patient=str(patient_data),
+            context=context,
+            risk_result=str(risk_result)
         )
+
+    calls = {expert: expert_call(chain) for expert, chain in expert_chains.items()}
+    fallbacks = {
+        expert: (lambda expert=expert: degraded_expert_recommendation(expert, guideline_evidence))
+        for expert in expert_chains
     }
+    async for result in pipeline_scheduler.iter_nodes(calls, fallbacks, deadline):
+        if evidence_degraded and not result.degraded:
+            result.status = "partial"
+        yield result
 
-    llm = ChatOpenAI(model_name="gpt-4", temperature=0.3)
 
-    async def fetch_recommendation(expert, prompt):
-        try:
-            expert_chain = LLMChain(llm=llm, prompt=prompt)
-            return expert, await expert_chain.arun(
-                patient=str(patient_data),
-                context=context,
-                risk_result=str(risk_result)
-            )
-        except Exception as e:
-            logger.error(f" Error in LLM chain for {expert}: {str(e)}")
-            return expert, "Error generating recommendation."
+async def get_expert_recommendations(patient_data, risk_result, deadline=None):
+    """Returns `{expert: NodeResult}` in `expert_names` order."""
+    results = {result.node: result async for result in iter_expert_recommendations(patient_data, risk_result, deadline)}
+
+    expert_results = {expert: results[expert] for expert in expert_names if expert in results}
+    expert_recommendations = {expert: result.value for expert, result in expert_results.items()}
+    statuses = {expert: result.status for expert, result in expert_results.items()}
+    logger.info(f" Expert recommendations ready: {statuses}")
+    logger.debug(f" Expert Recommendations: {expert_recommendations}")
+    return expert_results
+
+
+meta_agent_prompt_spec = dict(
+    input_variables=['endocrinologist', 'dietitian', 'fitness', 'patient', 'risk_result'],
+    template=(
+        "You are a healthcare consultant consolidating expert recommendations.\n"
+        "Patient Data: {patient}\n\n"
+        "Risk Result: {risk_result}\n\n"
+        "**Expert Recommendations:**\n\n"
+        "**Endocrinologist Recommendation:**\n{endocrinologist}\n\n"
+        "**Dietitian Recommendation:**\n{dietitian}\n\n"
+        "**Fitness Expert Recommendation:**\n{fitness}\n\n"
+        "First explain the patients SHAP values and meaning and then create integrated final health plan summarizing all recommendations."
+        "Respond in markup format"            
+    )
+)
+
+
+def degraded_final_recommendation(expert_recommendations):
+    """Used when the meta-agent is unavailable: the specialists' plans, unconsolidated."""
+    sections = "\n\n".join(
+        f"### {expert}\n{expert_recommendations.get(expert, 'No data')}" for expert in expert_names
+    )
+    return f"**A consolidated plan is temporarily unavailable. Individual specialist plans:**\n\n{sections}"
+
 
-    results = await asyncio.gather(*[fetch_recommendation(expert, prompt) for expert, prompt in expert_prompts.items()])
-    
-    expert_recommendations = {expert: recommendation for expert, recommendation in results}
-    logger.info(f" Expert Recommendations: {expert_recommendations}")
-    return expert_recommendations    
-              
 # Generate Final Consolidated Recommendation
-async def get_final_recommendation(patient_data, expert_recommendations, risk_result):
-    meta_agent_prompt = PromptTemplate(
-        input_variables=['endocrinologist', 'dietitian', 'fitness', 'patient', 'risk_result'],
-        template=(
-            "You are a healthcare consultant consolidating expert recommendations.\n"
-            "Patient Data: {patient}\n\n"
-            "Risk Result: {risk_result}\n\n"
-            "**Expert Recommendations:**\n\n"
-            "**Endocrinologist Recommendation:**\n{endocrinologist}\n\n"
-            "**Dietitian Recommendation:**\n{dietitian}\n\n"
-            "**Fitness Expert Recommendation:**\n{fitness}\n\n"
-            "First explain the patients SHAP values and meaning and then create integrated final health plan summarizing all recommendations."
-            "Respond in markup format"            
-        )
+async def get_final_recommendation(patient_data, expert_recommendations, risk_result, deadline=None):
+    """Runs the meta-agent under the pipeline deadline and returns its `NodeResult`."""
+    return await pipeline_scheduler.run_node(
+        "meta_agent",
+        lambda: meta_agent_chain.arun(
+            endocrinologist=expert_recommendations["Endocrinologist"],
+            dietitian=expert_recommendations["Dietitian"],
+            fitness=expert_recommendations["Fitness Expert"],
+            patient=str(patient_data),
+            risk_result=str(risk_result)
+        ),
+        lambda: degraded_final_recommendation(expert_recommendations),
+        deadline or pipeline_scheduler.deadline(),
     )
 
-    meta_agent_chain = LLMChain(llm=llm, prompt=meta_agent_prompt)
 
-    final_recommendation = await meta_agent_chain.arun(
+async def stream_final_recommendation(patient_data, expert_recommendations, risk_result, deadline=None):
+    """Yields the meta-agent's consolidated recommendation as `NodeResult` chunks, token by token."""
+    prompt_text = meta_agent_prompt.format(
         endocrinologist=expert_recommendations["Endocrinologist"],
         dietitian=expert_recommendations["Dietitian"],
         fitness=expert_recommendations["Fitness Expert"],
@@ -582,49 +1165,239 @@ async def get_final_recommendation(patient_data, expert_recommendations, risk_re
         risk_result=str(risk_result)
     )
 
-    return final_recommendation
+    async def tokens():
+        async for chunk in llm.astream(prompt_text):
+            if chunk.content:
+                yield chunk.content
+
+    async for result in pipeline_scheduler.stream_node(
+        "meta_agent", tokens, lambda: degraded_final_recommendation(expert_recommendations),
+        deadline or pipeline_scheduler.deadline(),
+    ):
+        yield result
+
+
+def sse_event(event, data):
+    """Formats one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Response keys used by `/recommendations` for each expert
+expert_response_keys = {
+    "Endocrinologist": "endocrinologistRecommendation",
+    "Dietitian": "dietitianRecommendation",
+    "Fitness Expert": "fitnessRecommendation",
+}
+
+# Repeat and near-identical profiles reuse the expert and meta-agent answers (see recommendation_cache.py)
+recommendation_cache = RecommendationCache.from_env()
+failed_recommendation_texts = {"Error generating recommendation.", "No recommendations available.", "No data"}
+
+
+def is_cacheable_recommendation(risk_result, response):
+    """Failed predictions and expert errors are never cached, so the next request retries them."""
+    if "Error" in str(risk_result.get("predictedRisk", "")):
+        return False
+    return not any(value in failed_recommendation_texts for value in response.values())
+
+
+async def generate_recommendations(cleaned_patient_data, risk_result, explanation="values"):
+    """Runs the expert and meta-agent calls, or returns the cached answer for this profile."""
+    cache_key = recommendation_cache.key(cleaned_patient_data, risk_result, explanation)
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Recommendation cache hit, skipping expert and meta-agent calls.")
+        return cached
+
+    deadline = pipeline_scheduler.deadline()
+    expert_results = await get_expert_recommendations(cleaned_patient_data, risk_result, deadline)
+    expert_recommendations = {expert: result.value for expert, result in expert_results.items()}
+
+    # Log FAISS retrieval issues explicitly
+    if not expert_recommendations:
+        logger.warning("Expert recommendations returned None or empty.")
+        expert_recommendations = {expert: "No recommendations available." for expert in expert_names}
+
+    final_result = await get_final_recommendation(cleaned_patient_data, expert_recommendations, risk_result, deadline)
+
+    response = {
+        key: expert_recommendations.get(expert, "No data")
+        for expert, key in expert_response_keys.items()
+    }
+    response["finalRecommendation"] = final_result.value
+
+    degraded = final_result.degraded or any(result.degraded for result in expert_results.values())
+    if not degraded and is_cacheable_recommendation(risk_result, response):
+        recommendation_cache.set(cache_key, response)
+    return response
 
 
 @app.post("/recommendations")
-async def get_recommendations(patient: PatientData):
+async def get_recommendations(patient: PatientData, explanation: ExplanationMode = "values"):
+    await require_components("models", "faiss", "llm")
+    model_key = requested_model_key(patient.model)
     try:
         # Exclude PatientName from numerical conversion
-        patient_data = {
-            k: float(v) if k != "PatientName" and str(v).strip() else np.nan 
-            for k, v in patient.model_dump().items()
-        }
+        patient_data = patient_features(patient)
 
-        logger.info(f"Received recommendation request for patient: {patient.PatientName}")
+        logger.info(f"Received recommendation request for {patient_ref(patient.PatientName)}")
 
-        risk_result = predict_diabetes_risk(patient_data, compute_shap=False)
-        logger.info(f"Risk Prediction for {patient.PatientName}: {risk_result}")
+        # The meta-agent prompt explains SHAP values, so "values" is the default;
+        # callers that only need the label can pass explanation=none.
+        risk_result = await inference_executor.run(
+            "predict", predict_diabetes_risk, patient_data, explanation=explanation, model=model_key
+        )
+        logger.info(
+            f"Risk prediction for {patient_ref(patient.PatientName)}: {risk_result['predictedRisk']} "
+            f"({risk_result['riskProbability']})"
+        )
 
         # **Convert Categorical Variables to Strings AFTER Prediction**
         cleaned_patient_data = convert_categorical_values(patient_data)
 
-        expert_recommendations = await get_expert_recommendations(cleaned_patient_data, risk_result)
+        response = await generate_recommendations(cleaned_patient_data, risk_result, explanation)
+        response["sessionId"] = create_chat_session(patient, risk_result, response)
+        return response
+
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting recommendation request for {patient_ref(patient.PatientName)}: {str(e)}")
+        raise saturated_http_error(e)
+    except Exception as e:
+        logger.error(f"Error processing recommendations for {patient_ref(patient.PatientName)}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/recommendations/stream")
+async def stream_recommendations(patient: PatientData, explanation: ExplanationMode = "values"):
+    """
+    Server-sent events variant of `/recommendations`:
+      risk        -> the risk prediction
+      expert      -> one event per specialist, as soon as that specialist finishes
+      final_token -> the consolidated recommendation, token by token
+      done        -> the same payload `/recommendations` returns
+      error       -> emitted instead of `done` if the pipeline fails
+    """
+    await require_components("models", "faiss", "llm")
+    model_key = requested_model_key(patient.model)
+    patient_data = patient_features(patient)
+
+    logger.info(f"Received streaming recommendation request for {patient_ref(patient.PatientName)}")
 
-        # Log FAISS retrieval issues explicitly
-        if not expert_recommendations:
-            logger.warning("Expert recommendations returned None or empty.")
-            expert_recommendations = {
-                "Endocrinologist": "No recommendations available.",
-                "Dietitian": "No recommendations available.",
-                "Fitness Expert": "No recommendations available."
+    try:
+        risk_result = await inference_executor.run(
+            "predict", predict_diabetes_risk, patient_data, explanation=explanation, model=model_key
+        )
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting streaming recommendation request for {patient_ref(patient.PatientName)}: {str(e)}")
+        raise saturated_http_error(e)
+
+    async def event_stream():
+        try:
+            yield sse_event("risk", risk_result)
+
+            cleaned_patient_data = convert_categorical_values(patient_data)
+
+            cache_key = recommendation_cache.key(cleaned_patient_data, risk_result, explanation)
+            cached = recommendation_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Recommendation cache hit, skipping expert and meta-agent calls.")
+                for expert, key in expert_response_keys.items():
+                    yield sse_event("expert", {"expert": expert, "key": key, "recommendation": cached[key]})
+                yield sse_event("final_token", {"token": cached["finalRecommendation"]})
+                cached["sessionId"] = create_chat_session(patient, risk_result, cached)
+                yield sse_event("done", cached)
+                return
+
+            deadline = pipeline_scheduler.deadline()
+            expert_recommendations = {}
+            degraded = False
+            async for result in iter_expert_recommendations(cleaned_patient_data, risk_result, deadline):
+                expert_recommendations[result.node] = result.value
+                degraded = degraded or result.degraded
+                yield sse_event("expert", {
+                    "expert": result.node,
+                    "key": expert_response_keys[result.node],
+                    "recommendation": result.value
+                })
+
+            if not expert_recommendations:
+                logger.warning("Expert recommendations returned None or empty.")
+                expert_recommendations = {expert: "No recommendations available." for expert in expert_names}
+
+            final_tokens = []
+            async for result in stream_final_recommendation(patient_data, expert_recommendations, risk_result, deadline):
+                final_tokens.append(result.value)
+                degraded = degraded or result.degraded
+                yield sse_event("final_token", {"token": result.value})
+
+            response = {
+                key: expert_recommendations.get(expert, "No data")
+                for expert, key in expert_response_keys.items()
             }
+            response["finalRecommendation"] = "".join(final_tokens)
+            if not degraded and is_cacheable_recommendation(risk_result, response):
+                recommendation_cache.set(cache_key, response)
+            response = dict(response)
+            response["sessionId"] = create_chat_session(patient, risk_result, response)
+            yield sse_event("done", response)
 
-        final_recommendation = await get_final_recommendation(patient_data, expert_recommendations, risk_result)
+        except Exception as e:
+            logger.error(f"Error streaming recommendations for {patient_ref(patient.PatientName)}: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class ModelReloadRequest(BaseModel):
+    path: str
+    scaler_path: Optional[str] = None
+    version: Optional[str] = None
+    name: Optional[str] = None
+    # Wait for load, warm-up and swap instead of returning as soon as the reload is queued
+    wait: bool = False
+
+
+async def reload_model(key: str, spec: dict, wait: bool = False) -> dict:
+    """
+    Queues a background reload of `key`; with `wait`, returns once it is swapped in (or raises).
+    Raises ValueError for unknown keys, so a typo cannot register (and publish) a new model.
+    """
+    model_registry.get(key)
+    artifact_path(spec["path"])
+    future = model_reloader.submit(key, spec)
+    if wait:
+        await asyncio.wrap_future(future)
+    return model_reloader.status()[key]
+
+
+@app.get("/admin/models")
+async def admin_models():
+    await require_components("models")
+    return {**model_registry.stats(), "reloads": model_reloader.status()}
 
-        return {
-            "endocrinologistRecommendation": expert_recommendations.get("Endocrinologist", "No data"),
-            "dietitianRecommendation": expert_recommendations.get("Dietitian", "No data"),
-            "fitnessRecommendation": expert_recommendations.get("Fitness Expert", "No data"),
-            "finalRecommendation": final_recommendation
-        }
 
+@app.post("/admin/models/{key}/reload", status_code=202)
+async def admin_reload_model(key: str, request: ModelReloadRequest):
+    await require_components("models")
+    try:
+        return await reload_model(key, request.model_dump(exclude={"wait"}), wait=request.wait)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing recommendations for {patient.PatientName}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Reload failed, previous version still serving: {str(e)}")
+
+
+@app.post("/admin/models/{key}/rollback")
+async def admin_rollback_model(key: str):
+    await require_components("models")
+    try:
+        return model_reloader.rollback(key).describe()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/mcp", response_model=MCPResponse)
@@ -632,68 +1405,257 @@ async def mcp_endpoint(request: MCPRequest):
     try:
         data = await handle_mcp_action(request.action, request.parameters)
         return MCPResponse(status="ok", data=data)
+    except ExecutorSaturatedError as e:
+        raise saturated_http_error(e)
+    except ComponentUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         return MCPResponse(status="error", error=str(e))
 
 
+# Enforcing System Prompt to Restrict Responses to Diabetes
+chat_system_prompt = (
+    "SYSTEM: You are a medical AI assistant strictly focused on Diabetes. "
+    "Do not answer questions unrelated to Diabetes, even if asked. "
+    "If a question is outside this scope, politely refuse to answer.\n\n"
+)
+
+
+def format_chat_history(history):
+    return "\n".join(
+        [f"**{msg['role'].capitalize()}**: {msg['content']}" for msg in history]
+    )
+
+
+# Rolling summary of chat turns that fall out of the verbatim window
+history_summary_prompt_spec = dict(
+    input_variables=['summary', 'messages'],
+    template=(
+        "You are summarizing an ongoing conversation between a patient and a diabetes assistant.\n\n"
+        "**Summary So Far:**\n{summary}\n\n"
+        "**New Messages:**\n{messages}\n\n"
+        "Update the summary to include the new messages. Keep medical facts, the patient's questions "
+        "and any advice given. Respond with the summary only, in at most 200 words."
+    )
+)
+
+
+def init_llm_clients():
+    """
+    Startup task: OpenAI clients (sharing one pooled HTTP client, see llm_registry.py),
+    prompts and chains. langchain is first imported here.
+    """
+    global llm_registry, llm, expert_llm, chat_prompt, chat_chain, expert_chains
+    global meta_agent_prompt, meta_agent_chain, history_summary_chain
+    if not openai_api_key:
+        raise Exception("Missing OpenAI API key. Set OPENAI_API_KEY in environment variables.")
+    from langchain.prompts import PromptTemplate
+    from llm_registry import LLMClientRegistry
+
+    registry = LLMClientRegistry.from_env(api_key=openai_api_key)
+    llm = registry.client("default", temperature=0.4)
+    expert_llm = registry.client("expert", model_name="gpt-4", temperature=0.3)
+
+    chat_prompt = PromptTemplate(**chat_prompt_spec)
+    chat_chain = registry.chain("chat", llm, chat_prompt)
+    expert_chains = {
+        expert: registry.chain(f"expert:{expert}", expert_llm, PromptTemplate(**spec))
+        for expert, spec in expert_prompt_specs.items()
+    }
+    meta_agent_prompt = PromptTemplate(**meta_agent_prompt_spec)
+    meta_agent_chain = registry.chain("meta_agent", llm, meta_agent_prompt)
+    history_summary_chain = registry.chain("history_summary", llm, PromptTemplate(**history_summary_prompt_spec))
+    llm_registry = registry
+    return {"chains": len(registry.stats()["chains"])}
+
+
+async def summarize_chat_messages(previous_summary, messages):
+    with tracer.span("llm_history_summary"):
+        return await history_summary_chain.arun(
+            summary=previous_summary or "(none)",
+            messages=format_chat_history(messages)
+        )
+
+
+# Keep the last CHAT_HISTORY_KEEP_TURNS user/assistant turns verbatim (default 6)
+history_compactor = HistoryCompactor(
+    summarize_chat_messages,
+    keep_messages=2 * int(os.getenv("CHAT_HISTORY_KEEP_TURNS", 6)),
+    cache_entries=int(os.getenv("CHAT_SUMMARY_CACHE_ENTRIES", 512)),
+)
+
+
+async def compact_chat_history(history, formatted_history=None):
+    """
+    Formats the history for `chat_prompt`, replacing turns older than the verbatim window
+    with the cached rolling summary. `formatted_history` is reused when nothing is compacted.
+    """
+    compacted = await history_compactor.compact(history)
+    token_metrics.record("chat_history_tokens", compacted.history_tokens)
+    token_metrics.record("chat_history_tokens_compacted", compacted.compacted_tokens)
+
+    if compacted.summary is None:
+        if len(compacted.recent) < len(history):
+            # The summary failed: plain truncation to the verbatim window
+            return format_chat_history(compacted.recent)
+        return formatted_history if formatted_history is not None else format_chat_history(history)
+    return f"**Summary Of Earlier Conversation**: {compacted.summary}\n{format_chat_history(compacted.recent)}"
+
+
+def record_prompt_tokens(chat_inputs):
+    prompt_tokens = count_tokens(chat_prompt.format(**chat_inputs))
+    token_metrics.record("chat_prompt_tokens", prompt_tokens)
+    logger.info(f"Chat prompt size: {prompt_tokens} tokens")
+    return chat_inputs
+
+
+def format_chat_context(patient_data, recommendations, risk_probability):
+    """
+    Cleans the patient context of a chat and formats it for `chat_prompt`.
+    Raises HTTPException(400) for malformed patient data or risk probability.
+    """
+    # Exclude PatientName from numerical conversion
+    cleaned_patient_data = {}
+    for key, value in patient_data.items():
+        try:
+            if key == "PatientName":
+                cleaned_patient_data[key] = str(value).strip()
+            else:
+                cleaned_value = str(value).strip().replace("`", "").replace("'", "")
+                cleaned_patient_data[key] = float(cleaned_value) if cleaned_value else 0.0
+        except ValueError:
+            logger.error(f"Invalid patient data input for {key}: {value}")
+            raise HTTPException(status_code=400, detail=f"Invalid input for {key}: {value}")
+
+    # Ensure `recommendations` are strings
+    cleaned_recommendations = {k: str(v) if isinstance(v, str) else "" for k, v in recommendations.items()}
+
+    # Convert `risk_probability` to a float and back to a string
+    try:
+        cleaned_risk_probability = str(float(risk_probability.strip().replace("%", "")))
+    except ValueError:
+        logger.error(f"Invalid risk probability: {risk_probability}")
+        raise HTTPException(status_code=400, detail=f"Invalid risk probability: {risk_probability}")
+
+    return {
+        "patient_data": "\n".join([f"- {key}: {value}" for key, value in cleaned_patient_data.items()]),
+        "recommendations": "\n".join([f"- {key}: {value}" for key, value in cleaned_recommendations.items()]),
+        "risk_probability": cleaned_risk_probability
+    }
+
+
+async def build_chat_inputs(chat_request: ChatRequest):
+    """
+    Validates a `ChatRequest` and formats it into the `chat_prompt` input variables.
+    Raises HTTPException(400) for malformed patient data, history or risk probability.
+    """
+    # Validate `history`
+    validated_history = []
+    for msg in chat_request.history:
+        if isinstance(msg, dict) and "role" in msg and "content" in msg:
+            validated_history.append(msg)
+        else:
+            logger.error(f"Invalid chat history entry: {msg}")
+            raise HTTPException(status_code=400, detail="Invalid chat history format.")
+
+    context = format_chat_context(chat_request.patient_data, chat_request.recommendations, chat_request.risk_probability)
+
+    # Pass System Prompt as Context in LLM Response Generation
+    return record_prompt_tokens({
+        "history": f"{chat_system_prompt}\n{await compact_chat_history(validated_history)}",
+        "user_input": chat_request.user_input,
+        "predicted_risk": chat_request.predicted_risk,
+        **context
+    })
+
+
+def create_chat_session(patient: PatientData, risk_result, recommendations):
+    """
+    Stores the formatted chat context for a patient and returns the new session id.
+    Returns None (and logs) if the context cannot be stored, e.g. after a failed prediction.
+    """
+    try:
+        context = format_chat_context(patient.model_dump(exclude={"model"}), recommendations, risk_result.get("riskProbability", ""))
+    except HTTPException as e:
+        logger.warning(f"Not creating chat session: {e.detail}")
+        return None
+
+    return chat_sessions.create({
+        **context,
+        "predicted_risk": risk_result.get("predictedRisk", ""),
+        "history": [],
+        "history_text": ""
+    })
+
+
+def load_chat_session(session_id):
+    session = chat_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found or expired.")
+    return session
+
+
+async def build_session_chat_inputs(session, user_input):
+    """`chat_prompt` inputs from a stored session; only the new user input is added per turn."""
+    history_text = await compact_chat_history(session["history"], formatted_history=session["history_text"])
+    return record_prompt_tokens({
+        "history": f"{chat_system_prompt}\n{history_text}",
+        "user_input": user_input,
+        "patient_data": session["patient_data"],
+        "recommendations": session["recommendations"],
+        "predicted_risk": session["predicted_risk"],
+        "risk_probability": session["risk_probability"]
+    })
+
+
+def append_session_turn(session_id, user_input, response):
+    """
+    Appends one user/assistant exchange to the stored session, extending the pre-formatted
+    history, and returns the updated session. The exchange is applied to the latest stored
+    copy, so a turn finishing in another worker is not overwritten.
+    """
+    turn = [{"role": "user", "content": user_input}, {"role": "assistant", "content": response}]
+    formatted_turn = format_chat_history(turn)
+
+    def apply(session):
+        session["history"].extend(turn)
+        session["history_text"] = f"{session['history_text']}\n{formatted_turn}" if session["history_text"] else formatted_turn
+
+    session = chat_sessions.update(session_id, apply)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session expired before the reply could be saved.")
+    return session
+
+
+def history_version(history):
+    """Short content hash of a chat history, so clients can check their local copy is in sync."""
+    encoded = json.dumps(history, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
 @app.post("/chat")
 async def chat(chat_request: ChatRequest):
+    await require_components("llm")
     try:
-        # Exclude PatientName from numerical conversion
-        cleaned_patient_data = {}
-        for key, value in chat_request.patient_data.items():
-            try:
-                if key == "PatientName":
-                    cleaned_patient_data[key] = str(value).strip()
-                else:
-                    cleaned_value = str(value).strip().replace("`", "").replace("'", "")
-                    cleaned_patient_data[key] = float(cleaned_value) if cleaned_value else 0.0
-            except ValueError:
-                logger.error(f"Invalid patient data input for {key}: {value}")
-                raise HTTPException(status_code=400, detail=f"Invalid input for {key}: {value}")
-
-        # Ensure `recommendations` are strings
-        cleaned_recommendations = {k: str(v) if isinstance(v, str) else "" for k, v in chat_request.recommendations.items()}
-
-        # Validate `history`
-        validated_history = []
-        for msg in chat_request.history:
-            if isinstance(msg, dict) and "role" in msg and "content" in msg:
-                validated_history.append(msg)
-            else:
-                logger.error(f"Invalid chat history entry: {msg}")
-                raise HTTPException(status_code=400, detail="Invalid chat history format.")
+        if chat_request.session_id:
+            # **Held across the LLM call** so the next turn sees this exchange in its history
+            async with chat_session_locks.get(chat_request.session_id):
+                session = load_chat_session(chat_request.session_id)
+                chat_inputs = await build_session_chat_inputs(session, chat_request.user_input)
+                with tracer.span("llm_chat"):
+                    response = await chat_chain.arun(**chat_inputs)
+                session = append_session_turn(chat_request.session_id, chat_request.user_input, response)
+
+            return {
+                "response": response,
+                "session_id": chat_request.session_id,
+                "historyLength": len(session["history"])
+            }
 
-        # Convert `risk_probability` to a float and back to a string
-        try:
-            risk_probability = str(float(chat_request.risk_probability.strip().replace("%", "")))
-        except ValueError:
-            logger.error(f"Invalid risk probability: {chat_request.risk_probability}")
-            raise HTTPException(status_code=400, detail=f"Invalid risk probability: {chat_request.risk_probability}")
-
-        # Enforcing System Prompt to Restrict Responses to Diabetes
-        system_prompt = (
-            "SYSTEM: You are a medical AI assistant strictly focused on Diabetes. "
-            "Do not answer questions unrelated to Diabetes, even if asked. "
-            "If a question is outside this scope, politely refuse to answer.\n\n"
-        )
+        chat_inputs = await build_chat_inputs(chat_request)
 
-        # Format history, patient data, and recommendations for LLM
-        formatted_history = "\n".join(
-            [f"**{msg['role'].capitalize()}**: {msg['content']}" for msg in validated_history]
-        )
-        formatted_patient_data = "\n".join([f"- {key}: {value}" for key, value in cleaned_patient_data.items()])
-        formatted_recommendations = "\n".join([f"- {key}: {value}" for key, value in cleaned_recommendations.items()])
-
-        # Pass System Prompt as Context in LLM Response Generation
-        response = await chat_chain.arun(
-            history=f"{system_prompt}\n{formatted_history}",
-            user_input=chat_request.user_input,
-            patient_data=formatted_patient_data,
-            recommendations=formatted_recommendations,
-            predicted_risk=chat_request.predicted_risk,
-            risk_probability=risk_probability
-        )
+        with tracer.span("llm_chat"):
+            response = await chat_chain.arun(**chat_inputs)
 
         #  Append AI Response to Chat History
         chat_request.history.append({"role": "assistant", "content": response})
@@ -709,6 +1671,94 @@ async def chat(chat_request: ChatRequest):
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/chat/stream")
+async def chat_stream(chat_request: ChatRequest):
+    """
+    Server-sent events variant of `/chat`:
+      token -> the assistant reply, token by token
+      done  -> {"message": <new assistant message>, "historyVersion", "historyLength"}
+               instead of echoing the full updated history
+      error -> emitted instead of `done` if generation fails
+    """
+    await require_components("llm")
+    if chat_request.session_id:
+        # 404 before the stream starts; the session is re-read under its lock once the stream runs
+        load_chat_session(chat_request.session_id)
+        chat_inputs = None
+    else:
+        chat_inputs = await build_chat_inputs(chat_request)
+
+    async def stream_tokens(inputs, tokens):
+        async for chunk in chat_chain.llm.astream(chat_prompt.format(**inputs)):
+            if chunk.content:
+                tokens.append(chunk.content)
+                yield sse_event("token", {"token": chunk.content})
+
+    async def event_stream():
+        try:
+            tokens = []
+            if chat_request.session_id:
+                # **Held for the whole turn**, like `/chat`, so concurrent turns don't drop an exchange
+                async with chat_session_locks.get(chat_request.session_id):
+                    session = load_chat_session(chat_request.session_id)
+                    inputs = await build_session_chat_inputs(session, chat_request.user_input)
+                    async for event in stream_tokens(inputs, tokens):
+                        yield event
+                    session = append_session_turn(chat_request.session_id, chat_request.user_input, "".join(tokens))
+                message = session["history"][-1]
+                updated_history = session["history"]
+            else:
+                async for event in stream_tokens(chat_inputs, tokens):
+                    yield event
+                message = {"role": "assistant", "content": "".join(tokens)}
+                updated_history = chat_request.history + [message]
+            yield sse_event("done", {
+                "message": message,
+                "historyVersion": history_version(updated_history),
+                "historyLength": len(updated_history)
+            })
+
+        except HTTPException as e:
+            yield sse_event("error", {"detail": e.detail})
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Startup components load in parallel threads; endpoints wait for (or, serving early, 503 on)
+# the ones they need
+startup.add("models", init_models)
+startup.add("faiss", init_guideline_indexes)
+startup.add("llm", init_llm_clients)
+
+
+@app.on_event("startup")
+async def start_components():
+    # Raises, aborting startup, if a required component fails to load
+    await startup.wait_ready()
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving, whatever its components are doing."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the required components are loaded, 503 (with their states) until then."""
+    status = startup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))  # Ensure compatibility with Render
     uvicorn.run(app, host="0.0.0.0", port=port, timeout_keep_alive=300)
@@ -6,14 +6,8 @@ try:
 except ImportError:  # pragma: no cover - fallback for direct execution
     import main                  # when imported as top-level module
 
-# Available models that can be controlled via MCP
-AVAILABLE_MODELS: Dict[str, str] = {
-    "lightgbm": "LightGBM",
-    "random_forest": "Tuned Random Forest",
-}
-
-# Holds the key of the currently selected model if overridden via MCP
-current_model_override: Optional[str] = None
+# Models are served from `main.model_registry` (see model_registry.py); `switch_model`
+# changes its default, which requests without their own `model` key use.
 
 class MCPRequest(BaseModel):
     action: str
@@ -45,27 +39,56 @@ class MCPResponse(BaseModel):
 
 # --- Original helper functions (no changes needed here) ---
 
+def available_models() -> Dict[str, str]:
+    return {key: entry.display_name for key, entry in main.model_registry.entries().items()}
+
 def list_models() -> List[str]:
-    return list(AVAILABLE_MODELS.values())
+    return list(available_models().values())
 
-def switch_model(model_key: str) -> str:
-    global current_model_override
-    if model_key not in AVAILABLE_MODELS:
-        raise ValueError("Unknown model")
-    current_model_override = model_key
-    return AVAILABLE_MODELS[model_key]
+def switch_model(model_key: Optional[str]) -> Optional[str]:
+    """Sets the default model; "auto" (or None) restores feature-count routing."""
+    if model_key in (None, "auto"):
+        main.model_registry.set_default(None)
+        return None
+    main.model_registry.set_default(model_key)
+    return main.model_registry.get(model_key).display_name
 
 def get_current_model() -> Optional[str]:
-    if current_model_override:
-        return AVAILABLE_MODELS[current_model_override]
+    default = main.model_registry.default
+    if default:
+        return main.model_registry.get(default).display_name
     return None
 
 def get_metadata() -> Dict[str, Optional[str]]:
     return {
-        "available_models": AVAILABLE_MODELS,
+        "available_models": available_models(),
         "current_model": get_current_model(),
     }
 
+def patient_request(parameters: Dict[str, Any]):
+    """PatientData, numeric feature dict and resolved model key for the predict/recommendations actions."""
+    patient = main.PatientData(**parameters)
+    entry = main.model_registry.resolve(patient.model)
+    return patient, main.patient_features(patient), entry.key if entry else None
+
+# Startup components (see startup.py) each action needs before it can run
+ACTION_COMPONENTS: Dict[str, tuple] = {
+    "list_models": ("models",),
+    "switch_model": ("models",),
+    "current_model": ("models",),
+    "metadata": ("models",),
+    "models": ("models",),
+    "reload_model": ("models",),
+    "rollback_model": ("models",),
+    "predict": ("models",),
+    "explain_batch": ("models",),
+    "recommendations": ("models", "faiss", "llm"),
+    "chat": ("llm",),
+    "embedding_cache": ("faiss",),
+    "reload_index": ("faiss",),
+    "llm_clients": ("llm",),
+}
+
 # --- Modified handle_mcp_action to return Pydantic data models directly ---
 # The return type hint is updated to reflect the Pydantic data models being returned.
 async def handle_mcp_action(action: str, parameters: Optional[Dict[str, Any]] = None) -> Union[ModelListResponseData, CurrentModelResponseData, MetadataResponseData, Dict[str, Any]]:
@@ -73,6 +96,8 @@ async def handle_mcp_action(action: str, parameters: Optional[Dict[str, Any]] =
     Handles different MCP actions and returns the appropriate data for the response.
     Returns Pydantic model instances for clarity and validation.
     """
+    for component in ACTION_COMPONENTS.get(action, ()):
+        await main.startup.require(component)
     if action == "list_models":
         return ModelListResponseData(models=list_models())
     if action == "switch_model":
@@ -93,34 +118,79 @@ async def handle_mcp_action(action: str, parameters: Optional[Dict[str, Any]] =
     if action == "predict":
         if not parameters:
             raise ValueError("patient parameters required for predict")
-        import numpy as np
         import asyncio
-        patient = main.PatientData(**parameters)
-        patient_dict = {
-            k: float(v) if k != "PatientName" and str(v).strip() else np.nan
-            for k, v in patient.model_dump().items()
-        }
-        return main.predict_diabetes_risk(patient_dict, compute_shap=True)
+        explanation = parameters.get("explanation", "waterfall")
+        patient, patient_dict, model_key = patient_request(parameters)
+        return await main.inference_executor.run(
+            "predict", main.predict_diabetes_risk, patient_dict, explanation=explanation, model=model_key
+        )
+    if action == "explain_batch":
+        if not parameters or "features" not in parameters or "rows" not in parameters:
+            raise ValueError("'features' and 'rows' parameters required for explain_batch")
+        return await main.explain_shap_batch(
+            parameters["features"], parameters["rows"], model=parameters.get("model"),
+            encoding=parameters.get("encoding", "base64"),
+        )
     if action == "recommendations":
         if not parameters:
             raise ValueError("patient parameters required for recommendations")
-        import numpy as np
         import asyncio
-        patient = main.PatientData(**parameters)
-        patient_dict = {
-            k: float(v) if k != "PatientName" and str(v).strip() else np.nan
-            for k, v in patient.model_dump().items()
-        }
-        risk_result = main.predict_diabetes_risk(patient_dict, compute_shap=False)
+        explanation = parameters.get("explanation", "values")
+        patient, patient_dict, model_key = patient_request(parameters)
+        risk_result = await main.inference_executor.run(
+            "predict", main.predict_diabetes_risk, patient_dict, explanation=explanation, model=model_key
+        )
         cleaned_patient = main.convert_categorical_values(patient_dict.copy())
-        expert = await main.get_expert_recommendations(cleaned_patient, risk_result)
-        final_rec = await main.get_final_recommendation(patient_dict, expert, risk_result)
-        return {
-            "endocrinologistRecommendation": expert.get("Endocrinologist", "No data"),
-            "dietitianRecommendation": expert.get("Dietitian", "No data"),
-            "fitnessRecommendation": expert.get("Fitness Expert", "No data"),
-            "finalRecommendation": final_rec
-        }
+        response = await main.generate_recommendations(cleaned_patient, risk_result, explanation)
+        response["sessionId"] = main.create_chat_session(patient, risk_result, response)
+        return response
+    if action == "models":
+        return {**main.model_registry.stats(), "reloads": main.model_reloader.status()}
+    if action == "reload_model":
+        if not parameters or "model" not in parameters or "path" not in parameters:
+            raise ValueError("'model' and 'path' parameters required")
+        spec = {field: parameters.get(field) for field in ("path", "scaler_path", "version", "name")}
+        return await main.reload_model(parameters["model"], spec, wait=bool(parameters.get("wait")))
+    if action == "rollback_model":
+        if not parameters or "model" not in parameters:
+            raise ValueError("'model' parameter required")
+        return main.model_reloader.rollback(parameters["model"]).describe()
+    if action == "latency_metrics":
+        return main.latency_metrics.snapshot()
+    if action == "token_metrics":
+        return main.token_metrics.snapshot()
+    if action == "shap_plot_cache":
+        return main.shap_plot_renderer.stats()
+    if action == "retrieval_cache":
+        return main.guideline_cache.stats()
+    if action == "embedding_cache":
+        return main.openai_embeddings.stats()
+    if action == "chat_sessions":
+        return main.chat_sessions.stats()
+    if action == "llm_clients":
+        return main.llm_registry.stats()
+    if action == "recommendation_cache":
+        if parameters and parameters.get("clear"):
+            main.recommendation_cache.clear()
+        return main.recommendation_cache.stats()
+    if action == "pipeline":
+        return main.pipeline_scheduler.stats()
+    if action == "pubmed_cache":
+        return main.pubmed_client.stats()
+    if action == "tracing":
+        return main.tracer.stats()
+    if action == "startup":
+        return main.startup.status()
+    if action == "reload_index":
+        if not parameters or "category" not in parameters:
+            raise ValueError("'category' parameter required")
+        category = parameters["category"]
+        if category not in main.faiss_categories:
+            raise ValueError(f"Unknown FAISS category. Use one of {main.faiss_categories}")
+        loaded = main.load_vectorstore(category)
+        if loaded:
+            main.guideline_cache.warm(main.vectorstores, main.guideline_queries, main.guideline_k)
+        return {"category": category, "loaded": loaded}
     if action == "chat":
         if not parameters:
             raise ValueError("chat parameters required")
@@ -0,0 +1,121 @@
+"""
+In-process latency metrics for the prediction and recommendation pipeline.
+
+Stages are recorded by name (e.g. "model_inference", "shap_values") and aggregated
+as count / total / average / max so they can be inspected through MCP. `ValueMetrics`
+aggregates other per-request observations the same way (e.g. prompt token counts).
+`Histograms` keeps bucketed span durations for the Prometheus `/metrics` endpoint.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence
+
+
+class ValueMetrics:
+    """Thread-safe aggregate of named observations (count / total / average / max / last)."""
+
+    scale = 1.0
+    suffix = ""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, value: float) -> None:
+        value = value * self.scale
+        with self._lock:
+            stats = self._stages.setdefault(
+                stage, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            )
+            stats["count"] += 1
+            stats["total"] += value
+            stats["max"] = max(stats["max"], value)
+            stats["last"] = value
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        suffix = self.suffix
+        with self._lock:
+            return {
+                stage: {
+                    "count": stats["count"],
+                    f"total{suffix}": round(stats["total"], 3),
+                    f"avg{suffix}": round(stats["total"] / stats["count"], 3) if stats["count"] else 0.0,
+                    f"max{suffix}": round(stats["max"], 3),
+                    f"last{suffix}": round(stats["last"], 3),
+                }
+                for stage, stats in self._stages.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+class LatencyMetrics(ValueMetrics):
+    """Stage durations: recorded in seconds, reported in milliseconds."""
+
+    scale = 1000.0
+    suffix = "_ms"
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histograms:
+    """Thread-safe cumulative histograms keyed by span name, rendered in Prometheus text format."""
+
+    def __init__(self, metric_name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 label: str = "span"):
+        self.metric_name = metric_name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.label = label
+        self._lock = threading.Lock()
+        self._series: Dict[str, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = [0.0] * (len(self.buckets) + 2)
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[position] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.metric_name} {self.help_text}", f"# TYPE {self.metric_name} histogram"]
+        with self._lock:
+            series = {name: list(values) for name, values in self._series.items()}
+        for name, values in sorted(series.items()):
+            label = f'{self.label}="{_escape_label(name)}"'
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.metric_name}_bucket{{{label},le="{bound:g}"}} {count:g}')
+            lines.append(f'{self.metric_name}_bucket{{{label},le="+Inf"}} {values[-2]:g}')
+            lines.append(f"{self.metric_name}_sum{{{label}}} {values[-1]:.6f}")
+            lines.append(f"{self.metric_name}_count{{{label}}} {values[-2]:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared instances used by the server
+latency_metrics = LatencyMetrics()
+token_metrics = ValueMetrics()
+span_histograms = Histograms("diabetes_agent_span_duration_seconds", "Duration of traced pipeline spans.")
@@ -0,0 +1,301 @@
+"""
+Registry of servable models, with background hot reload.
+
+Each `ModelEntry` bundles everything one prediction needs: the model, its scaler (or None),
+a `FeatureEncoder` compiled for that scaler, the prebuilt SHAP explainer and the predictor
+used for probabilities (the compiled trees from compiled_trees.py, or the model). Requests pick
+an entry by key (`PatientData.model` or the MCP `model` parameter), fall back to the
+registry default, and otherwise use feature-count routing.
+
+Entries and the default are replaced copy-on-write, so a request that has resolved an entry
+keeps using it even if the registry changes mid-request. `ModelReloader` loads and warms a
+new artifact on a background thread before swapping it in; the replaced entry is kept so
+`rollback` can swap it back.
+
+With several uvicorn workers, set MODEL_STATE_PATH to a shared file; the process inference
+pool requires it (`main.py` refuses to start without it), since its workers are separate
+registries too. `set_default`, reloads and rollbacks are written to it atomically; every
+worker picks them up on its next request and reloads the published artifact itself.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_version(path: str) -> str:
+    """Short content hash of a model artifact, used as its version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelEntry:
+    def __init__(self, key: str, display_name: str, model, scaler=None, encoder=None, explainer=None,
+                 version: str = "1", source: Optional[str] = None, scaler_source: Optional[str] = None,
+                 predictor=None):
+        self.key = key
+        self.display_name = display_name
+        self.model = model
+        self.scaler = scaler
+        self.encoder = encoder
+        self.explainer = explainer
+        self.version = version
+        self.source = source
+        self.scaler_source = scaler_source
+        # Anything with `predict_proba`/`classes_`; SHAP always explains the original model
+        self.predictor = predictor if predictor is not None else model
+        self.loaded_at = time.time()
+
+    def spec(self) -> Dict[str, Optional[str]]:
+        """What another worker needs to load this exact entry."""
+        return {
+            "path": self.source,
+            "scaler_path": self.scaler_source,
+            "version": self.version,
+            "name": self.display_name,
+        }
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "key": self.key,
+            "name": self.display_name,
+            "version": self.version,
+            "source": self.source,
+            "scaled": self.scaler is not None,
+            "compiled": self.predictor is not self.model,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, state_path: Optional[str] = None):
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, ModelEntry] = {}
+        self._previous: Dict[str, ModelEntry] = {}
+        self._default: Optional[str] = None
+        self._published: Dict[str, dict] = {}
+        self._state_version: Optional[tuple] = None
+        # Called with (key, spec) when another worker publishes a version this one has not loaded
+        self.on_published: Optional[Callable[[str, dict], None]] = None
+
+    def register(self, entry: ModelEntry) -> Optional[ModelEntry]:
+        """Adds or replaces the entry for `entry.key`; returns the entry it replaced, if any."""
+        # Apply what other workers published first, so `publish` afterwards does not undo it
+        self._refresh_shared_state()
+        with self._lock:
+            previous = self._entries.get(entry.key)
+            self._entries = {**self._entries, entry.key: entry}
+            if previous is not None:
+                self._previous[entry.key] = previous
+        logger.info(f"Registered model '{entry.key}' ({entry.display_name}) version {entry.version}")
+        return previous
+
+    def rollback(self, key: str) -> ModelEntry:
+        """Swaps the entry for `key` with the one it replaced (a second rollback rolls forward)."""
+        self._refresh_shared_state()
+        with self._lock:
+            previous = self._previous.get(key)
+            if previous is None:
+                raise ValueError(f"No previous version of '{key}' to roll back to")
+            current = self._entries[key]
+            self._entries = {**self._entries, key: previous}
+            self._previous[key] = current
+        logger.info(f"Rolled model '{key}' back from version {current.version} to {previous.version}")
+        return previous
+
+    def get(self, key: str) -> ModelEntry:
+        # Requests with an explicit key must see reloads and rollbacks too (one stat() per call)
+        self._refresh_shared_state()
+        entry = self._entries.get(key)
+        if entry is None:
+            raise ValueError(f"Unknown model '{key}'. Use one of {self.keys()}")
+        return entry
+
+    def keys(self) -> List[str]:
+        return list(self._entries)
+
+    def entries(self) -> Dict[str, ModelEntry]:
+        return self._entries
+
+    @property
+    def default(self) -> Optional[str]:
+        self._refresh_shared_state()
+        return self._default
+
+    def set_default(self, key: Optional[str]) -> Optional[str]:
+        """Sets (or with None, clears) the default model for every request without an explicit model."""
+        if key is not None:
+            self.get(key)
+        # Merge what other workers published before rewriting the shared state
+        self._refresh_shared_state()
+        with self._lock:
+            self._default = key
+            if self.state_path:
+                self._write_shared_state()
+        logger.info(f"Default model set to {key or 'feature-count routing'}")
+        return key
+
+    def publish(self, key: str) -> None:
+        """Records the current entry for `key` in the shared state so other workers load it too."""
+        if not self.state_path:
+            return
+        with self._lock:
+            self._published[key] = self._entries[key].spec()
+            self._write_shared_state()
+
+    def resolve(self, key: Optional[str] = None) -> Optional[ModelEntry]:
+        """Entry for an explicit key, else the default; None means "route by feature count"."""
+        key = key or self.default
+        return self.get(key) if key else None
+
+    def sync(self) -> None:
+        """Re-reads the shared state even if unchanged, e.g. once `on_published` is set at startup."""
+        self._state_version = None
+        self._refresh_shared_state()
+
+    def _write_shared_state(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as handle:
+            json.dump({"default": self._default, "models": self._published}, handle)
+        os.replace(handle.name, self.state_path)
+        self._state_version = self._stat_state()
+
+    def _stat_state(self) -> tuple:
+        # Every write replaces the file, so the inode changes even within one mtime tick
+        stat = os.stat(self.state_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh_shared_state(self) -> None:
+        if not self.state_path:
+            return
+        try:
+            version = self._stat_state()
+        except FileNotFoundError:
+            return
+        if version == self._state_version:
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as handle:
+                state = json.load(handle)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read model state from {self.state_path}: {str(e)}")
+            return
+
+        stale = []
+        with self._lock:
+            self._state_version = version
+            self._published = dict(state.get("models") or {})
+            for key, spec in self._published.items():
+                current = self._entries.get(key)
+                if current is not None and current.version == spec.get("version"):
+                    continue
+                previous = self._previous.get(key)
+                if current is not None and previous is not None and previous.version == spec.get("version"):
+                    self._entries = {**self._entries, key: previous}
+                    self._previous[key] = current
+                    logger.info(f"Model '{key}' rolled back to version {previous.version} by another worker")
+                else:
+                    stale.append((key, spec))
+            default = state.get("default")
+            self._default = default if default in self._entries else None
+
+        if self.on_published is not None:
+            for key, spec in stale:
+                self.on_published(key, spec)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "default": self.default,
+            "models": {key: entry.describe() for key, entry in self._entries.items()},
+            "previous": {key: entry.version for key, entry in self._previous.items()},
+        }
+
+
+class ModelReloader:
+    """
+    Loads, warms and swaps model artifacts on one background thread, so reloads never block
+    requests and never run concurrently. `load(key, spec)` builds the new `ModelEntry` and
+    `warm(entry)` must raise if it cannot serve; only then is the entry swapped in.
+    """
+
+    def __init__(self, registry: ModelRegistry, load: Callable[[str, dict], ModelEntry],
+                 warm: Callable[[ModelEntry], None], metrics=None):
+        self.registry = registry
+        self.load = load
+        self.warm = warm
+        self.metrics = metrics
+        self._status: Dict[str, dict] = {}
+        self._private: Dict[str, ModelEntry] = {}
+        self._private_lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-reload")
+        registry.on_published = lambda key, spec: self.submit(key, spec, publish=False)
+        # A worker started after a reload loads the published versions, not the startup files
+        registry.sync()
+
+    def submit(self, key: str, spec: dict, publish: bool = True) -> "Future[ModelEntry]":
+        self._status[key] = {"state": "queued", "path": spec.get("path"), "version": spec.get("version")}
+        return self._worker.submit(self._reload, key, spec, publish)
+
+    def ensure(self, key: str, spec: dict) -> ModelEntry:
+        """
+        The entry for `key` at `spec["version"]`: the registered one if it matches, otherwise a
+        private one loaded and warmed from `spec` in the calling thread. Private entries are
+        cached per key (the latest version asked for) and never registered, so a process-pool
+        worker can explain a batch with the serving process's version without changing what
+        the worker itself serves.
+        """
+        entry = self.registry.get(key)
+        if entry.version == spec.get("version"):
+            return entry
+        with self._private_lock:
+            private = self._private.get(key)
+            if private is None or private.version != spec.get("version"):
+                private = self.load(key, spec)
+                self.warm(private)
+                self._private[key] = private
+        return private
+
+    def _reload(self, key: str, spec: dict, publish: bool) -> ModelEntry:
+        status = self._status[key] = {"state": "loading", "path": spec.get("path"), "version": spec.get("version")}
+        start = time.perf_counter()
+        try:
+            entry = self.load(key, spec)
+            status["version"] = entry.version
+            status["state"] = "warming"
+            self.warm(entry)
+        except Exception as e:
+            status.update(state="failed", error=str(e))
+            logger.error(f"Reload of model '{key}' from {spec.get('path')} failed; keeping current version: {str(e)}")
+            raise
+
+        previous = self.registry.register(entry)
+        if publish:
+            self.registry.publish(key)
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.record("model_reload", elapsed)
+        status.update(state="ready", previous=previous.version if previous else None, seconds=round(elapsed, 3))
+        return entry
+
+    def rollback(self, key: str) -> ModelEntry:
+        entry = self.registry.rollback(key)
+        self.registry.publish(key)
+        self._status[key] = {"state": "rolled_back", "path": entry.source, "version": entry.version}
+        return entry
+
+    def status(self) -> Dict[str, dict]:
+        return {key: dict(status) for key, status in self._status.items()}
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._worker.shutdown(wait=wait)
@@ -0,0 +1,292 @@
+"""
+Scheduler for the recommendation DAG: guideline retrieval -> 3 experts -> meta-agent.
+
+Every node runs under its own timeout, clipped to what is left of a global deadline, so
+the tail latency of `/recommendations` is bounded by the deadline rather than by the
+slowest GPT-4 call. Each node also has a circuit breaker: after `failure_threshold`
+consecutive timeouts or errors the node is skipped (its fallback is used immediately)
+for `reset_seconds`, then a single trial call is let through.
+
+Configuration (environment variables):
+    PIPELINE_DEADLINE           global budget in seconds for the whole pipeline (default: 90)
+    PIPELINE_EXPERT_TIMEOUT     timeout of each expert call (default: 45)
+    PIPELINE_FINAL_TIMEOUT      timeout of the meta-agent call (default: 45)
+    PIPELINE_BREAKER_FAILURES   consecutive failures that open a breaker (default: 3)
+    PIPELINE_BREAKER_RESET      seconds a breaker stays open (default: 60)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+NodeCall = Callable[[], Awaitable[str]]
+Fallback = Callable[[], str]
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; open -> half-open after `reset_seconds`."""
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """True if a call may go through; in half-open state only one trial call is allowed."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def release_trial(self) -> None:
+        """Ends a trial call that neither succeeded nor failed (e.g. it was cancelled)."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = self._clock()
+
+
+class Deadline:
+    """Absolute deadline shared by every node of one pipeline run."""
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    def clip(self, timeout: Optional[float]) -> float:
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+class NodeResult:
+    def __init__(self, node: str, value: str, status: str):
+        self.node = node
+        self.value = value
+        self.status = status  # "ok", "partial" (answered from degraded inputs), "timeout", "error" or "open"
+
+    @property
+    def degraded(self) -> bool:
+        return self.status != "ok"
+
+
+class PipelineScheduler:
+    def __init__(self, deadline_seconds: float = 90.0, node_timeouts: Optional[Dict[str, float]] = None,
+                 default_timeout: Optional[float] = None, failure_threshold: int = 3,
+                 reset_seconds: float = 60.0, metrics=None, tracer=None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.deadline_seconds = deadline_seconds
+        self.node_timeouts = node_timeouts or {}
+        self.default_timeout = default_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.metrics = metrics
+        self.tracer = tracer
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._outcomes: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls, expert_nodes, final_node: str, metrics=None, tracer=None,
+                 extra_timeouts: Optional[Dict[str, float]] = None) -> "PipelineScheduler":
+        expert_timeout = float(os.getenv("PIPELINE_EXPERT_TIMEOUT", 45))
+        node_timeouts = dict(extra_timeouts or {})
+        node_timeouts.update({node: expert_timeout for node in expert_nodes})
+        node_timeouts[final_node] = float(os.getenv("PIPELINE_FINAL_TIMEOUT", 45))
+        return cls(
+            deadline_seconds=float(os.getenv("PIPELINE_DEADLINE", 90)),
+            node_timeouts=node_timeouts,
+            failure_threshold=int(os.getenv("PIPELINE_BREAKER_FAILURES", 3)),
+            reset_seconds=float(os.getenv("PIPELINE_BREAKER_RESET", 60)),
+            metrics=metrics,
+            tracer=tracer,
+        )
+
+    def deadline(self) -> Deadline:
+        return Deadline(self.deadline_seconds, clock=self._clock)
+
+    def breaker(self, node: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(node)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_seconds, clock=self._clock)
+                self._breakers[node] = breaker
+            return breaker
+
+    async def run_node(self, node: str, call: NodeCall, fallback: Fallback, deadline: Deadline) -> NodeResult:
+        """Runs one node under its timeout and breaker; any failure yields `fallback()`."""
+        skipped = self._skip_status(node, deadline)
+        if skipped:
+            return self._finish(node, fallback(), skipped, None)
+
+        breaker = self.breaker(node)
+        start = self._start(node)
+        try:
+            value = await asyncio.wait_for(call(), self.node_timeout(node, deadline))
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            logger.warning(f"{node} timed out after {self._elapsed(start):.2f}s, using fallback")
+            return self._finish(node, fallback(), "timeout", start)
+        except Exception as e:
+            breaker.record_failure()
+            logger.error(f"{node} failed: {str(e)}")
+            return self._finish(node, fallback(), "error", start)
+        except BaseException:
+            # Cancelled (e.g. the client disconnected): let the next request run the trial
+            breaker.release_trial()
+            raise
+
+        breaker.record_success()
+        return self._finish(node, value, "ok", start)
+
+    async def stream_node(self, node: str, stream: Callable[[], AsyncIterator[str]], fallback: Fallback,
+                          deadline: Deadline) -> AsyncIterator[NodeResult]:
+        """
+        Streaming variant of `run_node`: yields one result per chunk. If the node fails before
+        producing anything, `fallback()` is yielded instead; if it fails midway, a short
+        truncation note is yielded. Failed chunks carry the failure status.
+        """
+        skipped = self._skip_status(node, deadline)
+        if skipped:
+            yield self._finish(node, fallback(), skipped, None)
+            return
+
+        breaker = self.breaker(node)
+        start = self._start(node)
+        expires_at = self._clock() + self.node_timeout(node, deadline)
+        iterator = stream().__aiter__()
+        emitted, status = False, "ok"
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), max(0.0, expires_at - self._clock()))
+                except StopAsyncIteration:
+                    break
+                emitted = True
+                yield NodeResult(node, chunk, "ok")
+        except asyncio.TimeoutError:
+            status = "timeout"
+            logger.warning(f"{node} stream timed out after {self._elapsed(start):.2f}s")
+        except Exception as e:
+            status = "error"
+            logger.error(f"{node} stream failed: {str(e)}")
+        except BaseException:
+            # Cancelled, or closed by the consumer (GeneratorExit) before the stream finished
+            breaker.release_trial()
+            raise
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+        if status == "ok":
+            breaker.record_success()
+            self._finish(node, "", status, start)
+            return
+        breaker.record_failure()
+        value = "\n\n_(Response truncated.)_" if emitted else fallback()
+        yield self._finish(node, value, status, start)
+
+    def node_timeout(self, node: str, deadline: Deadline) -> float:
+        return deadline.clip(self.node_timeouts.get(node, self.default_timeout))
+
+    def _skip_status(self, node: str, deadline: Deadline) -> Optional[str]:
+        """Status for a node that must not be called at all, or None if it may run."""
+        if deadline.remaining() <= 0:
+            logger.warning(f"Pipeline deadline reached before {node}, using fallback")
+            return "timeout"
+        if not self.breaker(node).allow():
+            logger.warning(f"Circuit open for {node}, using fallback")
+            return "open"
+        return None
+
+    def _start(self, node: str):
+        """A trace span for the node when tracing is enabled, otherwise a start timestamp."""
+        if self.tracer is not None:
+            return self.tracer.start_span(f"pipeline_{node}", node=node)
+        return time.perf_counter()
+
+    @staticmethod
+    def _elapsed(start) -> float:
+        return start.duration if hasattr(start, "duration") else time.perf_counter() - start
+
+    def _finish(self, node: str, value: str, status: str, start) -> NodeResult:
+        if start is not None:
+            if self.tracer is not None:
+                start.set_attribute("status", status)
+                self.tracer.end_span(start, None if status == "ok" else status)
+            elif self.metrics is not None:
+                self.metrics.record(f"pipeline_{node}", time.perf_counter() - start)
+        with self._lock:
+            outcomes = self._outcomes.setdefault(node, {})
+            outcomes[status] = outcomes.get(status, 0) + 1
+        return NodeResult(node, value, status)
+
+    async def iter_nodes(self, calls: Dict[str, NodeCall], fallbacks: Dict[str, Fallback],
+                         deadline: Deadline) -> AsyncIterator[NodeResult]:
+        """
+        Runs independent nodes concurrently and yields their results in completion order.
+        Pending nodes are cancelled if the consumer stops early.
+        """
+        tasks = [
+            asyncio.create_task(self.run_node(node, call, fallbacks[node], deadline))
+            for node, call in calls.items()
+        ]
+        try:
+            for next_finished in asyncio.as_completed(tasks):
+                yield await next_finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            breakers = dict(self._breakers)
+            outcomes = {node: dict(counts) for node, counts in self._outcomes.items()}
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "node_timeouts": dict(self.node_timeouts),
+            "breakers": {
+                node: {"state": breaker.state, "failures": breaker.failures}
+                for node, breaker in breakers.items()
+            },
+            "outcomes": outcomes,
+        }
@@ -0,0 +1,125 @@
+"""
+Prompt budget for `/chat`: keeps long conversations from growing the prompt without limit.
+
+`HistoryCompactor` keeps the last N messages verbatim and replaces everything older with a
+rolling summary. Summaries are cached by a hash of the summarized prefix, so the LLM is only
+asked to summarize again when new turns fall out of the window, and then only the newly
+dropped messages are folded into the previous summary. If the summarizer fails, the older
+turns are simply dropped for that request (nothing is cached), so the chat still answers.
+
+Token counts use tiktoken when it is installed, otherwise a ~4 characters/token estimate.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # pragma: no cover - tiktoken is optional
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+def _message_digest(message: Dict[str, str]) -> bytes:
+    return hashlib.sha256(json.dumps(message, sort_keys=True).encode("utf-8")).digest()
+
+
+class CompactedHistory:
+    def __init__(self, summary: Optional[str], recent: List[Dict[str, str]], history_tokens: int,
+                 compacted_tokens: int):
+        self.summary = summary
+        self.recent = recent
+        self.history_tokens = history_tokens
+        self.compacted_tokens = compacted_tokens
+
+
+class HistoryCompactor:
+    def __init__(self, summarize: Summarizer, keep_messages: int = 12, cache_entries: int = 512,
+                 token_counter: Callable[[str], int] = count_tokens):
+        self.summarize = summarize
+        self.keep_messages = keep_messages
+        self.cache_entries = cache_entries
+        self.token_counter = token_counter
+        self._lock = threading.Lock()
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._message_tokens: "OrderedDict[bytes, int]" = OrderedDict()
+        self.summary_calls = 0
+
+    def message_tokens(self, message: Dict[str, str], digest: Optional[bytes] = None) -> int:
+        """Token count of one message, memoized by content hash."""
+        digest = digest or _message_digest(message)
+        with self._lock:
+            count = self._message_tokens.get(digest)
+            if count is not None:
+                self._message_tokens.move_to_end(digest)
+                return count
+        count = self.token_counter(f"{message.get('role', '')}: {message.get('content', '')}")
+        with self._lock:
+            self._message_tokens[digest] = count
+            while len(self._message_tokens) > self.cache_entries * 16:
+                self._message_tokens.popitem(last=False)
+        return count
+
+    def _cached_summary(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _store_summary(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.cache_entries:
+                self._summaries.popitem(last=False)
+
+    async def compact(self, history: List[Dict[str, str]]) -> CompactedHistory:
+        digests = [_message_digest(message) for message in history]
+        token_counts = [self.message_tokens(message, digest) for message, digest in zip(history, digests)]
+        history_tokens = sum(token_counts)
+
+        cut = len(history) - self.keep_messages
+        if cut <= 0:
+            return CompactedHistory(None, history, history_tokens, history_tokens)
+
+        # Rolling hash of every prefix, so any earlier summary point can be found
+        prefix_keys = [""]
+        rolling = hashlib.sha256()
+        for digest in digests[:cut]:
+            rolling.update(digest)
+            prefix_keys.append(rolling.hexdigest())
+
+        summary = self._cached_summary(prefix_keys[cut])
+        if summary is None:
+            start, previous = 0, ""
+            for position in range(cut - 1, 0, -1):
+                cached = self._cached_summary(prefix_keys[position])
+                if cached is not None:
+                    start, previous = position, cached
+                    break
+            try:
+                summary = await self.summarize(previous, history[start:cut])
+            except Exception as e:
+                logger.warning(f"Chat history summary failed, keeping only the last {self.keep_messages} messages: {str(e)}")
+                recent_tokens = sum(token_counts[cut:])
+                return CompactedHistory(None, history[cut:], history_tokens, recent_tokens)
+            self.summary_calls += 1
+            self._store_summary(prefix_keys[cut], summary)
+            logger.info(f"Summarized chat messages {start}-{cut} ({sum(token_counts[start:cut])} tokens)")
+
+        recent = history[cut:]
+        compacted_tokens = self.token_counter(summary) + sum(token_counts[cut:])
+        return CompactedHistory(summary, recent, history_tokens, compacted_tokens)
@@ -0,0 +1,150 @@
+"""
+Async PubMed client for literature evidence.
+
+One `esearch` call finds the PMIDs for a query and a single `esummary` call with
+comma-separated ids fetches every summary, over a pooled `httpx.AsyncClient`. Results are
+cached per query with a TTL, concurrent requests for the same query share one fetch, and
+calls are spaced to stay under the NCBI E-utilities rate limit (3 requests/s, or 10/s
+with an API key).
+
+Configuration (environment variables):
+    PUBMED_BASE_URL       E-utilities base URL (default: NCBI; point it at a stub for tests)
+    NCBI_API_KEY          optional API key, raises the rate limit to 10 requests/s
+    PUBMED_RETMAX         articles per query (default: 5)
+    PUBMED_TIMEOUT        HTTP timeout in seconds (default: 5)
+    PUBMED_CACHE_TTL      seconds a query result is cached (default: 86400)
+    PUBMED_CACHE_ENTRIES  queries kept in the cache (default: 1024)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+
+
+class RateLimiter:
+    """Spaces calls at least `1 / rate_per_second` apart."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class PubMedClient:
+    def __init__(self, base_url: str = EUTILS_URL, api_key: Optional[str] = None, retmax: int = 5,
+                 timeout: float = 5.0, ttl_seconds: float = 86400, max_entries: int = 1024,
+                 rate_per_second: Optional[float] = None, clock: Callable[[], float] = time.time):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.retmax = retmax
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self.rate_limiter = RateLimiter(rate_per_second or (10.0 if api_key else 3.0))
+        self.http_client = httpx.AsyncClient(
+            timeout=timeout, limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+        )
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.http_calls = 0
+
+    @classmethod
+    def from_env(cls) -> "PubMedClient":
+        return cls(
+            base_url=os.getenv("PUBMED_BASE_URL", EUTILS_URL),
+            api_key=os.getenv("NCBI_API_KEY") or None,
+            retmax=int(os.getenv("PUBMED_RETMAX", 5)),
+            timeout=float(os.getenv("PUBMED_TIMEOUT", 5)),
+            ttl_seconds=float(os.getenv("PUBMED_CACHE_TTL", 86400)),
+            max_entries=int(os.getenv("PUBMED_CACHE_ENTRIES", 1024)),
+        )
+
+    async def _get(self, endpoint: str, params: Dict[str, object]) -> dict:
+        params = dict(params, db="pubmed", retmode="json")
+        if self.api_key:
+            params["api_key"] = self.api_key
+        await self.rate_limiter.acquire()
+        self.http_calls += 1
+        response = await self.http_client.get(f"{self.base_url}/{endpoint}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _fetch(self, query: str) -> List[Dict[str, str]]:
+        search = await self._get("esearch.fcgi", {"term": query, "retmax": self.retmax})
+        pubmed_ids = search.get("esearchresult", {}).get("idlist", [])
+        if not pubmed_ids:
+            return []
+
+        summary = (await self._get("esummary.fcgi", {"id": ",".join(pubmed_ids)})).get("result", {})
+        return [
+            {"pmid": pmid, "title": summary.get(pmid, {}).get("title", "No title found")}
+            for pmid in pubmed_ids
+        ]
+
+    async def search(self, query: str) -> List[Dict[str, str]]:
+        """Returns `[{"pmid", "title"}, ...]` for `query`, served from the TTL cache when possible."""
+        entry = self._entries.get(query)
+        if entry is not None and entry[0] > self._clock():
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return entry[1]
+
+        inflight = self._inflight.get(query)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[query] = future
+        try:
+            articles = await self._fetch(query)
+        except asyncio.CancelledError:
+            # Waiters get an ordinary error (their node falls back) rather than a CancelledError
+            # that would escape their own request
+            future.set_exception(RuntimeError(f"PubMed search for '{query}' was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved; waiters re-raise it themselves
+            raise
+        finally:
+            self._inflight.pop(query, None)
+
+        future.set_result(articles)
+        self._entries[query] = (self._clock() + self.ttl_seconds, articles)
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return articles
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "http_calls": self.http_calls,
+            "rate_per_second": round(1.0 / self.rate_limiter.interval, 3),
+        }
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
@@ -0,0 +1,188 @@
+"""
+Cache for expert and final recommendations.
+
+The expert and meta-agent prompts are built only from the cleaned patient data, the risk
+result and the (cached) guideline text, so near-identical profiles can share one set of
+recommendations. Profiles are keyed by a canonical hash of the patient data with numeric
+values bucketed (e.g. BMI to 0.5) plus the predicted risk, a probability band, the model
+key and version, and the explanation mode (the SHAP values are part of the prompts).
+
+Entries live in an in-process LRU with a TTL, optionally backed by a SQLite tier that
+survives restarts and is shared between workers.
+
+Configuration (environment variables):
+    RECOMMENDATION_CACHE_ENTRIES     LRU size, 0 disables the cache (default: 1024)
+    RECOMMENDATION_CACHE_TTL         seconds an entry stays valid (default: 86400)
+    RECOMMENDATION_CACHE_DB          SQLite file for the persistent tier (default: none)
+    RECOMMENDATION_CACHE_BUCKETS     e.g. "BMI=0.5,Glucose=5,BloodPressure=5,Age=1"
+    RECOMMENDATION_CACHE_RISK_BAND   probability band width in percent (default: 5)
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = {"BMI": 0.5, "Glucose": 1.0, "BloodPressure": 1.0, "Age": 1.0}
+
+
+def parse_buckets(spec: str) -> Dict[str, float]:
+    """Parses "BMI=0.5,Glucose=5" into {"BMI": 0.5, "Glucose": 5.0}."""
+    buckets = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, width = part.partition("=")
+        buckets[name.strip()] = float(width)
+    return buckets
+
+
+def _bucket(value, width: Optional[float]):
+    if isinstance(value, str) or value is None:
+        return value
+    value = float(value)
+    if math.isnan(value):
+        return None
+    if not width:
+        return round(value, 6)
+    return round(round(value / width) * width, 6)
+
+
+def profile_key(patient_data: dict, risk_result: dict, buckets: Dict[str, float], risk_band: float,
+                explanation: Optional[str] = None) -> str:
+    """
+    Canonical hash of a bucketed patient profile, its risk band, the model version and the
+    explanation mode. `PatientName` is ignored.
+    """
+    profile = {
+        key: _bucket(value, buckets.get(key))
+        for key, value in sorted(patient_data.items())
+        if key != "PatientName"
+    }
+    try:
+        probability = float(str(risk_result.get("riskProbability", "")).strip().rstrip("%"))
+        band = int(probability // risk_band) if risk_band else probability
+    except ValueError:
+        band = None
+    payload = json.dumps({
+        "profile": profile,
+        "risk": risk_result.get("predictedRisk"),
+        "band": band,
+        "model": risk_result.get("modelUsed"),
+        "modelKey": risk_result.get("modelKey"),
+        "modelVersion": risk_result.get("modelVersion"),
+        "explanation": explanation,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, sqlite_path: Optional[str] = None,
+                 buckets: Optional[Dict[str, float]] = None, risk_band: float = 5.0,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.buckets = DEFAULT_BUCKETS if buckets is None else buckets
+        self.risk_band = risk_band
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if sqlite_path:
+            self._conn = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendation_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "RecommendationCache":
+        buckets_spec = os.getenv("RECOMMENDATION_CACHE_BUCKETS")
+        return cls(
+            max_entries=int(os.getenv("RECOMMENDATION_CACHE_ENTRIES", 1024)),
+            ttl_seconds=float(os.getenv("RECOMMENDATION_CACHE_TTL", 86400)),
+            sqlite_path=os.getenv("RECOMMENDATION_CACHE_DB") or None,
+            buckets=parse_buckets(buckets_spec) if buckets_spec else None,
+            risk_band=float(os.getenv("RECOMMENDATION_CACHE_RISK_BAND", 5)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, patient_data: dict, risk_result: dict, explanation: Optional[str] = None) -> str:
+        return profile_key(patient_data, risk_result, self.buckets, self.risk_band, explanation)
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM recommendation_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    return dict(value)
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: dict) -> None:
+        if not self.enabled:
+            return
+        expires_at = self._clock() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, dict(value))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO recommendation_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+                self._conn.commit()
+
+    def _remember(self, key: str, expires_at: float, value: dict) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM recommendation_cache")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "sqlite": self._conn is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,169 @@
+"""
+Guideline retrieval helpers for the FAISS category indexes.
+
+`get_guideline_evidence` only ever issues two query strings per category, so results are
+cached by (category, query, k). The cache is warmed at startup and invalidated per
+category whenever an index is reloaded; on the common path no embedding call is made.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, int]
+
+
+class GuidelineRetrievalCache:
+    """Thread-safe cache of similarity-search results with hit/miss counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[CacheKey, list] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, category: str, query: str, k: int, vectorstore) -> list:
+        """Returns cached documents for (category, query, k), searching `vectorstore` on a miss."""
+        key = (category, query, k)
+        with self._lock:
+            docs = self._entries.get(key)
+            if docs is not None:
+                self.hits += 1
+                return docs
+            self.misses += 1
+
+        docs = vectorstore.similarity_search(query, k=k)
+        with self._lock:
+            self._entries[key] = docs
+        return docs
+
+    def warm(self, vectorstores: Dict[str, object], queries: Iterable[str], k: int) -> None:
+        """Prefetches every (category, query) pair; failures are logged and left uncached."""
+        queries = list(queries)
+        for category, vectorstore in vectorstores.items():
+            for query in queries:
+                try:
+                    self.get(category, query, k, vectorstore)
+                except Exception as e:
+                    logger.error(f"Failed to warm retrieval cache for {category} / '{query}': {str(e)}")
+        logger.info(f"Retrieval cache warmed with {len(self._entries)} entr(y/ies).")
+
+    def invalidate(self, category: Optional[str] = None) -> None:
+        """Drops cached results for `category`, or everything when no category is given."""
+        with self._lock:
+            if category is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == category]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def keys(self) -> List[CacheKey]:
+        with self._lock:
+            return list(self._entries.keys())
+
+
+async def gather_guideline_evidence(lookup: Callable[[str], str], categories: Iterable[str],
+                                    timeouts: Dict[str, float], fallback: str) -> Dict[str, str]:
+    """
+    Runs `lookup(category)` for every category concurrently in worker threads.
+    A category that exceeds its timeout (or raises) yields `fallback`, so total latency is
+    bounded by the slowest category rather than the sum. Result order follows `categories`.
+    """
+    async def fetch(category: str) -> Tuple[str, str]:
+        start = time.perf_counter()
+        try:
+            evidence = await asyncio.wait_for(asyncio.to_thread(lookup, category), timeouts.get(category))
+            return category, evidence
+        except asyncio.TimeoutError:
+            logger.warning(f"Guideline retrieval for {category} timed out after {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"Guideline retrieval for {category} failed: {str(e)}")
+        return category, fallback
+
+    results = await asyncio.gather(*(fetch(category) for category in categories))
+    return dict(results)
+
+
+class MergedGuidelineIndex:
+    """
+    One FAISS store holding every category, with `metadata["category"]` on each document.
+
+    A single query embedding and one k-NN search (over-fetching `k * fetch_multiplier`)
+    are partitioned into the top-k per category. Categories that come back short are
+    topped up with a filtered search against the same query vector, so no further
+    embedding calls are made. The latest partition is memoized so the per-category
+    lookups of one request share a single search.
+    """
+
+    def __init__(self, vectorstore, embeddings, categories: Iterable[str], fetch_multiplier: int = 4):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.categories = list(categories)
+        self.fetch_multiplier = fetch_multiplier
+        self._lock = threading.Lock()
+        self._memo: Dict[Tuple[str, int], Dict[str, list]] = {}
+        self.searches = 0
+
+    def search_all(self, query: str, k: int) -> Dict[str, list]:
+        with self._lock:
+            cached = self._memo.get((query, k))
+            if cached is not None:
+                return cached
+
+            query_vector = self.embeddings.embed_query(query)
+            fetch_k = k * self.fetch_multiplier * len(self.categories)
+            docs = self.vectorstore.similarity_search_by_vector(query_vector, k=fetch_k)
+            self.searches += 1
+
+            partitioned: Dict[str, list] = {category: [] for category in self.categories}
+            for doc in docs:
+                bucket = partitioned.get(doc.metadata.get("category"))
+                if bucket is not None and len(bucket) < k:
+                    bucket.append(doc)
+
+            for category, bucket in partitioned.items():
+                if len(bucket) < k:
+                    partitioned[category] = self.vectorstore.similarity_search_by_vector(
+                        query_vector, k=k, filter={"category": category},
+                        fetch_k=self.vectorstore.index.ntotal,
+                    )
+
+            self._memo[(query, k)] = partitioned
+            return partitioned
+
+    def view(self, category: str) -> "CategoryView":
+        return CategoryView(self, category)
+
+
+class CategoryView:
+    """Exposes one category of a `MergedGuidelineIndex` through `similarity_search`."""
+
+    def __init__(self, merged: MergedGuidelineIndex, category: str):
+        self.merged = merged
+        self.category = category
+
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        return self.merged.search_all(query, k)[self.category]
+
+
+def merge_category_stores(stores: Dict[str, object]):
+    """
+    Tags every document with its category and merges the stores into the first one.
+    Used by `build_merged_index.py`; the input stores are modified in place.
+    """
+    merged = None
+    for category, store in stores.items():
+        for doc in store.docstore._dict.values():
+            doc.metadata["category"] = category
+        if merged is None:
+            merged = store
+        else:
+            merged.merge_from(store)
+    return merged
@@ -0,0 +1,219 @@
+"""
+Server-side chat sessions.
+
+`/recommendations` stores the patient context (patient data, expert recommendations,
+predicted risk) once, already formatted for the chat prompt, and returns a session id.
+`/chat` can then be called with just the session id and the new `user_input`, so request
+size and prompt-building work no longer grow with the conversation.
+
+Two backends share the same interface:
+    MemorySessionStore  in-process LRU with a sliding TTL (default)
+    SQLiteSessionStore  persistent, shared by every worker pointing at the same file
+
+A chat turn awaits the LLM between reading and extending a session, so turns on one session
+run one at a time per worker (`SessionLocks`), and `update` applies each exchange to the
+latest stored copy atomically, so turns racing in different workers are not lost either.
+The SQLite store purges expired rows when sessions are created, at most once a minute.
+
+Configuration (environment variables):
+    SESSION_STORE        "memory" (default) or "sqlite"
+    SESSION_DB_PATH      SQLite file (default: sessions.db)
+    SESSION_TTL_SECONDS  idle time before a session expires (default: 3600)
+    SESSION_MAX_ENTRIES  sessions kept by the memory store (default: 10000)
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SessionUpdate = Callable[[dict], None]
+
+
+class SessionLocks:
+    """One asyncio lock per session id, dropped once no turn holds or waits for it."""
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def get(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+
+class MemorySessionStore:
+    """LRU of session id -> session dict, each entry expiring `ttl_seconds` after last use."""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600,
+                 clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    def create(self, data: dict) -> str:
+        session_id = uuid.uuid4().hex
+        self.save(session_id, data)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= now:
+                del self._entries[session_id]
+                return None
+            self._entries[session_id] = (now + self.ttl_seconds, data)
+            self._entries.move_to_end(session_id)
+            return data
+
+    def save(self, session_id: str, data: dict) -> None:
+        with self._lock:
+            self._entries[session_id] = (self._clock() + self.ttl_seconds, data)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def update(self, session_id: str, apply: SessionUpdate) -> Optional[dict]:
+        """Applies `apply` to the stored session in place; returns it, or None if it has expired."""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] <= self._clock():
+                return None
+            apply(entry[1])
+            self._entries[session_id] = (self._clock() + self.ttl_seconds, entry[1])
+            self._entries.move_to_end(session_id)
+            return entry[1]
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._entries), "max_entries": self.max_entries,
+                    "ttl_seconds": self.ttl_seconds}
+
+
+class SQLiteSessionStore:
+    """Sessions persisted as JSON rows in SQLite, with the same sliding TTL as the memory store."""
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, clock: Callable[[], float] = time.time,
+                 purge_interval: float = 60.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._clock = clock
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def create(self, data: dict) -> str:
+        if self._clock() >= self._next_purge:
+            self._next_purge = self._clock() + self.purge_interval
+            purged = self.purge_expired()
+            if purged:
+                logger.info(f"Purged {purged} expired chat session(s)")
+        session_id = uuid.uuid4().hex
+        self.save(session_id, data)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[dict]:
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM chat_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE chat_sessions SET expires_at = ? WHERE id = ?", (now + self.ttl_seconds, session_id)
+            )
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def save(self, session_id: str, data: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), self._clock() + self.ttl_seconds),
+            )
+            self._conn.commit()
+
+    def update(self, session_id: str, apply: SessionUpdate) -> Optional[dict]:
+        """
+        Applies `apply` to the latest stored session and writes it back in one write
+        transaction, so concurrent updates from other workers are not overwritten.
+        Returns the updated session, or None if it has expired.
+        """
+        with self._lock:
+            now = self._clock()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT data, expires_at FROM chat_sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+                if row is None or row[1] <= now:
+                    self._conn.rollback()
+                    return None
+                data = json.loads(row[0])
+                apply(data)
+                self._conn.execute(
+                    "UPDATE chat_sessions SET data = ?, expires_at = ? WHERE id = ?",
+                    (json.dumps(data), now + self.ttl_seconds, session_id),
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return data
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM chat_sessions WHERE expires_at <= ?", (self._clock(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+        return {"backend": "sqlite", "sessions": count, "path": self.path, "ttl_seconds": self.ttl_seconds}
+
+
+def build_session_store():
+    """Creates the session store selected by the SESSION_* environment variables."""
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", 3600))
+    if os.getenv("SESSION_STORE", "memory").lower() == "sqlite":
+        path = os.getenv("SESSION_DB_PATH", "sessions.db")
+        logger.info(f"Using SQLite chat session store at {path}")
+        return SQLiteSessionStore(path, ttl_seconds=ttl_seconds)
+    return MemorySessionStore(max_entries=int(os.getenv("SESSION_MAX_ENTRIES", 10000)), ttl_seconds=ttl_seconds)
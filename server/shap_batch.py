@@ -0,0 +1,115 @@
+"""
+Batched class-1 SHAP explanations for cohorts of patients.
+
+`BatchExplainer.explain` splits an encoded patient matrix into chunks of `chunk_rows` and
+hands them to `run_chunk` (in `main.py`, a job in the inference pool that runs the entry's
+cached TreeExplainer), keeping at most `concurrency` chunks in flight. With a process pool
+the chunks run on several cores. Each chunk's values are written straight into one
+preallocated feature x patient float32 array, so memory beyond the input and the result is
+bounded by the chunks in flight, whatever the cohort size.
+
+`columnar_result` turns that array into the compact response used by `/explain/batch` and
+the `explain_batch` MCP action: base64 little-endian float32 by default, or nested lists.
+
+Configuration (environment variables):
+    SHAP_BATCH_CHUNK_ROWS   patients per chunk (default: 2048)
+    SHAP_BATCH_MAX_ROWS     largest accepted batch (default: 100000)
+"""
+import asyncio
+import base64
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ("base64", "json")
+
+ChunkRunner = Callable[[np.ndarray], Awaitable[Tuple[np.ndarray, float]]]
+
+
+class BatchExplainer:
+    def __init__(self, chunk_rows: int = 2048, max_rows: int = 100_000, concurrency: int = 4, metrics=None):
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+        self.chunk_rows = chunk_rows
+        self.max_rows = max_rows
+        self.concurrency = max(1, concurrency)
+        self.metrics = metrics
+
+    @classmethod
+    def from_env(cls, concurrency: int = 4, metrics=None) -> "BatchExplainer":
+        return cls(
+            chunk_rows=int(os.getenv("SHAP_BATCH_CHUNK_ROWS", 2048)),
+            max_rows=int(os.getenv("SHAP_BATCH_MAX_ROWS", 100_000)),
+            concurrency=concurrency,
+            metrics=metrics,
+        )
+
+    async def explain(self, rows: np.ndarray, run_chunk: ChunkRunner) -> Tuple[np.ndarray, Optional[float]]:
+        """
+        Class-1 SHAP values for every row of `rows` as a (n_features, n_rows) float32 array,
+        plus the explainer's base value. `run_chunk(chunk)` returns (chunk rows x features
+        values, base value) for a slice of `rows`.
+        """
+        n_rows, n_features = rows.shape
+        if n_rows > self.max_rows:
+            raise ValueError(f"Batch of {n_rows} patients exceeds the limit of {self.max_rows}")
+
+        start = time.perf_counter()
+        values = np.empty((n_features, n_rows), dtype=np.float32)
+        in_flight = asyncio.Semaphore(self.concurrency)
+
+        async def run(offset: int) -> float:
+            async with in_flight:
+                chunk_values, base_value = await run_chunk(rows[offset:offset + self.chunk_rows])
+            chunk_values = np.asarray(chunk_values)
+            if chunk_values.shape != (min(self.chunk_rows, n_rows - offset), n_features):
+                raise ValueError(f"SHAP chunk at row {offset} has shape {chunk_values.shape}")
+            values[:, offset:offset + len(chunk_values)] = chunk_values.T
+            return base_value
+
+        base_values = await asyncio.gather(*(run(offset) for offset in range(0, n_rows, self.chunk_rows)))
+
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.record("shap_batch", elapsed)
+        logger.info(f"Explained {n_rows} patient(s) in {elapsed:.2f}s ({len(base_values)} chunk(s))")
+        return values, (float(base_values[0]) if base_values else None)
+
+
+def columnar_result(values: np.ndarray, base_value: Optional[float], features: Sequence[str],
+                    encoding: str = "base64") -> Dict[str, object]:
+    """
+    Compact form of a feature x patient SHAP array: `values[i]` holds feature `features[i]`
+    for every patient, in request order. "base64" packs the array as little-endian float32
+    bytes in that (row-major) order; "json" returns one list per feature.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}'. Use one of {ENCODINGS}.")
+    packed: object
+    if encoding == "base64":
+        packed = base64.b64encode(np.ascontiguousarray(values, dtype="<f4").tobytes()).decode("ascii")
+    else:
+        packed = values.tolist()
+    return {
+        "features": list(features),
+        "patients": int(values.shape[1]),
+        "shape": list(values.shape),
+        "dtype": "float32",
+        "encoding": encoding,
+        "baseValue": base_value,
+        "values": packed,
+    }
+
+
+def decode_values(result: Dict[str, object]) -> np.ndarray:
+    """Inverse of `columnar_result`: the (n_features, n_patients) float32 array."""
+    if result["encoding"] == "base64":
+        array = np.frombuffer(base64.b64decode(result["values"]), dtype="<f4")
+        return array.reshape(result["shape"])
+    return np.asarray(result["values"], dtype=np.float32).reshape(result["shape"])
+
@@ -0,0 +1,120 @@
+"""
+SHAP waterfall output for the UI.
+
+`build_waterfall` turns SHAP values into compact structured data (ordered features,
+cumulative offsets, base value) that the UI can draw itself. Server-side PNG rendering
+is opt-in and goes through `ShapPlotRenderer`, which runs matplotlib on one dedicated
+thread (pyplot is global state and not thread-safe) and keeps a size-bounded cache of
+encoded images.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def build_waterfall(shap_values: Dict[str, float], base_value: Optional[float],
+                    feature_values: Dict[str, float]) -> Optional[dict]:
+    """
+    Returns columnar waterfall data with features ordered by absolute contribution.
+    `offsets[i]` is the running total before feature i is applied, starting at `baseValue`.
+    """
+    if not shap_values or base_value is None:
+        return None
+
+    ordered = sorted(shap_values.items(), key=lambda item: abs(item[1]), reverse=True)
+
+    features: List[str] = []
+    values: List[float] = []
+    contributions: List[float] = []
+    offsets: List[float] = []
+    running_total = float(base_value)
+    for feature, contribution in ordered:
+        features.append(feature)
+        value = feature_values.get(feature)
+        values.append(None if value is None or value != value else round(float(value), 4))
+        contributions.append(round(float(contribution), 6))
+        offsets.append(round(running_total, 6))
+        running_total += float(contribution)
+
+    return {
+        "baseValue": round(float(base_value), 6),
+        "finalValue": round(running_total, 6),
+        "features": features,
+        "featureValues": values,
+        "shapValues": contributions,
+        "offsets": offsets,
+    }
+
+
+class ShapPlotRenderer:
+    """Renders waterfall PNGs on a single worker thread with an LRU cache bounded by bytes."""
+
+    def __init__(self, render_fn: Callable[..., Optional[str]], max_cache_bytes: int = 8 * 1024 * 1024,
+                 metrics=None):
+        self._render_fn = render_fn
+        self._max_cache_bytes = max_cache_bytes
+        self._metrics = metrics
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shap-render")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(shap_values: List[float], base_value: float, feature_names: List[str],
+                  feature_values: List[float]) -> str:
+        payload = repr((
+            [round(float(v), 6) for v in shap_values],
+            round(float(base_value), 6),
+            list(feature_names),
+            [round(float(v), 6) for v in feature_values],
+        ))
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def render(self, shap_values: List[float], base_value: float, patient_df) -> Optional[str]:
+        """Returns a base64 PNG, from cache when the same explanation was rendered before."""
+        key = self.cache_key(shap_values, base_value, list(patient_df.columns), patient_df.iloc[0].tolist())
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        image = self._worker.submit(self._render_fn, shap_values, base_value, patient_df).result()
+        if image:
+            self._store(key, image)
+        return image
+
+    def _store(self, key: str, image: str) -> None:
+        size = len(image)
+        if size > self._max_cache_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = image
+            self._cache_bytes += size
+            while self._cache_bytes > self._max_cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": self._cache_bytes,
+                "max_bytes": self._max_cache_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def shutdown(self) -> None:
+        self._worker.shutdown(wait=False)
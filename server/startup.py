@@ -0,0 +1,149 @@
+"""
+Parallel, on-demand startup of the server's heavy components.
+
+Each component (the models, the FAISS indexes, the LLM clients) is a named task that runs
+at most once, on a small thread pool. `start()` launches all of them without blocking;
+`ensure(name)` / `require(name)` wait for one, starting it first if needed. Code paths only
+pay for what they use: the process inference pool, for example, only ever loads the models.
+Heavy libraries (langchain, lightgbm, shap) are imported inside these tasks, not at import.
+
+Configuration (environment variables):
+    STARTUP_SERVE_EARLY   "1" to accept traffic once the early components (the models) are
+                          loaded; endpoints that need the others return 503 until they are
+                          ready (default: off, startup waits for every component)
+    STARTUP_THREADS       threads used to load components in parallel (default: 3)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentUnavailable(RuntimeError):
+    """A request needs a component that is still loading or failed to load."""
+
+    def __init__(self, name: str, state: str, error: Optional[str] = None):
+        self.name = name
+        self.state = state
+        message = f"Component '{name}' " + ("is still loading" if state == "loading" else "failed to load")
+        super().__init__(f"{message}: {error}" if error else message)
+
+
+class StartupOrchestrator:
+    def __init__(self, max_workers: int = 3, serve_early: bool = False,
+                 early_components: Iterable[str] = (), metrics=None):
+        self.max_workers = max_workers
+        self.serve_early = serve_early
+        self.early_components = tuple(early_components)
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Callable[[], Optional[dict]]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._status: Dict[str, dict] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.started_at = time.time()
+
+    @classmethod
+    def from_env(cls, early_components: Iterable[str] = (), metrics=None) -> "StartupOrchestrator":
+        return cls(
+            max_workers=int(os.getenv("STARTUP_THREADS", 3)),
+            serve_early=os.getenv("STARTUP_SERVE_EARLY", "0") == "1",
+            early_components=early_components,
+            metrics=metrics,
+        )
+
+    def add(self, name: str, task: Callable[[], Optional[dict]]) -> None:
+        """Registers a component; `task` may return a dict of details shown in `status()`."""
+        self._tasks[name] = task
+        self._status[name] = {"state": "pending"}
+
+    @property
+    def required(self) -> List[str]:
+        """Components the server needs before it reports ready."""
+        if self.serve_early:
+            return [name for name in self._tasks if name in self.early_components]
+        return list(self._tasks)
+
+    def start(self, *names: str) -> List[Future]:
+        """Starts the given components (default: all) in the background."""
+        return [self._submit(name) for name in (names or self._tasks)]
+
+    def _submit(self, name: str) -> Future:
+        with self._lock:
+            future = self._futures.get(name)
+            if future is None:
+                if name not in self._tasks:
+                    raise ValueError(f"Unknown component '{name}'")
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="startup")
+                future = self._futures[name] = self._pool.submit(self._run, name)
+            return future
+
+    def _run(self, name: str) -> None:
+        status = self._status[name] = {"state": "loading"}
+        start = time.perf_counter()
+        try:
+            details = self._tasks[name]()
+        except Exception as e:
+            status.update(state="failed", error=str(e), seconds=round(time.perf_counter() - start, 3))
+            logger.error(f"Startup component '{name}' failed: {str(e)}")
+            raise
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.record(f"startup_{name}", elapsed)
+        status.update(details or {})
+        status.update(state="ready", seconds=round(elapsed, 3))
+        logger.info(f"Startup component '{name}' ready in {elapsed:.2f}s")
+
+    def is_ready(self, name: str) -> bool:
+        return self._status.get(name, {}).get("state") == "ready"
+
+    def ensure(self, name: str, timeout: Optional[float] = None) -> None:
+        """Blocks until `name` is loaded, loading it now if nobody has started it yet."""
+        if self.is_ready(name):
+            return
+        try:
+            self._submit(name).result(timeout)
+        except Exception as e:
+            raise ComponentUnavailable(name, self._status[name]["state"], str(e)) from e
+
+    async def require(self, name: str) -> None:
+        """
+        Async `ensure`. When serving early, components outside `early_components` that are not
+        ready yet raise `ComponentUnavailable` instead of making the request wait.
+        """
+        if self.is_ready(name):
+            return
+        future = self._submit(name)
+        if self.serve_early and name not in self.early_components and not future.done():
+            raise ComponentUnavailable(name, "loading")
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            raise ComponentUnavailable(name, "failed", str(e)) from e
+
+    async def wait_ready(self) -> None:
+        """Starts every component and waits for the required ones; raises if one fails."""
+        futures = dict(zip(self._tasks, self.start()))
+        for name in self.required:
+            await asyncio.wrap_future(futures[name])
+
+    def ready(self) -> bool:
+        return all(self.is_ready(name) for name in self.required)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "ready": self.ready(),
+            "serve_early": self.serve_early,
+            "uptime": round(time.time() - self.started_at, 1),
+            "components": {name: dict(status) for name, status in self._status.items()},
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -0,0 +1,243 @@
+"""
+Per-request tracing for the prediction and recommendation pipeline.
+
+`tracer.span(name)` times a block and nests it under the current span (tracked with
+`contextvars`, so it follows asyncio tasks, `asyncio.to_thread` and the inference thread
+pool). Every finished span is:
+  * observed in a Prometheus histogram, served by `/metrics`
+  * recorded in `latency_metrics` under the span name (so the MCP action keeps working)
+  * queued for export, without blocking, as OTLP/JSON to a local collector or a JSON-lines file
+
+Configuration (environment variables):
+    TRACE_EXPORT        "none" (default), "jsonl" or "otlp"
+    TRACE_EXPORT_PATH   JSON-lines file for "jsonl" (default: traces.jsonl)
+    TRACE_OTLP_ENDPOINT OTLP/HTTP traces URL (default: http://localhost:4318/v1/traces)
+    TRACE_SAMPLE_RATE   fraction of traces exported, 0.0-1.0 (default: 1.0); histograms see every span
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "sampled", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], kind: str, sampled: bool, attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_payload(spans: List[Span], service_name: str) -> dict:
+    """Wraps spans in an OTLP/JSON `ExportTraceServiceRequest`."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "diabetes-agent"}, "spans": [span.to_otlp() for span in spans]}],
+        }]
+    }
+
+
+class JsonLinesSink:
+    """Appends one OTLP/JSON document per batch to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, payload: dict) -> None:
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OTLPHttpSink:
+    """POSTs OTLP/JSON batches to a collector (e.g. the OpenTelemetry Collector on :4318)."""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def __call__(self, payload: dict) -> None:
+        request = urllib.request.Request(
+            self.endpoint, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class BatchExporter:
+    """Background thread that drains finished spans into `sink` in batches; drops when full."""
+
+    def __init__(self, sink: Callable[[dict], None], service_name: str, max_queue: int = 4096,
+                 batch_size: int = 256, interval: float = 1.0):
+        self.sink = sink
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.exported = 0
+        self._thread = threading.Thread(target=self._worker, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self) -> None:
+        running = True
+        while running:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    running = False
+                    break
+                batch.append(span)
+            if batch:
+                try:
+                    self.sink(otlp_payload(batch, self.service_name))
+                    self.exported += len(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.warning(f"Trace export failed ({len(batch)} span(s) dropped): {str(e)}")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, service_name: str = "diabetes-prediction-agent", exporter: Optional[BatchExporter] = None,
+                 sample_rate: float = 1.0, histograms=None, metrics=None):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.histograms = histograms
+        self.metrics = metrics
+
+    @classmethod
+    def from_env(cls, histograms=None, metrics=None) -> "Tracer":
+        service_name = os.getenv("TRACE_SERVICE_NAME", "diabetes-prediction-agent")
+        mode = os.getenv("TRACE_EXPORT", "none").lower()
+        exporter = None
+        if mode == "jsonl":
+            exporter = BatchExporter(JsonLinesSink(os.getenv("TRACE_EXPORT_PATH", "traces.jsonl")), service_name)
+        elif mode == "otlp":
+            endpoint = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+            exporter = BatchExporter(OTLPHttpSink(endpoint), service_name)
+        elif mode != "none":
+            raise ValueError(f"Unknown TRACE_EXPORT '{mode}'. Use 'none', 'jsonl' or 'otlp'.")
+        if exporter is not None:
+            logger.info(f"Exporting traces via {mode}")
+        return cls(service_name, exporter, float(os.getenv("TRACE_SAMPLE_RATE", 1.0)), histograms, metrics)
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(self, name: str, kind: str = "internal", **attributes) -> Span:
+        """Starts a span under the current one without making it current (for generators)."""
+        parent = _current_span.get()
+        sampled = parent.sampled if parent else random.random() < self.sample_rate
+        return Span(name, parent, kind, sampled, attributes)
+
+    def end_span(self, span: Span, error: Optional[str] = None) -> None:
+        span.end_ns = time.time_ns()
+        if error:
+            span.error = error
+        duration = span.duration
+        if self.histograms is not None:
+            self.histograms.observe(span.name, duration)
+        if self.metrics is not None:
+            self.metrics.record(span.name, duration)
+        if self.exporter is not None and span.sampled:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        span = self.start_span(name, kind, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span, error)
+
+    def stats(self) -> Dict[str, object]:
+        exporter = self.exporter
+        return {
+            "export": type(exporter.sink).__name__ if exporter else None,
+            "sample_rate": self.sample_rate,
+            "exported": exporter.exported if exporter else 0,
+            "dropped": exporter.dropped if exporter else 0,
+        }
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
@@ -0,0 +1,38 @@
+import logging
+
+from server.access_log import AccessLog, patient_ref, redact
+
+
+def test_redact_replaces_phi_fields_at_any_depth():
+    body = {'PatientName': 'Alice', 'Glucose': 140, 'patients': [{'PatientName': 'Bob', 'BMI': 31.0}]}
+
+    assert redact(body) == {
+        'PatientName': '[redacted]', 'Glucose': 140,
+        'patients': [{'PatientName': '[redacted]', 'BMI': 31.0}],
+    }
+    assert body['PatientName'] == 'Alice'
+
+
+def test_access_line_is_compact_and_redacted():
+    access_log = AccessLog(log_bodies=True)
+    line = access_log.format_line('POST', '/predict', 200, 12.345, 'abc123', b'{"PatientName": "Alice", "BMI": 31}')
+
+    assert line == 'POST /predict 200 12.3ms trace=abc123 body={"PatientName":"[redacted]","BMI":31}'
+    assert '\n' not in line
+
+
+def test_sampling_keeps_errors_and_slow_requests(caplog):
+    access_log = AccessLog(logger=logging.getLogger('test-access'), sample_rate=0.0, slow_ms=1000)
+
+    with caplog.at_level(logging.INFO, logger='test-access'):
+        access_log.record('GET', '/metrics', 200, 3.0)
+        access_log.record('POST', '/predict', 500, 3.0)
+        access_log.record('POST', '/recommendations', 200, 2500.0)
+
+    assert [record.getMessage().split(' ')[1] for record in caplog.records] == ['/predict', '/recommendations']
+
+
+def test_patient_ref_is_stable_and_hides_the_name():
+    assert patient_ref('Alice') == patient_ref('Alice') != patient_ref('Bob')
+    assert 'Alice' not in patient_ref('Alice')
+    assert patient_ref('') == 'patient:anonymous'
@@ -0,0 +1,78 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+ensemble = pytest.importorskip('sklearn.ensemble')
+preprocessing = pytest.importorskip('sklearn.preprocessing')
+
+from server.compiled_trees import (  # noqa: E402
+    CompiledForest, compile_model, exported_path, load_or_compile, probe_rows, verify,
+)
+
+
+def training_data(n_rows=600, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, 5))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=n_rows) > 0).astype(int)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0.0
+    return X, y
+
+
+def test_random_forest_probabilities_are_identical():
+    X, y = training_data()
+    forest = ensemble.RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+    compiled = compile_model(forest)
+
+    rows = np.vstack([X, probe_rows(compiled, 500)])
+    assert np.array_equal(compiled.predict_proba(rows), forest.predict_proba(rows))
+    assert np.array_equal(compiled.predict(rows), forest.predict(rows))
+
+
+def test_sampler_pipeline_is_unwrapped_but_transformers_are_not():
+    imblearn_pipeline = pytest.importorskip('imblearn.pipeline')
+    over_sampling = pytest.importorskip('imblearn.over_sampling')
+    X, y = training_data()
+    X = np.nan_to_num(X)
+
+    pipeline = imblearn_pipeline.Pipeline([
+        ('smote', over_sampling.SMOTE(random_state=0)),
+        ('clf', ensemble.RandomForestClassifier(n_estimators=10, random_state=0)),
+    ]).fit(X, y)
+    verify(compile_model(pipeline), pipeline, X)
+
+    scaled = imblearn_pipeline.Pipeline([
+        ('scale', preprocessing.StandardScaler()),
+        ('clf', ensemble.RandomForestClassifier(n_estimators=10, random_state=0)),
+    ]).fit(X, y)
+    with pytest.raises(ValueError):
+        compile_model(scaled)
+
+
+@pytest.mark.parametrize('zero_as_missing', [False, True])
+def test_lightgbm_probabilities_are_identical(zero_as_missing):
+    lightgbm = pytest.importorskip('lightgbm')
+    X, y = training_data()
+    model = lightgbm.LGBMClassifier(n_estimators=30, zero_as_missing=zero_as_missing, verbose=-1).fit(X, y)
+    compiled = compile_model(model)
+
+    rows = np.vstack([X, probe_rows(compiled, 500)])
+    assert np.array_equal(compiled.predict_proba(rows), model.predict_proba(rows))
+    assert np.array_equal(compiled.predict(rows), model.predict(rows))
+
+
+def test_export_is_reused_only_for_the_same_version(tmp_path):
+    X, y = training_data()
+    forest = ensemble.RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    source = str(tmp_path / 'forest.pkl')
+
+    compile_model(forest, version='v1').save(exported_path(source))
+    loaded = CompiledForest.load(exported_path(source))
+    assert loaded.version == 'v1'
+    assert np.array_equal(loaded.predict_proba(X), forest.predict_proba(X))
+
+    assert load_or_compile(forest, source, 'v1').version == 'v1'
+    assert load_or_compile(forest, source, 'v2').version == 'v2'
+
+    other = ensemble.RandomForestClassifier(n_estimators=5, random_state=1).fit(X, y)
+    with pytest.raises(ValueError):
+        verify(loaded, other, X)
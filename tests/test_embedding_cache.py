@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('langchain_core')
+
+from server.embedding_cache import CachedEmbeddings, DeterministicEmbeddings
+
+
+class CountingEmbeddings(DeterministicEmbeddings):
+    def __init__(self):
+        super().__init__(dim=8)
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def test_query_embeddings_survive_restart(tmp_path):
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, cache_dir=str(tmp_path), model_name='stub', max_entries=4)
+    first = cache.embed_query('diabetes treatment guidelines diabetes')
+    assert cache.embed_query('diabetes treatment guidelines diabetes') == first
+    assert inner.calls == 1
+
+    reopened = CachedEmbeddings(inner, cache_dir=str(tmp_path), model_name='stub', max_entries=4)
+    assert reopened.embed_query('diabetes treatment guidelines diabetes') == pytest.approx(first)
+    assert inner.calls == 1
+    assert reopened.stats()['disk_entries'] == 1
+
+
+def test_disk_cap_reuses_oldest_slot(tmp_path):
+    cache = CachedEmbeddings(CountingEmbeddings(), cache_dir=str(tmp_path), model_name='stub',
+                             max_entries=2, memory_entries=1)
+    cache.embed_documents(['a', 'b', 'c'])
+    assert cache.stats()['disk_entries'] == 2
+
+
+def test_workers_sharing_a_directory_see_each_others_vectors(tmp_path):
+    inner = CountingEmbeddings()
+    worker_a = CachedEmbeddings(inner, cache_dir=str(tmp_path), model_name='stub', max_entries=4)
+    worker_b = CachedEmbeddings(inner, cache_dir=str(tmp_path), model_name='stub', max_entries=4)
+
+    first = worker_a.embed_query('insulin')
+    assert worker_b.embed_query('insulin') == pytest.approx(first)
+    second = worker_b.embed_query('metformin')
+    assert worker_a.embed_query('metformin') == pytest.approx(second)
+    assert inner.calls == 2
+    assert worker_a.stats()['disk_entries'] == worker_b.stats()['disk_entries'] == 2
+
+
+def test_slot_key_hash_rejects_an_out_of_date_index(tmp_path):
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, cache_dir=str(tmp_path), model_name='stub', max_entries=4)
+    cache.embed_query('a')
+    cache.embed_query('b')
+
+    index_path = tmp_path / 'index.json'
+    index = json.loads(index_path.read_text())
+    keys = list(index['slots'])
+    index['slots'] = {keys[0]: index['slots'][keys[1]], keys[1]: index['slots'][keys[0]]}
+    index_path.write_text(json.dumps(index))
+
+    reopened = CachedEmbeddings(inner, cache_dir=str(tmp_path), model_name='stub', max_entries=4)
+    assert reopened.embed_query('a') == pytest.approx(DeterministicEmbeddings(dim=8).embed_query('a'))
+    assert inner.calls == 3
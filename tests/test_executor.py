@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+
+from server.executor import ExecutorSaturatedError, InferenceExecutor
+from server.metrics import LatencyMetrics
+
+
+def test_run_returns_result_and_records_stage_timings():
+    metrics = LatencyMetrics()
+    executor = InferenceExecutor(max_workers=1, max_pending=2, metrics=metrics)
+    try:
+        result = asyncio.run(executor.run('predict', lambda a, b=0: a + b, 2, b=3))
+    finally:
+        executor.shutdown()
+    assert result == 5
+    snapshot = metrics.snapshot()
+    assert snapshot['predict_run']['count'] == 1
+    assert snapshot['predict_queue_wait']['count'] == 1
+
+
+def test_run_rejects_when_saturated():
+    executor = InferenceExecutor(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(executor.run('predict', release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run('predict', lambda: None)
+        release.set()
+        await blocked
+        assert executor.pending == 0
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_cancelled_caller_keeps_its_slot_until_the_job_finishes():
+    executor = InferenceExecutor(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(executor.run('predict', release.wait))
+        await asyncio.sleep(0.05)
+        blocked.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await blocked
+        # The job is still running in the pool, so it still counts against max_pending
+        assert executor.pending == 1
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run('predict', lambda: None)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+    assert executor.pending == 0
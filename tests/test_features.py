@@ -0,0 +1,81 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+preprocessing = pytest.importorskip('sklearn.preprocessing')
+
+from server.features import FeatureEncoder  # noqa: E402
+
+NUMERICAL = ['Glucose', 'BMI', 'Age', 'BloodPressure']
+MODES = {'Ethnicity': 3, 'Gender': 1}
+
+
+def pandas_reference(patient, order, scaler, apply_scaling):
+    """The previous DataFrame preparation from `predict_diabetes_risk`."""
+    df = pd.DataFrame([patient])
+    if 'Glucose_BMI_Ratio' in order:
+        df['Glucose_BMI_Ratio'] = df['Glucose'] / (df['BMI'] + 1e-6)
+    df = df.reindex(columns=order, fill_value=0.0)
+    provided = df.notna().sum(axis=1).iloc[0]
+    scaled = [feature for feature in order if feature in NUMERICAL]
+    if apply_scaling:
+        df[scaled] = scaler.transform(df[scaled])
+    for feature, default in MODES.items():
+        df[feature] = df[feature].fillna(default).astype(int)
+    return df.to_numpy(dtype=np.float64), provided
+
+
+@pytest.mark.parametrize('order', [
+    ['Glucose', 'BMI', 'Age', 'Ethnicity', 'BloodPressure', 'Gender'],
+    ['Gender', 'Age', 'Glucose', 'BMI', 'Glucose_BMI_Ratio', 'BloodPressure', 'Ethnicity'],
+])
+@pytest.mark.parametrize('apply_scaling', [False, True])
+def test_encoder_matches_pandas_path(order, apply_scaling):
+    rng = np.random.default_rng(0)
+    scaled = [feature for feature in order if feature in NUMERICAL]
+    scaler = preprocessing.StandardScaler().fit(pd.DataFrame(rng.normal(100, 20, (50, len(scaled))), columns=scaled))
+    encoder = FeatureEncoder(order, NUMERICAL, MODES, scaler)
+
+    patients = [
+        {'Glucose': 148.0, 'BMI': 33.6, 'Age': 50.0, 'BloodPressure': 72.0, 'Gender': 1.0, 'Ethnicity': 2.0},
+        {'Glucose': 89.0, 'BMI': np.nan, 'Age': 21.0, 'BloodPressure': np.nan, 'Gender': np.nan, 'Ethnicity': 0.0},
+        {'Glucose': 120.0, 'BMI': 25.0, 'Age': 40.0},
+    ]
+    for patient in patients:
+        expected, expected_provided = pandas_reference(patient, order, scaler, apply_scaling)
+        row, provided = encoder.encode(patient)
+        if apply_scaling:
+            encoder.scale(row)
+        np.testing.assert_array_equal(row, expected)
+        assert provided == expected_provided
+
+
+def test_to_frame_copies_and_keeps_integer_categoricals():
+    encoder = FeatureEncoder(['Glucose', 'Gender'], ['Glucose'], {'Gender': 1})
+    row, _ = encoder.encode({'Glucose': 100.0, 'Gender': np.nan})
+    frame = encoder.to_frame(row)
+    encoder.encode({'Glucose': 50.0, 'Gender': 0.0})
+
+    assert frame['Glucose'].iloc[0] == 100.0
+    assert frame['Gender'].dtype.kind == 'i' and frame['Gender'].iloc[0] == 1
+
+
+def test_encode_matrix_matches_row_by_row_encoding():
+    order = ['Gender', 'Age', 'Glucose', 'BMI', 'Glucose_BMI_Ratio', 'BloodPressure', 'Ethnicity']
+    encoder = FeatureEncoder(order, NUMERICAL, MODES)
+    columns = ['Glucose', 'BMI', 'Age', 'Gender', 'Ethnicity']
+    matrix = [
+        [148.0, 33.6, 50.0, 1.0, 2.0],
+        [89.0, None, 21.0, None, 0.0],
+        [120.0, 25.0, None, 1.9, None],
+    ]
+
+    rows = encoder.encode_matrix(columns, matrix)
+    for row, values in zip(rows, matrix):
+        expected, _ = encoder.encode({c: np.nan if v is None else v for c, v in zip(columns, values)})
+        np.testing.assert_array_equal(row, expected[0])
+
+    with pytest.raises(ValueError):
+        encoder.encode_matrix(['Glucose', 'Insulin'], [[1.0, 2.0]])
+    with pytest.raises(ValueError):
+        encoder.encode_matrix(['Glucose', 'BMI'], [[1.0]])
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# main.py imports its siblings as top-level modules (as under uvicorn in server/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+joblib = pytest.importorskip('joblib')
+pytest.importorskip('lightgbm')
+ensemble = pytest.importorskip('sklearn.ensemble')
+preprocessing = pytest.importorskip('sklearn.preprocessing')
+main = pytest.importorskip('main')
+
+
+def training_frame(n_rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'Glucose': rng.normal(120, 30, n_rows),
+        'BMI': rng.normal(30, 6, n_rows),
+        'Age': rng.integers(21, 80, n_rows).astype(float),
+        'Ethnicity': rng.integers(1, 5, n_rows).astype(float),
+        'BloodPressure': rng.normal(72, 12, n_rows),
+        'Gender': rng.integers(0, 2, n_rows).astype(float),
+    })[main.all_features]
+    outcome = ((frame['Glucose'] - 120) / 30 + (frame['BMI'] - 30) / 6 + rng.normal(0, 1, n_rows) > 0).astype(int)
+    return frame, outcome
+
+
+@pytest.fixture(scope='module')
+def models(tmp_path_factory):
+    """Small LightGBM (trained on scaled values) and Random Forest artifacts, loaded by `init_models`."""
+    import lightgbm
+
+    directory = tmp_path_factory.mktemp('artifacts')
+    frame, outcome = training_frame()
+    scaler = preprocessing.StandardScaler().fit(frame[main.numerical_features])
+    scaled = frame.copy()
+    scaled[main.numerical_features] = scaler.transform(frame[main.numerical_features])
+    artifacts = {
+        'lgbm_model_path': lightgbm.LGBMClassifier(n_estimators=20, verbose=-1).fit(scaled, outcome),
+        'tuned_rf_model_path': ensemble.RandomForestClassifier(n_estimators=10, random_state=0).fit(frame, outcome),
+        'scaler_path': scaler,
+    }
+
+    patch = pytest.MonkeyPatch()
+    for name, artifact in artifacts.items():
+        path = str(directory / f'{name}.pkl')
+        joblib.dump(artifact, path)
+        patch.setattr(main, name, path)
+    patch.setattr(main, 'model_artifact_dir', str(directory))
+    main.startup.ensure('models')
+    yield directory
+    patch.undo()
+
+
+def test_reload_rejects_unknown_model_keys(models):
+    keys = main.model_registry.keys()
+    with pytest.raises(ValueError):
+        asyncio.run(main.reload_model('nosuch', {'path': 'lgbm_model_path.pkl'}, wait=True))
+    assert main.model_registry.keys() == keys
+
+
+def test_process_pool_requires_a_shared_model_state_file(tmp_path):
+    import subprocess
+
+    env = {key: value for key, value in os.environ.items() if key != 'MODEL_STATE_PATH'}
+    env['INFERENCE_EXECUTOR'] = 'process'
+    server_dir = os.path.dirname(os.path.abspath(main.__file__))
+    refused = subprocess.run([sys.executable, '-c', 'import main'], cwd=server_dir, env=env,
+                             capture_output=True, text=True)
+    assert refused.returncode != 0
+    assert 'MODEL_STATE_PATH' in refused.stderr
+
+    env['MODEL_STATE_PATH'] = str(tmp_path / 'model_state.json')
+    started = subprocess.run([sys.executable, '-c', 'import main'], cwd=server_dir, env=env,
+                             capture_output=True, text=True)
+    assert started.returncode == 0, started.stderr
+
+
+def test_pubmed_queries_use_bands_not_exact_values():
+    query = main.build_pubmed_query({'Glucose': 148.0, 'BMI': 33.6})
+    assert query == 'diabetes treatment hyperglycemia obesity'
+    assert main.build_pubmed_query({'Glucose': 151.0, 'BMI': 31.2}) == query
+    assert main.build_pubmed_query({'Glucose': 110.0, 'BMI': 26.0}) == 'diabetes treatment prediabetes overweight'
+    assert main.build_pubmed_query({'Glucose': np.nan, 'BMI': None}) == 'diabetes treatment'
+
+
+def test_pubmed_search_terms_are_not_logged_at_info(monkeypatch, caplog):
+    import logging
+
+    async def search(query):
+        return [{'title': 'Metformin in obesity'}]
+
+    monkeypatch.setattr(main.pubmed_client, 'search', search)
+    with caplog.at_level(logging.INFO):
+        assert asyncio.run(main.get_biomedical_evidence({'Glucose': 148.0, 'BMI': 33.6})) == ['Metformin in obesity']
+    messages = ' '.join(record.getMessage() for record in caplog.records)
+    assert 'PubMed' in messages
+    assert 'hyperglycemia' not in messages and 'obesity' not in messages
+
+
+def random_patients(n_rows, seed=1):
+    """Patient dicts as the endpoints build them, with blanks (NaN) so both routes are used."""
+    frame, _ = training_frame(n_rows, seed)
+    rng = np.random.default_rng(seed)
+    blanks = rng.random(frame.shape) < 0.35
+    return [
+        {feature: (np.nan if blank else float(value)) for feature, value, blank in zip(frame.columns, row, mask)}
+        for row, mask in zip(frame.to_numpy(), blanks)
+    ]
+
+
+def test_batch_predictions_match_single_predictions(models):
+    main.model_registry.set_default(None)
+    patients = random_patients(200)
+    keys = [None, None, None, 'lightgbm', 'random_forest'] * 40
+
+    batch = main.predict_diabetes_risk_batch(patients, keys)
+    single = [main.predict_diabetes_risk(patient, explanation='none', model=key) for patient, key in zip(patients, keys)]
+
+    fields = ('predictedRisk', 'riskProbability', 'modelUsed', 'modelKey', 'modelVersion')
+    assert [{field: result[field] for field in fields} for result in batch] == \
+        [{field: result[field] for field in fields} for result in single]
+    # Routing by feature count sent rows to both models, not only the explicit keys
+    routed = {result['modelKey'] for result, key in zip(batch, keys) if key is None}
+    assert routed == {'lightgbm', 'random_forest'}
+
+
+def test_predict_batch_endpoint_keeps_request_order(models):
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    assert client.post('/predict/batch', json=[]).json() == []
+
+    patients = [
+        {'PatientName': 'A', 'Glucose': 150, 'BMI': 31.0, 'Age': '', 'BloodPressure': '', 'Gender': '', 'Ethnicity': ''},
+        {'PatientName': 'B', 'Glucose': 90, 'BMI': 22.0, 'Age': 30, 'BloodPressure': 70, 'Gender': 1, 'Ethnicity': 3},
+        {'PatientName': 'C', 'Glucose': 120, 'BMI': 28.0, 'Age': 45, 'model': 'lightgbm'},
+    ]
+    results = client.post('/predict/batch', json=patients).json()
+    assert [result['PatientName'] for result in results] == ['A', 'B', 'C']
+    assert [result['modelKey'] for result in results] == ['lightgbm', 'random_forest', 'lightgbm']
+
+
+def test_concurrent_chat_turns_on_one_session_keep_every_exchange(monkeypatch):
+    prompts = []
+
+    class SlowChain:
+        async def arun(self, **inputs):
+            prompts.append(inputs['history'])
+            await asyncio.sleep(0.01)
+            return f"reply to {inputs['user_input']}"
+
+    async def ready(*names):
+        return None
+
+    monkeypatch.setattr(main, 'require_components', ready)
+    monkeypatch.setattr(main, 'chat_chain', SlowChain())
+    monkeypatch.setattr(main, 'chat_prompt', SimpleNamespace(format=lambda **inputs: inputs['user_input']))
+    session_id = main.chat_sessions.create({
+        'patient_data': '', 'recommendations': '', 'risk_probability': '', 'predicted_risk': '',
+        'history': [], 'history_text': ''
+    })
+
+    async def turns():
+        requests = [main.ChatRequest(user_input=f'question {i}', session_id=session_id) for i in range(3)]
+        return await asyncio.gather(*(main.chat(request) for request in requests))
+
+    responses = asyncio.run(turns())
+    assert sorted(response['historyLength'] for response in responses) == [2, 4, 6]
+    history = main.chat_sessions.get(session_id)['history']
+    assert [message['content'] for message in history[::2]] == ['question 0', 'question 1', 'question 2']
+    assert history[1]['content'] == 'reply to question 0'
+    # Each turn's prompt already holds the exchanges before it
+    assert 'reply to question 1' in prompts[2] and 'reply to question 0' in prompts[2]
@@ -0,0 +1,21 @@
+from server.metrics import LatencyMetrics
+
+
+def test_record_aggregates_stage():
+    metrics = LatencyMetrics()
+    metrics.record('shap_values', 0.010)
+    metrics.record('shap_values', 0.030)
+    stats = metrics.snapshot()['shap_values']
+    assert stats['count'] == 2
+    assert stats['total_ms'] == 40.0
+    assert stats['avg_ms'] == 20.0
+    assert stats['max_ms'] == 30.0
+
+
+def test_timer_records_on_exit():
+    metrics = LatencyMetrics()
+    with metrics.timer('model_inference'):
+        pass
+    assert metrics.snapshot()['model_inference']['count'] == 1
+    metrics.reset()
+    assert metrics.snapshot() == {}
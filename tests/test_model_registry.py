@@ -0,0 +1,146 @@
+import pytest
+
+from server.model_registry import ModelEntry, ModelRegistry, ModelReloader
+
+
+def registry(state_path=None):
+    models = ModelRegistry(state_path=state_path)
+    models.register(ModelEntry('lightgbm', 'LightGBM', object(), scaler=object()))
+    models.register(ModelEntry('random_forest', 'Tuned Random Forest', object()))
+    return models
+
+
+def test_resolve_prefers_request_then_default():
+    models = registry()
+    assert models.resolve() is None
+    assert models.resolve('random_forest').display_name == 'Tuned Random Forest'
+
+    models.set_default('lightgbm')
+    assert models.resolve().key == 'lightgbm'
+    assert models.resolve('random_forest').key == 'random_forest'
+
+    models.set_default(None)
+    assert models.resolve() is None
+
+
+def test_unknown_keys_are_rejected():
+    models = registry()
+    with pytest.raises(ValueError):
+        models.resolve('unknown')
+    with pytest.raises(ValueError):
+        models.set_default('unknown')
+    assert models.default is None
+
+
+def test_resolved_entry_survives_replacement():
+    models = registry()
+    entry = models.resolve('lightgbm')
+    previous = models.register(ModelEntry('lightgbm', 'LightGBM', object(), version='2'))
+
+    assert previous is entry
+    assert entry.version == '1'
+    assert models.resolve('lightgbm').version == '2'
+    assert models.stats()['models']['lightgbm']['version'] == '2'
+
+
+def test_default_is_shared_through_state_file(tmp_path):
+    state_path = str(tmp_path / 'model_state.json')
+    worker_a, worker_b = registry(state_path), registry(state_path)
+
+    worker_a.set_default('random_forest')
+    assert worker_b.default == 'random_forest'
+
+    worker_b.set_default(None)
+    assert worker_a.default is None
+
+
+def test_rollback_swaps_with_replaced_entry():
+    models = registry()
+    with pytest.raises(ValueError):
+        models.rollback('random_forest')
+
+    models.register(ModelEntry('random_forest', 'Tuned Random Forest', object(), version='2'))
+    assert models.rollback('random_forest').version == '1'
+    assert models.get('random_forest').version == '1'
+    assert models.rollback('random_forest').version == '2'
+
+
+def reloader(models, fail_warm=False):
+    def load(key, spec):
+        return ModelEntry(key, spec.get('name') or key, object(), version=spec['version'], source=spec['path'])
+
+    def warm(entry):
+        if fail_warm:
+            raise ValueError('dry run failed')
+
+    return ModelReloader(models, load, warm)
+
+
+def test_reload_swaps_only_after_warm_up():
+    models = registry()
+    in_flight = models.resolve('lightgbm')
+
+    entry = reloader(models).submit('lightgbm', {'path': 'v2.pkl', 'version': '2'}).result()
+    assert models.get('lightgbm') is entry
+    assert in_flight.version == '1'
+
+    failing = reloader(models, fail_warm=True)
+    with pytest.raises(ValueError):
+        failing.submit('lightgbm', {'path': 'v3.pkl', 'version': '3'}).result()
+    assert models.get('lightgbm').version == '2'
+    assert failing.status()['lightgbm']['state'] == 'failed'
+
+
+def test_reloads_and_rollbacks_propagate_through_state_file(tmp_path):
+    state_path = str(tmp_path / 'model_state.json')
+    worker_a, worker_b = registry(state_path), registry(state_path)
+    reloader_a, reloader_b = reloader(worker_a), reloader(worker_b)
+
+    reloader_a.submit('lightgbm', {'path': 'v2.pkl', 'version': '2'}).result()
+    worker_b.default
+    reloader_b.shutdown(wait=True)
+    assert worker_b.get('lightgbm').version == '2'
+
+    reloader_a.rollback('lightgbm')
+    worker_b.default
+    assert worker_b.get('lightgbm').version == '1'
+
+
+def test_new_worker_loads_published_versions(tmp_path):
+    state_path = str(tmp_path / 'model_state.json')
+    worker_a = registry(state_path)
+    reloader(worker_a).submit('lightgbm', {'path': 'v2.pkl', 'version': '2'}).result()
+
+    late_worker = registry(state_path)
+    reloader(late_worker).shutdown(wait=True)
+    assert late_worker.get('lightgbm').version == '2'
+
+
+def test_explicit_key_requests_pick_up_published_reloads(tmp_path):
+    state_path = str(tmp_path / 'model_state.json')
+    worker_a, worker_b = registry(state_path), registry(state_path)
+    reloader_a, reloader_b = reloader(worker_a), reloader(worker_b)
+
+    reloader_a.submit('lightgbm', {'path': 'v2.pkl', 'version': '2'}).result()
+    worker_b.resolve('lightgbm')
+    reloader_b.shutdown(wait=True)
+    assert worker_b.resolve('lightgbm').version == '2'
+
+    reloader_a.rollback('lightgbm')
+    assert worker_b.get('lightgbm').version == '1'
+
+
+def test_ensure_loads_other_versions_privately():
+    models = registry()
+    worker = reloader(models)
+    loads = []
+    load = worker.load
+    worker.load = lambda key, spec: loads.append(spec['version']) or load(key, spec)
+    spec = {'path': 'v2.pkl', 'version': '2', 'name': 'LightGBM'}
+
+    assert worker.ensure('lightgbm', spec).version == '2'
+    assert worker.ensure('lightgbm', spec).version == '2'
+    assert loads == ['2']
+    # What the worker serves is unchanged
+    assert models.get('lightgbm').version == '1'
+    assert worker.ensure('lightgbm', models.get('lightgbm').spec()) is models.get('lightgbm')
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from server.pipeline import CircuitBreaker, PipelineScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def answer(value, delay=0.0):
+    async def call():
+        await asyncio.sleep(delay)
+        return value
+    return call
+
+
+def test_slow_node_is_replaced_by_fallback_within_the_deadline():
+    scheduler = PipelineScheduler(deadline_seconds=0.2, default_timeout=5)
+
+    async def scenario():
+        deadline = scheduler.deadline()
+        calls = {'fast': answer('fast'), 'slow': answer('slow', delay=5)}
+        fallbacks = {'fast': lambda: 'unused', 'slow': lambda: 'degraded'}
+        return [result async for result in scheduler.iter_nodes(calls, fallbacks, deadline)]
+
+    start = time.perf_counter()
+    results = asyncio.run(scenario())
+    elapsed = time.perf_counter() - start
+
+    assert [(r.node, r.value, r.status) for r in results] == [('fast', 'fast', 'ok'), ('slow', 'degraded', 'timeout')]
+    assert elapsed < 1.0
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial call while half-open
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_open_breaker_skips_the_call():
+    scheduler = PipelineScheduler(deadline_seconds=10, failure_threshold=1)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise RuntimeError('boom')
+
+    async def scenario():
+        first = await scheduler.run_node('expert', call, lambda: 'degraded', scheduler.deadline())
+        second = await scheduler.run_node('expert', call, lambda: 'degraded', scheduler.deadline())
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (first.status, second.status) == ('error', 'open')
+    assert second.value == 'degraded' and len(calls) == 1
+    assert scheduler.stats()['outcomes']['expert'] == {'error': 1, 'open': 1}
+
+
+def test_stream_node_truncates_midway_and_falls_back_when_empty():
+    scheduler = PipelineScheduler(deadline_seconds=10, default_timeout=0.1)
+
+    async def partial():
+        yield 'a'
+        await asyncio.sleep(5)
+        yield 'b'
+
+    async def empty():
+        await asyncio.sleep(5)
+        yield 'never'
+
+    async def collect(stream):
+        return [r async for r in scheduler.stream_node('meta', stream, lambda: 'degraded', scheduler.deadline())]
+
+    partial_results = asyncio.run(collect(partial))
+    assert partial_results[0].value == 'a' and not partial_results[0].degraded
+    assert partial_results[-1].status == 'timeout' and 'truncated' in partial_results[-1].value
+
+    empty_results = asyncio.run(collect(empty))
+    assert [(r.value, r.status) for r in empty_results] == [('degraded', 'timeout')]
+
+
+def test_cancelled_trial_call_does_not_keep_the_breaker_open():
+    clock = FakeClock()
+    scheduler = PipelineScheduler(deadline_seconds=10, failure_threshold=1, reset_seconds=30, clock=clock)
+    breaker = scheduler.breaker('meta')
+    breaker.record_failure()
+    clock.now += 30
+
+    async def cancelled_trial():
+        task = asyncio.ensure_future(
+            scheduler.run_node('meta', answer('late', delay=5), lambda: 'degraded', scheduler.deadline())
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def abandoned_stream_trial():
+        async def stream():
+            yield 'a'
+            yield 'b'
+
+        results = scheduler.stream_node('meta', stream, lambda: 'degraded', scheduler.deadline())
+        assert (await results.__anext__()).value == 'a'
+        await results.aclose()
+
+    asyncio.run(cancelled_trial())
+    assert breaker.state == 'half_open' and breaker.allow()
+    breaker.release_trial()
+
+    asyncio.run(abandoned_stream_trial())
+    assert breaker.allow()
+    breaker.release_trial()
+
+    result = asyncio.run(scheduler.run_node('meta', answer('ok'), lambda: 'degraded', scheduler.deadline()))
+    assert result.status == 'ok' and breaker.state == 'closed'
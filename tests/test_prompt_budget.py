@@ -0,0 +1,62 @@
+import asyncio
+
+from server.prompt_budget import HistoryCompactor
+
+
+def make_history(turns):
+    history = []
+    for i in range(turns):
+        history.append({'role': 'user', 'content': f'question {i}'})
+        history.append({'role': 'assistant', 'content': f'answer {i}'})
+    return history
+
+
+def test_short_history_is_not_summarized():
+    async def summarize(previous, messages):
+        raise AssertionError('should not summarize')
+
+    compactor = HistoryCompactor(summarize, keep_messages=4)
+    compacted = asyncio.run(compactor.compact(make_history(2)))
+    assert compacted.summary is None
+    assert len(compacted.recent) == 4
+
+
+def test_summary_is_cached_and_rolled_forward():
+    calls = []
+
+    async def summarize(previous, messages):
+        calls.append((previous, [m['content'] for m in messages]))
+        return f'{previous}|' + ','.join(m['content'] for m in messages)
+
+    compactor = HistoryCompactor(summarize, keep_messages=4, token_counter=len)
+
+    first = asyncio.run(compactor.compact(make_history(3)))
+    assert first.summary == '|question 0,answer 0'
+    assert [m['content'] for m in first.recent] == ['question 1', 'answer 1', 'question 2', 'answer 2']
+
+    asyncio.run(compactor.compact(make_history(3)))
+    assert len(calls) == 1
+
+    second = asyncio.run(compactor.compact(make_history(4)))
+    assert calls[-1] == ('|question 0,answer 0', ['question 1', 'answer 1'])
+    assert second.summary == '|question 0,answer 0|question 1,answer 1'
+    assert second.compacted_tokens < second.history_tokens
+
+
+def test_failed_summary_falls_back_to_the_recent_window_and_is_not_cached():
+    calls = []
+
+    async def summarize(previous, messages):
+        calls.append(len(messages))
+        if len(calls) == 1:
+            raise TimeoutError('rate limited')
+        return 'summary'
+
+    compactor = HistoryCompactor(summarize, keep_messages=4, token_counter=len)
+    failed = asyncio.run(compactor.compact(make_history(3)))
+    assert failed.summary is None
+    assert [m['content'] for m in failed.recent] == ['question 1', 'answer 1', 'question 2', 'answer 2']
+
+    retried = asyncio.run(compactor.compact(make_history(3)))
+    assert retried.summary == 'summary'
+    assert calls == [2, 2]
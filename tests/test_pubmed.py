@@ -0,0 +1,103 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip('httpx')
+
+from server.pubmed import PubMedClient  # noqa: E402
+
+
+class StubEutils(BaseHTTPRequestHandler):
+    calls = []
+    delay = 0.0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.calls.append((url.path, params))
+        if url.path.endswith('esearch.fcgi'):
+            body = {'esearchresult': {'idlist': ['101', '102', '103']}}
+        else:
+            body = {'result': {pmid: {'title': f'Article {pmid}'} for pmid in params['id'].split(',')}}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubEutils.calls = []
+    StubEutils.delay = 0.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubEutils)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def test_one_esummary_call_for_all_ids_and_cached_repeats(stub_url):
+    client = PubMedClient(base_url=stub_url, rate_per_second=100)
+
+    async def scenario():
+        try:
+            first = await client.search('diabetes treatment')
+            second = await client.search('diabetes treatment')
+            return first, second
+        finally:
+            await client.aclose()
+
+    first, second = asyncio.run(scenario())
+
+    assert [article['title'] for article in first] == ['Article 101', 'Article 102', 'Article 103']
+    assert second == first
+    assert [path.rsplit('/', 1)[-1] for path, _ in StubEutils.calls] == ['esearch.fcgi', 'esummary.fcgi']
+    assert StubEutils.calls[1][1]['id'] == '101,102,103'
+    assert client.stats()['hits'] == 1
+
+
+def test_concurrent_requests_share_one_fetch(stub_url):
+    client = PubMedClient(base_url=stub_url, rate_per_second=100)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(client.search('diabetes BMI 31') for _ in range(5)))
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(scenario())
+
+    assert all(result == results[0] for result in results)
+    assert client.stats()['http_calls'] == 2
+
+
+
+def test_cancelled_owner_fails_concurrent_waiters_with_an_ordinary_error(stub_url):
+    StubEutils.delay = 1.0
+    client = PubMedClient(base_url=stub_url, rate_per_second=100)
+
+    async def scenario():
+        try:
+            owner = asyncio.ensure_future(client.search('metformin'))
+            await asyncio.sleep(0.05)
+            waiter = asyncio.ensure_future(client.search('metformin'))
+            await asyncio.sleep(0.05)
+            owner.cancel()  # what a node timeout does to the request that started the fetch
+            return await asyncio.gather(owner, waiter, return_exceptions=True)
+        finally:
+            await client.aclose()
+
+    owner_outcome, waiter_outcome = asyncio.run(scenario())
+    assert isinstance(owner_outcome, asyncio.CancelledError)
+    assert isinstance(waiter_outcome, RuntimeError)
@@ -0,0 +1,76 @@
+from server.recommendation_cache import RecommendationCache, parse_buckets
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+PATIENT = {'PatientName': 'A', 'Gender': 'Female', 'Age': 54.0, 'BMI': 31.2, 'Glucose': 140.0}
+RISK = {'predictedRisk': 'Diabetes', 'riskProbability': '72.40%', 'modelUsed': 'LightGBM'}
+RESPONSE = {'endocrinologistRecommendation': 'e', 'finalRecommendation': 'f'}
+
+
+def test_bucketed_profiles_share_a_key_and_name_is_ignored():
+    cache = RecommendationCache(buckets={'BMI': 0.5}, risk_band=5)
+    key = cache.key(PATIENT, RISK)
+
+    assert cache.key(dict(PATIENT, BMI=31.1, PatientName='B'), dict(RISK, riskProbability='71.0%')) == key
+    assert cache.key(dict(PATIENT, BMI=31.8), RISK) != key
+    assert cache.key(dict(PATIENT, Glucose=141.0), RISK) != key
+    assert cache.key(PATIENT, dict(RISK, riskProbability='76.0%')) != key
+    assert cache.key(PATIENT, dict(RISK, predictedRisk='No Diabetes')) != key
+
+
+def test_ttl_and_lru_eviction():
+    clock = FakeClock()
+    cache = RecommendationCache(max_entries=2, ttl_seconds=60, clock=clock)
+    cache.set('a', RESPONSE)
+    cache.set('b', RESPONSE)
+    assert cache.get('a') == RESPONSE
+    cache.set('c', RESPONSE)
+
+    assert cache.get('b') is None
+    clock.now += 61
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_returned_entries_are_copies():
+    cache = RecommendationCache()
+    cache.set('a', RESPONSE)
+    cache.get('a')['sessionId'] = 'x'
+
+    assert 'sessionId' not in cache.get('a')
+
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / 'recommendations.db')
+    RecommendationCache(sqlite_path=path).set('a', RESPONSE)
+
+    assert RecommendationCache(sqlite_path=path).get('a') == RESPONSE
+
+
+def test_disabled_cache_stores_nothing():
+    cache = RecommendationCache(max_entries=0)
+    cache.set('a', RESPONSE)
+
+    assert cache.get('a') is None
+
+
+def test_parse_buckets():
+    assert parse_buckets('BMI=0.5, Glucose=5') == {'BMI': 0.5, 'Glucose': 5.0}
+
+
+def test_key_covers_model_version_and_explanation_mode():
+    cache = RecommendationCache()
+    risk = dict(RISK, modelKey='lightgbm', modelVersion='1')
+    key = cache.key(PATIENT, risk, 'values')
+
+    assert cache.key(PATIENT, risk, 'values') == key
+    assert cache.key(PATIENT, risk, 'none') != key
+    assert cache.key(PATIENT, dict(risk, modelVersion='2'), 'values') != key
+    assert cache.key(PATIENT, dict(risk, modelKey='random_forest'), 'values') != key
@@ -0,0 +1,105 @@
+from server.retrieval import GuidelineRetrievalCache
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.calls = 0
+
+    def similarity_search(self, query, k=4):
+        self.calls += 1
+        return [f'{query} #{i}' for i in range(k)]
+
+
+def test_cache_hits_after_warm_without_new_searches():
+    store = FakeVectorStore()
+    cache = GuidelineRetrievalCache()
+    cache.warm({'Dietitian': store}, ['q diabetes', 'q no diabetes'], 3)
+    assert store.calls == 2
+
+    docs = cache.get('Dietitian', 'q diabetes', 3, store)
+    assert docs == ['q diabetes #0', 'q diabetes #1', 'q diabetes #2']
+    assert store.calls == 2
+    assert cache.stats() == {'entries': 2, 'hits': 1, 'misses': 2}
+
+
+def test_invalidate_only_drops_category():
+    cache = GuidelineRetrievalCache()
+    cache.get('Dietitian', 'q', 3, FakeVectorStore())
+    cache.get('Exercise', 'q', 3, FakeVectorStore())
+    cache.invalidate('Dietitian')
+    assert cache.keys() == [('Exercise', 'q', 3)]
+
+
+def test_gather_runs_concurrently_and_falls_back_on_timeout():
+    import asyncio
+    import time
+
+    from server.retrieval import gather_guideline_evidence
+
+    def lookup(category):
+        time.sleep(0.5 if category == 'Exercise' else 0.1)
+        return f'{category} guidelines'
+
+    async def scenario():
+        start = time.perf_counter()
+        evidence = await gather_guideline_evidence(
+            lookup,
+            ['Endocrinology', 'Dietitian', 'Exercise'],
+            {'Endocrinology': 1, 'Dietitian': 1, 'Exercise': 0.2},
+            'fallback',
+        )
+        return evidence, time.perf_counter() - start
+
+    evidence, elapsed = asyncio.run(scenario())
+
+    assert list(evidence) == ['Endocrinology', 'Dietitian', 'Exercise']
+    assert evidence['Dietitian'] == 'Dietitian guidelines'
+    assert evidence['Exercise'] == 'fallback'
+    assert elapsed < 0.3
+
+
+class FakeDoc:
+    def __init__(self, text, category):
+        self.page_content = text
+        self.metadata = {'category': category}
+
+
+class FakeMergedStore:
+    def __init__(self, docs):
+        self.docs = docs
+        self.vector_searches = 0
+        self.index = type('Index', (), {'ntotal': len(docs)})()
+
+    def similarity_search_by_vector(self, vector, k=4, filter=None, fetch_k=20):
+        self.vector_searches += 1
+        docs = [d for d in self.docs if not filter or d.metadata['category'] == filter['category']]
+        return docs[:k]
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [0.0]
+
+
+def test_merged_index_partitions_one_search_across_categories():
+    from server.retrieval import MergedGuidelineIndex
+
+    docs = [FakeDoc(f'endo {i}', 'Endocrinology') for i in range(3)]
+    docs += [FakeDoc(f'diet {i}', 'Dietitian') for i in range(3)]
+    docs += [FakeDoc('exercise 0', 'Exercise')]
+    store, embeddings = FakeMergedStore(docs), FakeEmbeddings()
+    merged = MergedGuidelineIndex(store, embeddings, ['Endocrinology', 'Dietitian', 'Exercise'])
+
+    endo = merged.view('Endocrinology').similarity_search('q', k=2)
+    diet = merged.view('Dietitian').similarity_search('q', k=2)
+    exercise = merged.view('Exercise').similarity_search('q', k=2)
+
+    assert [d.page_content for d in endo] == ['endo 0', 'endo 1']
+    assert [d.page_content for d in diet] == ['diet 0', 'diet 1']
+    assert [d.page_content for d in exercise] == ['exercise 0']
+    assert embeddings.calls == 1
+    assert merged.searches == 1
@@ -0,0 +1,92 @@
+import asyncio
+import gc
+
+import pytest
+
+from server.sessions import MemorySessionStore, SessionLocks, SQLiteSessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store_and_clock(request, tmp_path):
+    clock = FakeClock()
+    if request.param == 'memory':
+        return MemorySessionStore(max_entries=10, ttl_seconds=60, clock=clock), clock
+    return SQLiteSessionStore(str(tmp_path / 'sessions.db'), ttl_seconds=60, clock=clock), clock
+
+
+def test_session_round_trip_and_sliding_ttl(store_and_clock):
+    store, clock = store_and_clock
+    session_id = store.create({'history': [], 'predicted_risk': 'Diabetes'})
+
+    session = store.get(session_id)
+    session['history'].append({'role': 'user', 'content': 'Hi'})
+    store.save(session_id, session)
+
+    clock.now += 50
+    assert store.get(session_id)['history'] == [{'role': 'user', 'content': 'Hi'}]
+    clock.now += 50
+    assert store.get(session_id) is not None
+    clock.now += 61
+    assert store.get(session_id) is None
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemorySessionStore(max_entries=2, ttl_seconds=60)
+    first = store.create({'n': 1})
+    second = store.create({'n': 2})
+    store.get(first)
+    store.create({'n': 3})
+    assert store.get(second) is None
+    assert store.get(first) == {'n': 1}
+
+
+def test_update_applies_to_the_latest_stored_copy(store_and_clock):
+    store, clock = store_and_clock
+    session_id = store.create({'history': []})
+
+    store.update(session_id, lambda session: session['history'].append('first'))
+    updated = store.update(session_id, lambda session: session['history'].append('second'))
+    assert updated['history'] == ['first', 'second']
+    assert store.get(session_id)['history'] == ['first', 'second']
+
+    clock.now += 61
+    assert store.update(session_id, lambda session: session['history'].append('late')) is None
+
+
+def test_sqlite_store_purges_expired_sessions_on_create(tmp_path):
+    clock = FakeClock()
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), ttl_seconds=60, clock=clock, purge_interval=30)
+    store.create({'n': 1})
+    clock.now += 61
+    store.create({'n': 2})
+    assert store.stats()['sessions'] == 1
+
+
+def test_session_locks_are_shared_per_session_and_released():
+    locks = SessionLocks()
+    assert locks.get('a') is locks.get('a')
+    assert locks.get('a') is not locks.get('b')
+
+    async def turns():
+        order = []
+
+        async def turn(name):
+            async with locks.get('a'):
+                order.append(f'{name} start')
+                await asyncio.sleep(0.01)
+                order.append(f'{name} end')
+
+        await asyncio.gather(turn('one'), turn('two'))
+        return order
+
+    assert asyncio.run(turns()) == ['one start', 'one end', 'two start', 'two end']
+    gc.collect()
+    assert len(locks._locks) == 0
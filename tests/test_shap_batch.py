@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from server.explainers import class1_shap_values  # noqa: E402
+from server.shap_batch import BatchExplainer, columnar_result, decode_values  # noqa: E402
+
+
+def test_chunks_are_bounded_and_reassembled_in_order():
+    rows = np.arange(23 * 3, dtype=np.float64).reshape(23, 3)
+    running, peak, sizes = 0, 0, []
+
+    async def run_chunk(chunk):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        sizes.append(len(chunk))
+        await asyncio.sleep(0.01)
+        running -= 1
+        return chunk * 2, 0.5
+
+    values, base_value = asyncio.run(BatchExplainer(chunk_rows=5, concurrency=2).explain(rows, run_chunk))
+
+    assert values.dtype == np.float32 and values.shape == (3, 23)
+    np.testing.assert_array_equal(values, (rows * 2).T)
+    assert base_value == 0.5
+    assert sorted(sizes) == [3, 5, 5, 5, 5]
+    assert peak == 2
+
+
+def test_oversized_batches_are_rejected():
+    async def run_chunk(chunk):
+        raise AssertionError('should not run')
+
+    with pytest.raises(ValueError):
+        asyncio.run(BatchExplainer(max_rows=10).explain(np.zeros((11, 2)), run_chunk))
+
+
+@pytest.mark.parametrize('encoding', ['base64', 'json'])
+def test_columnar_result_round_trips(encoding):
+    values = np.array([[0.25, -1.5, 3.0], [1e-3, 0.0, -2.0]], dtype=np.float32)
+    result = columnar_result(values, 0.1, ['Glucose', 'BMI'], encoding)
+
+    assert result['shape'] == [2, 3] and result['patients'] == 3
+    np.testing.assert_array_equal(decode_values(result), values)
+
+
+class FakeExplainer:
+    def __init__(self, values, expected_value):
+        self.values = values
+        self.expected_value = expected_value
+
+    def shap_values(self, X):
+        return self.values
+
+
+def test_class1_values_from_every_binary_output_shape():
+    class1 = np.array([[1.0, 2.0], [3.0, 4.0]])
+    explainers = [
+        FakeExplainer([-class1, class1], [0.7, 0.3]),
+        FakeExplainer(np.stack([-class1, class1], axis=2), np.array([0.7, 0.3])),
+        FakeExplainer(class1, 0.3),
+    ]
+    for explainer in explainers:
+        values, base_value = class1_shap_values(explainer, None)
+        np.testing.assert_array_equal(values, class1)
+        assert base_value == 0.3
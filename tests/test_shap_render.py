@@ -0,0 +1,24 @@
+from server.shap_render import ShapPlotRenderer, build_waterfall
+
+
+def test_build_waterfall_orders_by_contribution_with_offsets():
+    waterfall = build_waterfall(
+        {'Glucose': 0.3, 'BMI': -0.1, 'Age': 0.05},
+        0.2,
+        {'Glucose': 148.0, 'BMI': 33.6, 'Age': 50.0},
+    )
+    assert waterfall['features'] == ['Glucose', 'BMI', 'Age']
+    assert waterfall['featureValues'] == [148.0, 33.6, 50.0]
+    assert waterfall['offsets'] == [0.2, 0.5, 0.4]
+    assert waterfall['finalValue'] == 0.45
+    assert waterfall['baseValue'] == 0.2
+
+
+def test_build_waterfall_without_values():
+    assert build_waterfall({}, None, {}) is None
+
+
+def test_cache_key_is_stable_for_identical_explanations():
+    key = ShapPlotRenderer.cache_key([0.1, -0.2], 0.5, ['Glucose', 'BMI'], [100.0, 20.0])
+    assert key == ShapPlotRenderer.cache_key([0.1, -0.2], 0.5, ['Glucose', 'BMI'], [100.0, 20.0])
+    assert key != ShapPlotRenderer.cache_key([0.1, -0.2], 0.5, ['Glucose', 'BMI'], [101.0, 20.0])
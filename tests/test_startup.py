@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+
+from server.startup import ComponentUnavailable, StartupOrchestrator
+
+
+def test_components_load_once_and_in_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+    calls = []
+
+    def task(name):
+        def run():
+            calls.append(name)
+            barrier.wait()  # both tasks must be running at the same time
+            return {'loaded': name}
+        return run
+
+    startup = StartupOrchestrator(max_workers=2)
+    startup.add('models', task('models'))
+    startup.add('faiss', task('faiss'))
+
+    asyncio.run(startup.wait_ready())
+    startup.ensure('models')
+
+    assert sorted(calls) == ['faiss', 'models']
+    status = startup.status()
+    assert status['ready']
+    assert status['components']['models']['state'] == 'ready'
+    assert status['components']['faiss']['loaded'] == 'faiss'
+
+
+def test_ensure_loads_on_demand_and_reports_failures():
+    startup = StartupOrchestrator()
+    startup.add('models', lambda: None)
+    startup.add('llm', lambda: 1 / 0)
+
+    startup.ensure('models')
+    assert startup.is_ready('models')
+    assert startup.status()['components']['llm']['state'] == 'pending'
+
+    with pytest.raises(ComponentUnavailable):
+        startup.ensure('llm')
+    assert startup.status()['components']['llm']['state'] == 'failed'
+    assert not startup.ready()
+
+
+def test_serve_early_rejects_components_still_loading():
+    release = threading.Event()
+
+    def load_llm():
+        release.wait(5)
+
+    startup = StartupOrchestrator(serve_early=True, early_components=('models',))
+    startup.add('models', lambda: None)
+    startup.add('llm', load_llm)
+
+    async def scenario():
+        await startup.wait_ready()
+        assert startup.ready()
+        await startup.require('models')
+        with pytest.raises(ComponentUnavailable, match='still loading'):
+            await startup.require('llm')
+        release.set()
+        startup.ensure('llm')
+        await startup.require('llm')
+
+    asyncio.run(scenario())
+    startup.shutdown()
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+from server.metrics import Histograms, LatencyMetrics
+from server.tracing import BatchExporter, JsonLinesSink, Tracer
+
+
+def test_spans_nest_across_tasks_and_threads():
+    tracer = Tracer()
+
+    async def scenario():
+        with tracer.span('request') as root:
+            async def child():
+                with tracer.span('task') as span:
+                    return span
+
+            task_span = await asyncio.create_task(child())
+
+            def in_thread():
+                with tracer.span('thread') as span:
+                    return span
+
+            thread_span = await asyncio.to_thread(in_thread)
+        return root, task_span, thread_span
+
+    root, task_span, thread_span = asyncio.run(scenario())
+
+    assert root.parent_id is None
+    assert task_span.parent_id == root.span_id and thread_span.parent_id == root.span_id
+    assert task_span.trace_id == root.trace_id == thread_span.trace_id
+    assert Tracer.current() is None
+
+
+def test_spans_feed_histograms_metrics_and_record_errors():
+    histograms = Histograms('span_seconds', 'Span durations.', buckets=(0.5, 1.0))
+    metrics = LatencyMetrics()
+    tracer = Tracer(histograms=histograms, metrics=metrics)
+
+    with tracer.span('model_inference'):
+        pass
+    try:
+        with tracer.span('shap_values') as failed:
+            raise RuntimeError('boom')
+    except RuntimeError:
+        pass
+
+    text = histograms.render()
+    assert '# TYPE span_seconds histogram' in text
+    assert 'span_seconds_bucket{span="model_inference",le="0.5"} 1' in text
+    assert 'span_seconds_count{span="shap_values"} 1' in text
+    assert metrics.snapshot()['model_inference']['count'] == 1
+    assert failed.error == 'RuntimeError: boom'
+
+
+def test_jsonl_export_is_otlp_json(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    exporter = BatchExporter(JsonLinesSink(str(path)), 'test-service', interval=0.05)
+    tracer = Tracer(exporter=exporter)
+
+    with tracer.span('request', kind='server', route='/predict'):
+        with tracer.span('feature_prep'):
+            pass
+    tracer.shutdown()
+
+    spans = [
+        span
+        for line in path.read_text().splitlines()
+        for resource in json.loads(line)['resourceSpans']
+        for scope in resource['scopeSpans']
+        for span in scope['spans']
+    ]
+    by_name = {span['name']: span for span in spans}
+    assert by_name['feature_prep']['parentSpanId'] == by_name['request']['spanId']
+    assert by_name['request']['kind'] == 2
+    assert {'key': 'route', 'value': {'stringValue': '/predict'}} in by_name['request']['attributes']
+    assert exporter.exported == 2
+
+
+def test_unsampled_traces_are_not_exported(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer(exporter=BatchExporter(JsonLinesSink(str(path)), 'test-service', interval=0.05), sample_rate=0.0)
+    with tracer.span('request'):
+        pass
+    tracer.shutdown()
+
+    assert not path.exists()
@@ -1,16 +1,94 @@
 import React from "react";
 
+const ROW_HEIGHT = 28;
+const LABEL_WIDTH = 170;
+const CHART_WIDTH = 420;
+const PADDING = 12;
+
+const formatValue = (value) =>
+  value === null || value === undefined ? "" : ` = ${value}`;
+
+const WaterfallSvg = ({ waterfall }) => {
+  const { baseValue, finalValue, features, featureValues, shapValues, offsets } =
+    waterfall;
+
+  const ends = offsets.map((offset, i) => offset + shapValues[i]);
+  const min = Math.min(baseValue, finalValue, ...offsets, ...ends);
+  const max = Math.max(baseValue, finalValue, ...offsets, ...ends);
+  const span = max - min || 1;
+  const x = (value) => LABEL_WIDTH + ((value - min) / span) * CHART_WIDTH;
+  const height = features.length * ROW_HEIGHT + 2 * ROW_HEIGHT;
+
+  return (
+    <svg
+      width="100%"
+      viewBox={`0 0 ${LABEL_WIDTH + CHART_WIDTH + 2 * PADDING + 60} ${height}`}
+      role="img"
+      aria-label="SHAP Visualization"
+    >
+      {features.map((feature, i) => {
+        const start = offsets[i];
+        const end = ends[i];
+        const y = i * ROW_HEIGHT + PADDING;
+        const positive = shapValues[i] >= 0;
+        return (
+          <g key={feature}>
+            <text x={LABEL_WIDTH - 8} y={y + 16} fontSize="12" textAnchor="end">
+              {`${feature}${formatValue(featureValues[i])}`}
+            </text>
+            <rect
+              x={x(Math.min(start, end))}
+              y={y + 4}
+              width={Math.max(Math.abs(x(end) - x(start)), 1)}
+              height={ROW_HEIGHT - 8}
+              fill={positive ? "#ff0051" : "#008bfb"}
+            />
+            <text
+              x={x(Math.max(start, end)) + 4}
+              y={y + 16}
+              fontSize="11"
+            >
+              {`${positive ? "+" : ""}${shapValues[i].toFixed(3)}`}
+            </text>
+          </g>
+        );
+      })}
+      <line
+        x1={x(baseValue)}
+        x2={x(baseValue)}
+        y1={PADDING}
+        y2={features.length * ROW_HEIGHT + PADDING}
+        stroke="#888"
+        strokeDasharray="3 3"
+      />
+      <text
+        x={LABEL_WIDTH}
+        y={features.length * ROW_HEIGHT + PADDING + 20}
+        fontSize="12"
+      >
+        {`E[f(x)] = ${baseValue.toFixed(3)}   f(x) = ${finalValue.toFixed(3)}`}
+      </text>
+    </svg>
+  );
+};
+
 const ShapWaterfallChart = ({ shapResponse }) => {
-  const { shapPlot } = shapResponse;
+  const { shapPlot, shapWaterfall } = shapResponse;
 
   return (
     <div style={{ width: "100%", margin: "0 auto" }}>
       <p>SHAP Chart Explaining your probability calculation</p>
-      <img
-        width={"100%"}
-        src={`data:image/png;base64,${shapPlot}`}
-        alt="SHAP Visualization"
-      />
+      {shapWaterfall ? (
+        <WaterfallSvg waterfall={shapWaterfall} />
+      ) : (
+        shapPlot && (
+          <img
+            width={"100%"}
+            src={`data:image/png;base64,${shapPlot}`}
+            alt="SHAP Visualization"
+          />
+        )
+      )}
     </div>
   );
 };